@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Offline stand-in for pyrogram.Client.
+
+Implements the subset of the client and update objects the handlers use
+(get_me, get_chat_members, get_chat_history, set_chat_title, set_chat_photo,
+send_message, download_media, Message.delete/reply_text, InlineQuery.answer)
+plus add_handler() and a dispatcher that follows pyrogram's group/propagation
+rules, so handlers registered through handlers.registry can be driven by
+synthetic updates without a Telegram account.
+
+Users, chats, messages and inline queries subclass the real pyrogram types:
+pyrogram's filters check update types with isinstance (filters.group,
+filters.chat, ...), so duck-typed stand-ins would silently match nothing.
+
+Every API call sleeps for a configurable latency and may raise FloodWait
+with a configurable probability.
+"""
+
+import asyncio
+import io
+import itertools
+import logging
+import random
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pyrogram
+from pyrogram.enums import ChatMemberStatus, ChatType, MessageServiceType
+from pyrogram.errors import FloodWait
+from pyrogram.handlers import InlineQueryHandler, MessageHandler
+from pyrogram.types import Chat, InlineQuery, Message, User
+
+logger = logging.getLogger(__name__)
+
+_ids = itertools.count(1)
+
+
+class FakeUser(User):
+    def __init__(self, user_id: int, username: str | None = None, first_name: str = "User",
+                 last_name: str | None = None, is_bot: bool = False, is_deleted: bool = False):
+        super().__init__(id=user_id, username=username, first_name=first_name, last_name=last_name,
+                         is_bot=is_bot, is_deleted=is_deleted)
+
+
+class FakeChat(Chat):
+    def __init__(self, chat_id: int, title: str = "Chat", chat_type: ChatType = ChatType.SUPERGROUP):
+        super().__init__(id=chat_id, type=chat_type, title=title)
+
+
+class FakeChatMember:
+    def __init__(self, user: FakeUser, status: ChatMemberStatus = ChatMemberStatus.MEMBER):
+        self.user = user
+        self.status = status
+
+
+class FakeFile:
+    """Photo/Document/Sticker stand-in (only the fields handlers look at)"""
+
+    def __init__(self, width: int = 1280, height: int = 1280, mime_type: str | None = None,
+                 is_animated: bool = False, is_video: bool = False, thumbs: list | None = None,
+                 file_size: int | None = None):
+        self.file_id = f"file-{next(_ids)}"
+        self.file_unique_id = f"uniq-{self.file_id}"
+        self.width = width
+        self.height = height
+        self.mime_type = mime_type
+        self.is_animated = is_animated
+        self.is_video = is_video
+        self.thumbs = thumbs or []
+        self.file_size = file_size if file_size is not None else width * height // 8
+
+
+class FakeMessage(Message):
+    def __init__(self, client: "FakeClient", chat: FakeChat, from_user: FakeUser | None = None,
+                 text: str | None = None, caption: str | None = None, service=None,
+                 new_chat_title: str | None = None, photo: FakeFile | None = None,
+                 document: FakeFile | None = None, sticker: FakeFile | None = None,
+                 reply_to_message: "FakeMessage | None" = None):
+        super().__init__(
+            client=client,
+            id=next(_ids),
+            chat=chat,
+            from_user=from_user,
+            text=text,
+            caption=caption,
+            service=service,
+            new_chat_title=new_chat_title,
+            photo=photo,
+            document=document,
+            sticker=sticker,
+            reply_to_message=reply_to_message,
+            reply_to_message_id=reply_to_message.id if reply_to_message else None,
+        )
+        self.deleted = False
+
+    async def delete(self, revoke: bool = True):
+        await self._client._api_call("delete_messages")
+        self.deleted = True
+        return True
+
+    async def reply_text(self, text: str, **kwargs):
+        return await self._client.send_message(self.chat.id, text, reply_to_message_id=self.id, **kwargs)
+
+    reply = reply_text
+
+    def continue_propagation(self):
+        raise pyrogram.ContinuePropagation
+
+    def stop_propagation(self):
+        raise pyrogram.StopPropagation
+
+
+class FakeInlineQuery(InlineQuery):
+    def __init__(self, client: "FakeClient", from_user: FakeUser, query: str = ""):
+        super().__init__(client=client, id=str(next(_ids)), from_user=from_user, query=query,
+                         offset="", chat_type=None)
+        self.answers: list = []
+
+    async def answer(self, results, cache_time: int = 300, is_personal: bool = False, **kwargs):
+        await self._client._api_call("answer_inline_query")
+        self.answers.append((results, cache_time, is_personal))
+        return True
+
+    def continue_propagation(self):
+        raise pyrogram.ContinuePropagation
+
+    def stop_propagation(self):
+        raise pyrogram.StopPropagation
+
+
+class FakeClient:
+    """
+    Minimal offline pyrogram.Client replacement.
+
+    Args:
+        latency: mean seconds per API call
+        jitter: +- fraction of latency applied uniformly
+        flood_rate: probability that an API call raises FloodWait
+        flood_wait: FloodWait.value in seconds for injected errors
+        seed: RNG seed for reproducible runs
+        member_cap: max members one get_chat_members query returns, like
+                    Telegram's server-side cap (0 = unlimited)
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.5, flood_rate: float = 0.0,
+                 flood_wait: int = 0, seed: int = 0, member_cap: int = 10000):
+        self.latency = latency
+        self.member_cap = member_cap
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.rng = random.Random(seed)
+
+        self.me = FakeUser(next(_ids), username="bench_bot", first_name="Bench", is_bot=False)
+        self.is_connected = True
+        self.loop = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        self.groups: dict[int, list] = defaultdict(list)
+        self.chats: dict[int, FakeChat] = {}
+        self.members: dict[int, list[FakeChatMember]] = {}
+        self.history: dict[int, list[FakeMessage]] = defaultdict(list)
+        self.calls: Counter = Counter()
+        self.floods: Counter = Counter()
+        self.sent: list[tuple[int, str]] = []
+
+    # --- API subset -------------------------------------------------------
+
+    async def _api_call(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            spread = self.latency * self.jitter
+            await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-spread, spread)))
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.floods[method] += 1
+            raise FloodWait(value=self.flood_wait)
+
+    async def get_me(self):
+        await self._api_call("get_me")
+        return self.me
+
+    async def get_chat_members(self, chat_id: int, query: str = "", limit: int = 0, filter=None):
+        await self._api_call("get_chat_members")
+        members = self.members.get(chat_id, [])
+        if query:
+            query = query.lower()
+            members = [m for m in members if (m.user.first_name or "").lower().startswith(query)
+                       or (m.user.username or "").lower().startswith(query)]
+        if self.member_cap:
+            members = members[:self.member_cap]
+        if limit:
+            members = members[:limit]
+        # Telegram returns members in pages of 200
+        for offset in range(0, len(members), 200):
+            if offset:
+                await self._api_call("get_chat_members")
+            for member in members[offset:offset + 200]:
+                yield member
+
+    async def get_chat_member(self, chat_id: int, user_id):
+        await self._api_call("get_chat_member")
+        if user_id in ("me", "self"):
+            user_id = self.me.id
+        for member in self.members.get(chat_id, []):
+            if member.user.id == user_id:
+                return member
+        raise ValueError(f"User {user_id} is not a member of chat {chat_id}")
+
+    async def get_chat_history(self, chat_id: int, limit: int = 0, offset_id: int = 0):
+        await self._api_call("get_chat_history")
+        messages = [m for m in reversed(self.history[chat_id]) if not offset_id or m.id < offset_id]
+        for message in messages[:limit or None]:
+            yield message
+
+    async def set_chat_title(self, chat_id: int, title: str):
+        await self._api_call("set_chat_title")
+        chat = self.chats[chat_id]
+        chat.title = title
+        self._add_history(FakeMessage(self, chat, self.me, service=MessageServiceType.NEW_CHAT_TITLE,
+                                      new_chat_title=title))
+        return True
+
+    async def set_chat_photo(self, chat_id: int, photo: str | None = None, **kwargs):
+        await self._api_call("set_chat_photo")
+        self._add_history(FakeMessage(self, self.chats[chat_id], self.me, service=MessageServiceType.NEW_CHAT_PHOTO))
+        return True
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await self._api_call("send_message")
+        self.sent.append((chat_id, text))
+        message = FakeMessage(self, self.chats[chat_id], self.me, text=text)
+        self._add_history(message)
+        return message
+
+    async def download_media(self, file_id, file_name: str | None = None, **kwargs):
+        await self._api_call("download_media")
+        with open(file_name, "wb") as f:
+            f.write(_image_bytes(file_name))
+        return file_name
+
+    def _add_history(self, message: FakeMessage):
+        self.history[message.chat.id].append(message)
+        # Handlers only ever look at the latest messages
+        if len(self.history[message.chat.id]) > 1000:
+            del self.history[message.chat.id][:500]
+
+    # --- Kurigram listener hooks used by MessageHandler.check -------------
+
+    def get_listener_matching_with_data(self, data, listener_type):
+        return None
+
+    def get_many_listeners_matching_with_data(self, data, listener_type):
+        return []
+
+    # --- Handlers and dispatch --------------------------------------------
+
+    def add_handler(self, handler, group: int = 0):
+        self.groups[group].append(handler)
+        return handler, group
+
+    def remove_handler(self, handler, group: int = 0):
+        self.groups[group].remove(handler)
+
+    def on_message(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.add_handler(MessageHandler(func, filters), group)
+            return func
+        return decorator
+
+    def on_inline_query(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.add_handler(InlineQueryHandler(func, filters), group)
+            return func
+        return decorator
+
+    async def dispatch(self, update, on_handled=None):
+        """
+        Feed one update through registered handlers like pyrogram's Dispatcher.
+
+        Args:
+            update: FakeMessage or FakeInlineQuery
+            on_handled: optional callback(handler, seconds, error) for every
+                        handler that ran
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        handler_type = InlineQueryHandler if isinstance(update, FakeInlineQuery) else MessageHandler
+
+        for group in sorted(self.groups):
+            for handler in list(self.groups[group]):
+                if not isinstance(handler, handler_type):
+                    continue
+                started = self.loop.time()
+                try:
+                    if not await handler.check(self, update):
+                        continue
+                except Exception as e:
+                    logger.error(f"Filter error: {str(e)}", exc_info=True)
+                    continue
+
+                error = None
+                try:
+                    await handler.callback(self, update)
+                except pyrogram.StopPropagation:
+                    return
+                except pyrogram.ContinuePropagation:
+                    continue
+                except Exception as e:
+                    error = e
+                    logger.error(f"Handler error: {str(e)}", exc_info=True)
+                finally:
+                    if on_handled:
+                        on_handled(handler, self.loop.time() - started, error)
+                break
+
+    # --- Fixtures ---------------------------------------------------------
+
+    def add_chat(self, chat_id: int, members: int, bots: int = 0) -> FakeChat:
+        """Create a supergroup with `members` users (and `bots` bots)"""
+        chat = FakeChat(chat_id, title=f"Chat {chat_id}")
+        self.chats[chat_id] = chat
+        # The account owns bench chats, so /rename and /repic pass the permission check
+        roster = [FakeChatMember(self.me, ChatMemberStatus.OWNER)]
+        for i in range(members):
+            user_id = 10_000_000 + chat_id % 1000 * 100_000 + i
+            roster.append(FakeChatMember(FakeUser(user_id, username=f"user{user_id}", first_name=f"Name{i}")))
+        for i in range(bots):
+            roster.append(FakeChatMember(FakeUser(next(_ids), username=f"bot{i}_bot", is_bot=True)))
+        self.members[chat_id] = roster
+        return chat
+
+
+_IMAGE_CACHE: dict[str, bytes] = {}
+
+
+def _image_bytes(file_name: str) -> bytes:
+    """Small valid image in the format implied by the file extension"""
+    image_format = "WEBP" if file_name.endswith(".webp") else "JPEG"
+    if image_format not in _IMAGE_CACHE:
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGBA" if image_format == "WEBP" else "RGB", (512, 512), (200, 80, 40, 255)).save(buffer, image_format)
+        _IMAGE_CACHE[image_format] = buffer.getvalue()
+    return _IMAGE_CACHE[image_format]
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Offline replay benchmark for all handlers.
+
+Registers handlers exactly like main.py does (handlers.registry with the
+current settings) on a FakeClient, replays a synthetic stream of updates
+(plain text, commands, service messages, inline queries) through pyrogram's
+group/propagation rules with N concurrent workers and reports throughput and
+p50/p99 latency per handler, plus API call and FloodWait counts. For handlers
+behind the limiter the latency is how long the dispatcher worker was held;
+the wall time includes the limiter tasks finishing their work.
+
+Exits with status 1 if some update kind of the mix never reached a handler
+(e.g. the fakes stopped matching pyrogram's filters), since the numbers then
+say nothing about the handlers the kind exists to exercise.
+
+Usage:
+    python bench/replay.py [--updates 2000] [--chats 4] [--members 500]
+                           [--latency 0.01] [--flood-rate 0.01] [--workers 8]
+                           [--mix text=60,pidor=10,...] [--lazy]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+DEFAULT_MIX = "text=60,pidor=8,rename=4,repic=3,history=2,reply=5,title=3,inline=15"
+
+
+def parse_mix(raw: str) -> dict[str, int]:
+    mix = {}
+    for item in raw.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def build_stream(client, chats: list, count: int, mix: dict[str, int], rng: random.Random) -> list:
+    """Generate `count` synthetic (kind, update) pairs according to the mix weights"""
+    from fake_client import FakeFile, FakeInlineQuery, FakeMessage, FakeUser
+    from pyrogram.enums import MessageServiceType
+
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    admin = FakeUser(1, username="vvzvlad", first_name="Admin")
+    stream = []
+
+    for i in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        chat = rng.choice(chats)
+        member = rng.choice(client.members[chat.id][1:]).user
+
+        if kind == "text":
+            update = FakeMessage(client, chat, member, text=f"message {i}")
+        elif kind == "pidor":
+            update = FakeMessage(client, chat, member, text=rng.choice(["/pidor", "/пидор"]))
+        elif kind == "rename":
+            update = FakeMessage(client, chat, member, text=f"/rename Title {i}")
+        elif kind == "repic":
+            thumbs = [FakeFile(width=side, height=side) for side in (90, 320, 800)]
+            update = FakeMessage(client, chat, member, caption="/repic", photo=FakeFile(thumbs=thumbs))
+        elif kind == "history":
+            update = FakeMessage(client, chat, admin, text="/history")
+        elif kind == "reply":
+            target = FakeMessage(client, chat, member, text="quoted")
+            update = FakeMessage(client, chat, member, text="/й", reply_to_message=target)
+        elif kind == "title":
+            update = FakeMessage(client, chat, member, service=MessageServiceType.NEW_CHAT_TITLE,
+                                 new_chat_title=f"Title {i}")
+        elif kind == "inline":
+            update = FakeInlineQuery(client, member)
+        else:
+            raise ValueError(f"Unknown update kind '{kind}'")
+        stream.append((kind, update))
+
+    return stream
+
+
+def handler_label(handler) -> str:
+    """Human-readable name of a registered handler"""
+    from handlers.registry import LazyHandler
+
+    callback = getattr(handler, "original_callback", handler.callback)
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, LazyHandler):
+        return f"{owner.spec.name} (lazy)"
+    return f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def replay(args) -> bool:
+    from config import get_settings
+    from fake_client import FakeClient
+    from handlers import registry
+    from limiter import get_limiter
+
+    settings = get_settings()
+    client = FakeClient(latency=args.latency, flood_rate=args.flood_rate,
+                        flood_wait=args.flood_wait, seed=args.seed)
+    chats = [client.add_chat(-1000000000000 - i, members=args.members, bots=2) for i in range(args.chats)]
+
+    registry.register_handlers(
+        client,
+        lazy=args.lazy or settings.lazy_handlers,
+        enabled=settings.enabled_handlers,
+        chat_allowlists=settings.handler_chats,
+    )
+
+    rng = random.Random(args.seed)
+    stream = build_stream(client, chats, args.updates, parse_mix(args.mix), rng)
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    sent: dict[str, int] = defaultdict(int)
+    reached: dict[str, int] = defaultdict(int)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for kind, update in stream:
+        sent[kind] += 1
+        queue.put_nowait((kind, update))
+
+    async def worker():
+        while True:
+            try:
+                kind, update = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            handled = False
+
+            def on_handled(handler, seconds, error):
+                nonlocal handled
+                label = handler_label(handler)
+                latencies[label].append(seconds)
+                if error is not None:
+                    errors[label] += 1
+                handled = True
+
+            await client.dispatch(update, on_handled)
+            if handled:
+                reached[kind] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.workers)))
+    # Limited handlers run in limiter tasks after their callback returned:
+    # wait for them too, so the wall time covers all the work
+    await get_limiter().drain(timeout=3600)
+    wall = time.perf_counter() - started
+
+    print(f"Replayed {len(stream)} updates in {wall:.2f}s "
+          f"({len(stream) / wall:.1f} updates/s, {args.workers} workers, "
+          f"latency {args.latency * 1000:.1f} ms/call, flood rate {args.flood_rate})")
+    print()
+    print(f"{'handler':<45} {'calls':>7} {'err':>5} {'per s':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for label in sorted(latencies):
+        values = latencies[label]
+        print(f"{label:<45} {len(values):>7} {errors[label]:>5} {len(values) / wall:>8.1f} "
+              f"{percentile(values, 0.5) * 1000:>9.2f} {percentile(values, 0.99) * 1000:>9.2f} "
+              f"{max(values) * 1000:>9.2f}")
+    print()
+    print("API calls: " + ", ".join(f"{method}={count}" for method, count in sorted(client.calls.items())))
+    if client.floods:
+        print("FloodWait injected: " + ", ".join(f"{method}={count}" for method, count in sorted(client.floods.items())))
+    print("Updates reaching a handler: " + ", ".join(f"{kind}={reached[kind]}/{sent[kind]}" for kind in sorted(sent)))
+
+    unhandled = [kind for kind in sorted(sent) if not reached[kind]]
+    if unhandled:
+        print(f"ERROR: no handler ran for update kinds: {', '.join(unhandled)}", file=sys.stderr)
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000, help="number of updates to replay (default: 2000)")
+    parser.add_argument("--chats", type=int, default=4, help="number of chats (default: 4)")
+    parser.add_argument("--members", type=int, default=500, help="members per chat (default: 500)")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds per API call (default: 0.01)")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="FloodWait probability per call (default: 0)")
+    parser.add_argument("--flood-wait", type=int, default=0, help="FloodWait value in seconds (default: 0)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent dispatcher workers (default: 8)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"update kind weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--lazy", action="store_true", help="register handlers in lazy mode")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed (default: 0)")
+    parser.add_argument("--log-level", default="CRITICAL", help="log level for handlers (default: CRITICAL)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.CRITICAL))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ.setdefault("TG_API_ID", "1")
+        os.environ.setdefault("TG_API_HASH", "bench")
+        os.environ["SESSION_PATH"] = data_dir
+        # repic_watcher downloads into ./temp
+        os.chdir(data_dir)
+        ok = asyncio.run(replay(args))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
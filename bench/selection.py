@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Microbenchmarks for the deterministic XOR selectors.
+
+Covers pidor_watcher.select_pidor (members x sha256) at several roster sizes,
+xor_selector.XorIndex queries over the same rosters and
+uk_inline_watcher.select_article_for_user for a batch of users, each over
+several day seeds. Before timing, every case is checked against a frozen copy
+of the original string-based selection (hex digests sliced to 16 chars), so
+an optimization that changes any winner fails loudly.
+
+Every case is timed together with the reference implementation in the same
+process, and what is compared is the ratio current/reference, so the numbers
+do not depend on the machine the way absolute timings do. Each timing repeat
+runs for at least --min-time seconds, so the small cases are not dominated by
+timer noise:
+
+    python bench/selection.py --save-baseline      # record bench/baselines/selectors.json
+    python bench/selection.py --threshold 0.15     # exit 1 if any ratio is >15% worse
+
+The baseline of ratios is committed; a run without it (or without a case in
+it) fails unless --save-baseline is given, so the regression check cannot
+silently turn into a no-op.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "selectors.json")
+
+MEMBER_SIZES = (100, 1_000, 10_000, 50_000)
+UK_USERS = 200
+DAYS = 5
+
+
+# --- Reference implementation (original string-based selection) -------------
+
+def _ref_hash(value) -> str:
+    return hashlib.sha256(str(value).encode()).hexdigest()
+
+
+def _ref_xor(hash_a: str, hash_b: str) -> int:
+    return int(hash_a[:16], 16) ^ int(hash_b[:16], 16)
+
+
+def reference_select_pidor(members: list, day_hash: str):
+    if not members:
+        return None
+    return min(members, key=lambda member: _ref_xor(day_hash, _ref_hash(member.user.id)))
+
+
+def reference_select_article(articles: list[str], user_id: int, day_hash: str) -> str:
+    seed = _ref_xor(day_hash, _ref_hash(user_id))
+    best_article = articles[0]
+    best_distance = 2**64 - 1
+    for article in articles:
+        dist = seed ^ int(hashlib.sha256(article.encode()).hexdigest()[:16], 16)
+        if dist < best_distance:
+            best_distance = dist
+            best_article = article
+    return best_article
+
+
+# --- Fixtures ----------------------------------------------------------------
+
+def day_hashes(days: int) -> list[str]:
+    """Day hashes for `days` consecutive UTC midnights starting 2025-01-01"""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [_ref_hash(int((start + timedelta(days=i)).timestamp())) for i in range(days)]
+
+
+def make_members(count: int) -> list:
+    return [SimpleNamespace(user=SimpleNamespace(id=100_000_000 + i * 7919)) for i in range(count)]
+
+
+# --- Runner ------------------------------------------------------------------
+
+def day_key(day_hash: str) -> int:
+    """Integer day key used by xor_selector for a reference hex day hash"""
+    return int(day_hash[:16], 16)
+
+
+def member_index(members: list):
+    from xor_selector import XorIndex, digest_key
+
+    return XorIndex((digest_key(member.user.id), member) for member in members)
+
+
+def verify(pidor_watcher, uk_inline_watcher, hashes: list[str]) -> None:
+    """Fail if the current selectors pick anything different from the reference"""
+    for size in MEMBER_SIZES:
+        members = make_members(size)
+        index = member_index(members)
+        for day_hash in hashes:
+            expected = reference_select_pidor(members, day_hash)
+            for name, actual in (
+                ("select_pidor", pidor_watcher.select_pidor(members, day_key(day_hash))),
+                ("XorIndex.nearest", index.nearest(day_key(day_hash))),
+            ):
+                if actual.user.id != expected.user.id:
+                    raise SystemExit(f"{name} mismatch: size={size} day={day_hash[:8]} "
+                                     f"expected={expected.user.id} got={actual.user.id}")
+
+    articles = uk_inline_watcher.ARTICLES
+    for day_hash in hashes:
+        for user_id in range(UK_USERS):
+            expected = reference_select_article(articles, user_id, day_hash)
+            actual = uk_inline_watcher.select_article_for_user(user_id, day_key(day_hash))
+            if actual != expected:
+                raise SystemExit(f"select_article_for_user mismatch: user={user_id} day={day_hash[:8]}")
+    print("Results identical to reference implementation")
+
+
+def best_time(func, repeat: int, min_time: float) -> float:
+    """Best-of-`repeat` seconds per call, each repeat running for at least `min_time`"""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def measure(pidor_watcher, uk_inline_watcher, hashes: list[str], repeat: int,
+            min_time: float) -> dict[str, tuple[float, float]]:
+    """Seconds per selection of the current code and of the reference, for every case"""
+    results = {}
+    keys = [day_key(day_hash) for day_hash in hashes]
+
+    for size in MEMBER_SIZES:
+        members = make_members(size)
+        index = member_index(members)
+
+        def run_reference():
+            for day_hash in hashes:
+                reference_select_pidor(members, day_hash)
+
+        def run_pidor():
+            for key in keys:
+                pidor_watcher.select_pidor(members, key)
+
+        def run_index():
+            for key in keys:
+                index.nearest(key)
+
+        reference = best_time(run_reference, repeat, min_time) / len(keys)
+        results[f"select_pidor[{size}]"] = (best_time(run_pidor, repeat, min_time) / len(keys), reference)
+        results[f"XorIndex.nearest[{size}]"] = (best_time(run_index, repeat, min_time) / len(keys), reference)
+
+    articles = uk_inline_watcher.ARTICLES
+
+    def run_uk_reference():
+        for day_hash in hashes:
+            for user_id in range(UK_USERS):
+                reference_select_article(articles, user_id, day_hash)
+
+    def run_uk():
+        for key in keys:
+            for user_id in range(UK_USERS):
+                uk_inline_watcher.select_article_for_user(user_id, key)
+
+    calls = len(hashes) * UK_USERS
+    results[f"select_article_for_user[{len(articles)} articles]"] = (
+        best_time(run_uk, repeat, min_time) / calls,
+        best_time(run_uk_reference, repeat, min_time) / calls,
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=7, help="timing repeats, best is kept (default: 7)")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="minimum seconds per timing repeat (default: 0.2)")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown of the current/reference ratio vs baseline as a fraction (default: 0.2)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help=f"baseline file (default: {BASELINE_PATH})")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run's ratios as the new baseline")
+    args = parser.parse_args()
+
+    os.environ.setdefault("TG_API_ID", "1")
+    os.environ.setdefault("TG_API_HASH", "bench")
+    from handlers import pidor_watcher, uk_inline_watcher
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        raise SystemExit(f"Baseline {args.baseline} not found, record one with --save-baseline")
+
+    hashes = day_hashes(DAYS)
+    verify(pidor_watcher, uk_inline_watcher, hashes)
+    results = measure(pidor_watcher, uk_inline_watcher, hashes, args.repeat, args.min_time)
+    ratios = {case: current / reference for case, (current, reference) in results.items()}
+
+    regressions = []
+    missing = []
+    print(f"{'case':<45} {'us/call':>10} {'ref us':>10} {'ratio':>8} {'baseline':>9} {'change':>8}")
+    for case, (current, reference) in results.items():
+        line = f"{case:<45} {current * 1e6:>10.2f} {reference * 1e6:>10.2f} {ratios[case]:>8.4f}"
+        if case in baseline:
+            change = ratios[case] / baseline[case] - 1
+            line += f" {baseline[case]:>9.4f} {change:>+8.1%}"
+            if change > args.threshold:
+                regressions.append(case)
+        else:
+            line += f" {'-':>9}"
+            missing.append(case)
+        print(line)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(ratios, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    else:
+        if missing:
+            print(f"No baseline for: {', '.join(missing)} (re-record with --save-baseline)")
+        if regressions:
+            print(f"Regression over {args.threshold:.0%}: {', '.join(regressions)}")
+        if missing or regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Startup benchmark: eager vs lazy handler registration.
+
+Each run starts a fresh interpreter with `-X importtime`, imports the handler
+registry and registers all handlers against a no-op client, in eager and in
+lazy mode. Reports median wall time per mode and the heaviest imports
+(cumulative, as reported by -X importtime).
+
+Usage:
+    python bench/startup.py [--runs 5] [--top 15]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+CHILD_CODE = """
+import time
+t0 = time.perf_counter()
+from handlers import registry
+
+class _NullClient:
+    def on_message(self, filters=None, group=0):
+        return lambda func: func
+
+    def on_inline_query(self, filters=None, group=0):
+        return lambda func: func
+
+    def add_handler(self, handler, group=0):
+        pass
+
+registry.register_handlers(_NullClient(), lazy={lazy})
+print(time.perf_counter() - t0)
+"""
+
+
+def run_once(lazy: bool, data_dir: str) -> tuple[float, list[tuple[int, int, str]]]:
+    """Run one registration in a child interpreter, return (seconds, importtime rows)"""
+    env = dict(os.environ)
+    env.setdefault("TG_API_ID", "1")
+    env.setdefault("TG_API_HASH", "bench")
+    env["SESSION_PATH"] = data_dir
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_CODE.format(lazy=lazy)],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+
+    return float(proc.stdout.strip().splitlines()[-1]), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="runs per mode (default: 5)")
+    parser.add_argument("--top", type=int, default=15, help="imports to show per mode (default: 15)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for lazy in (False, True):
+            mode = "lazy" if lazy else "eager"
+            timings = []
+            rows = []
+            for _ in range(args.runs):
+                seconds, rows = run_once(lazy, data_dir)
+                timings.append(seconds)
+
+            total_self_ms = sum(row[0] for row in rows) / 1000
+            print(f"== {mode}: median {statistics.median(timings) * 1000:.1f} ms "
+                  f"(min {min(timings) * 1000:.1f} ms, {args.runs} runs), "
+                  f"{len(rows)} modules imported, {total_self_ms:.1f} ms total import self-time")
+            print(f"   {'self ms':>9} {'cumul ms':>9}  module")
+            for self_us, cumulative_us, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+                print(f"   {self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {name}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-chat cache of the account's right to change chat info (title, photo).
+
+/rename and /repic ask the cache before deleting the command, downloading or
+converting anything, so in chats where the account has no rights they stop
+without a single API call. Entries come from get_chat_member(chat_id, "me")
+and live for PERMISSION_CACHE_TTL seconds; they are replaced earlier by
+ChatMemberUpdated updates about the account itself (permission_watcher) and
+by ChatAdminRequired errors.
+"""
+
+import logging
+import time
+from typing import Dict, Tuple
+
+from pyrogram import Client
+from pyrogram.enums import ChatMemberStatus
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Global instance
+_instance = None
+
+
+def get_permission_cache() -> "PermissionCache":
+    """Get the global PermissionCache instance (created on first use)"""
+    global _instance
+    if _instance is None:
+        _instance = PermissionCache(ttl=get_settings().permission_cache_ttl)
+    return _instance
+
+
+def member_can_change_info(member, chat=None) -> bool:
+    """
+    Whether a ChatMember may change the chat title and photo.
+
+    Args:
+        member: pyrogram ChatMember of the account
+        chat: pyrogram Chat, for default permissions of ordinary members
+    """
+    if member.status == ChatMemberStatus.OWNER:
+        return True
+    if member.status == ChatMemberStatus.ADMINISTRATOR:
+        return bool(member.privileges and member.privileges.can_change_info)
+    if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED):
+        # Restricted members have their own permissions, others inherit the chat's defaults
+        permissions = member.permissions if member.status == ChatMemberStatus.RESTRICTED else None
+        if permissions is None and chat is not None:
+            permissions = chat.permissions
+        return bool(permissions and permissions.can_change_info)
+    return False
+
+
+class PermissionCache:
+    """chat_id -> (can_change_info, monotonic time of the check)"""
+
+    def __init__(self, ttl: float = 600.0):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[bool, float]] = {}
+
+    def get(self, chat_id: int) -> bool | None:
+        """Cached answer, or None if unknown or expired"""
+        entry = self._entries.get(chat_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def set(self, chat_id: int, allowed: bool):
+        previous = self.get(chat_id)
+        self._entries[chat_id] = (allowed, time.monotonic())
+        if previous is not None and previous != allowed:
+            logger.info(f"Change-info permission in chat {chat_id} is now {'granted' if allowed else 'revoked'}")
+
+    def mark_denied(self, chat_id: int):
+        """Record a ChatAdminRequired from the server"""
+        self.set(chat_id, False)
+
+    def invalidate(self, chat_id: int):
+        self._entries.pop(chat_id, None)
+
+    async def can_change_info(self, client: Client, chat_id: int) -> bool:
+        """Cached permission check, asking the server only on a miss"""
+        allowed = self.get(chat_id)
+        if allowed is not None:
+            return allowed
+
+        try:
+            member = await client.get_chat_member(chat_id, "me")
+            chat = None
+            if member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED):
+                chat = await client.get_chat(chat_id)
+            allowed = member_can_change_info(member, chat)
+        except Exception as e:
+            # Unknown: let the command try, the server will tell
+            logger.warning(f"Failed to check permissions in chat {chat_id}: {str(e)}")
+            return True
+
+        self.set(chat_id, allowed)
+        logger.debug(f"Change-info permission in chat {chat_id}: {allowed}")
+        return allowed
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+In-memory cache of each chat's current title and photo.
+
+/rename and /repic consult it to skip changes that would not change anything,
+instead of spending a round-trip on a set_chat_title that fails with
+ChatNotModified or re-uploading the image the chat already shows.
+
+The cache is fed by title_monitor's service-message stream (NEW_CHAT_TITLE,
+NEW_CHAT_PHOTO, DELETE_CHAT_PHOTO) and by our own successful calls, whose
+service messages pyrogram does not deliver back. The title is also refreshed
+from the chat of every incoming command, which is authoritative and free, so a
+missed service message cannot leave it stale. The photo has no such source:
+it is only trusted while title_monitor receives the chat's updates. A photo is identified by
+file_unique_id; after our own /repic both the source media's id and the id of
+the photo in the service message are recorded, because Telegram stores the
+chat photo as a new file. Nothing is persisted: after a restart the state is
+unknown and the first change goes to the server as before.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Global instance
+_instance = None
+
+
+def get_chat_state_cache() -> "ChatStateCache":
+    """Get the global ChatStateCache instance (created on first use)"""
+    global _instance
+    if _instance is None:
+        _instance = ChatStateCache()
+    return _instance
+
+
+@dataclass
+class ChatState:
+    # None = unknown
+    title: str | None = None
+    # file_unique_ids showing the current photo; empty = no photo, None = unknown
+    photo_ids: frozenset[str] | None = None
+
+
+class ChatStateCache:
+    """chat_id -> ChatState"""
+
+    def __init__(self):
+        self._states: Dict[int, ChatState] = {}
+
+    def get(self, chat_id: int) -> ChatState:
+        state = self._states.get(chat_id)
+        if state is None:
+            state = self._states[chat_id] = ChatState()
+        return state
+
+    def set_title(self, chat_id: int, title: str | None):
+        self.get(chat_id).title = title.strip() if title else title
+
+    def observe_title(self, chat_id: int, title: str | None):
+        """Take the title of the chat an incoming message came with as the current one"""
+        if title:
+            self.get(chat_id).title = title.strip()
+
+    def is_current_title(self, chat_id: int, title: str) -> bool:
+        return self.get(chat_id).title == title.strip()
+
+    def set_photo(self, chat_id: int, unique_ids: Iterable[str | None]):
+        """Record the current photo by every file_unique_id known to show it (none = no photo)"""
+        self.get(chat_id).photo_ids = frozenset(unique_id for unique_id in unique_ids if unique_id)
+
+    def is_current_photo(self, chat_id: int, unique_id: str | None) -> bool:
+        photo_ids = self.get(chat_id).photo_ids
+        return bool(unique_id) and photo_ids is not None and unique_id in photo_ids
+
+    def forget(self, chat_id: int):
+        self._states.pop(chat_id, None)
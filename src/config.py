@@ -3,8 +3,11 @@
 
 import os
 import logging
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 _LOGGING_INITIALIZED = False
@@ -46,18 +49,136 @@ def setup_logging(level_name: str = "INFO") -> None:
     _LOGGING_INITIALIZED = True
     logging.info("Logging system initialized")
 
-def get_settings() -> dict[str, Any]:
+# Merging repeats is only safe for idempotent commands: a second /пидор gets
+# the same winner, while a second /rename or /repic carries different input
+DEFAULT_HANDLER_LIMITS = "pidor_watcher=/merge"
+
+def _parse_handler_limits(raw: str) -> dict[str, tuple[int | None, str]]:
+    """
+    Parse per-handler limiter overrides.
+
+    Format: "pidor_watcher=2/drop,repic_watcher=1" (policy part is optional;
+    an empty limit, as in "pidor_watcher=/merge", keeps HANDLER_MAX_CONCURRENCY).
+    """
+    overrides: dict[str, tuple[int | None, str]] = {}
+    for item in raw.split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        limit_str, _, policy = value.partition("/")
+        try:
+            limit = int(limit_str) if limit_str.strip() else None
+        except ValueError:
+            logging.warning("Invalid HANDLER_LIMITS entry '%s', skipping", item)
+            continue
+        overrides[name.strip()] = (limit, policy.strip() or os.getenv("HANDLER_OVERFLOW_POLICY", "queue"))
+    return overrides
+
+def _parse_name_list(raw: str) -> list[str] | None:
+    """Parse "a, b,c" into ["a", "b", "c"]; empty string means "not set" (None)"""
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    return names or None
+
+def _parse_handler_chats(raw: str) -> dict[str, set[int]]:
+    """
+    Parse per-handler chat allowlists.
+
+    Format: "pidor_watcher=-1001,-1002;repic_watcher=-1003"
+    """
+    allowlists: dict[str, set[int]] = {}
+    for item in raw.split(";"):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        name, chats = item.split("=", 1)
+        try:
+            allowlists[name.strip()] = {int(chat_id) for chat_id in chats.split(",") if chat_id.strip()}
+        except ValueError:
+            logging.warning("Invalid HANDLER_CHATS entry '%s', skipping", item)
+    return allowlists
+
+@dataclass(frozen=True)
+class Settings:
+    """Application settings, built once from environment variables"""
+
+    tg_api_id: int
+    tg_api_hash: str = field(repr=False)
+    session_path: str = "data"
+    log_level: str = "INFO"
+    handler_max_concurrency: int = 8
+    handler_max_per_chat: int = 1
+    handler_overflow_policy: str = "queue"
+    handler_queue_limit: int = 32
+    handler_limits: Mapping[str, tuple[int | None, str]] = field(default_factory=lambda: MappingProxyType({}))
+    reconnect_max_attempts: int = 8
+    reconnect_base_delay: float = 1.0
+    reconnect_max_delay: float = 60.0
+    reconnect_stable_period: float = 300.0
+    shutdown_timeout: float = 10.0
+    lazy_handlers: bool = False
+    enabled_handlers: tuple[str, ...] | None = None
+    handler_chats: Mapping[str, frozenset[int]] = field(default_factory=lambda: MappingProxyType({}))
+    title_backfill_page_size: int = 100
+    title_backfill_page_delay: float = 1.0
+    title_history_legacy_chat_id: int | None = None
+    member_scan_threshold: int = 9000
+    member_scan_concurrency: int = 4
+    member_cache_ttl: float = 86400.0
+    permission_cache_ttl: float = 600.0
+    image_workers: int = 2
+    sticker_frame_timeout: float = 10.0
+    photo_history_depth: int = 20
+    photo_history_max_mb: int = 100
+
+
+def _load_settings() -> Settings:
     tg_api_id = os.getenv("TG_API_ID")
     tg_api_hash = os.getenv("TG_API_HASH")
     if not tg_api_id or not tg_api_hash:
         print("TG_API_ID and TG_API_HASH must be set")
         os._exit(1)
 
-    log_level = os.getenv("LOG_LEVEL", "INFO")
+    enabled_handlers = _parse_name_list(os.getenv("ENABLED_HANDLERS", ""))
+    handler_chats = _parse_handler_chats(os.getenv("HANDLER_CHATS", ""))
+
+    return Settings(
+        tg_api_id=int(tg_api_id),
+        tg_api_hash=tg_api_hash,
+        session_path=os.getenv("SESSION_PATH", "data") or "data",
+        log_level=os.getenv("LOG_LEVEL", "INFO"),
+        handler_max_concurrency=int(os.getenv("HANDLER_MAX_CONCURRENCY", "8")),
+        handler_max_per_chat=int(os.getenv("HANDLER_MAX_PER_CHAT", "1")),
+        handler_overflow_policy=os.getenv("HANDLER_OVERFLOW_POLICY", "queue"),
+        handler_queue_limit=int(os.getenv("HANDLER_QUEUE_LIMIT", "32")),
+        handler_limits=MappingProxyType(_parse_handler_limits(os.getenv("HANDLER_LIMITS", DEFAULT_HANDLER_LIMITS))),
+        reconnect_max_attempts=int(os.getenv("RECONNECT_MAX_ATTEMPTS", "8")),
+        reconnect_base_delay=float(os.getenv("RECONNECT_BASE_DELAY", "1")),
+        reconnect_max_delay=float(os.getenv("RECONNECT_MAX_DELAY", "60")),
+        reconnect_stable_period=float(os.getenv("RECONNECT_STABLE_PERIOD", "300")),
+        shutdown_timeout=float(os.getenv("SHUTDOWN_TIMEOUT", "10")),
+        lazy_handlers=os.getenv("LAZY_HANDLERS", "0").lower() in ("1", "true", "yes"),
+        enabled_handlers=tuple(enabled_handlers) if enabled_handlers is not None else None,
+        handler_chats=MappingProxyType({name: frozenset(chats) for name, chats in handler_chats.items()}),
+        title_backfill_page_size=int(os.getenv("TITLE_BACKFILL_PAGE_SIZE", "100")),
+        title_backfill_page_delay=float(os.getenv("TITLE_BACKFILL_PAGE_DELAY", "1")),
+        title_history_legacy_chat_id=int(os.getenv("TITLE_HISTORY_LEGACY_CHAT_ID")) if os.getenv("TITLE_HISTORY_LEGACY_CHAT_ID") else None,
+        member_scan_threshold=int(os.getenv("MEMBER_SCAN_THRESHOLD", "9000")),
+        member_scan_concurrency=int(os.getenv("MEMBER_SCAN_CONCURRENCY", "4")),
+        member_cache_ttl=float(os.getenv("MEMBER_CACHE_TTL", "86400")),
+        permission_cache_ttl=float(os.getenv("PERMISSION_CACHE_TTL", "600")),
+        image_workers=int(os.getenv("IMAGE_WORKERS", "2")),
+        sticker_frame_timeout=float(os.getenv("STICKER_FRAME_TIMEOUT", "10")),
+        photo_history_depth=int(os.getenv("PHOTO_HISTORY_DEPTH", "20")),
+        photo_history_max_mb=int(os.getenv("PHOTO_HISTORY_MAX_MB", "100")),
+    )
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return settings, reading the environment only on the first call"""
+    return _load_settings()
 
-    return {
-        "tg_api_id": int(tg_api_id),
-        "tg_api_hash": tg_api_hash,
-        "session_path": os.getenv("SESSION_PATH", "data") or "data",
-        "log_level": log_level,
-    }
+def reload_settings() -> Settings:
+    """Drop the cached settings and read the environment again (for tests and tooling)"""
+    get_settings.cache_clear()
+    return get_settings()
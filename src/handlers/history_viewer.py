@@ -4,134 +4,216 @@
 """
 History Viewer Plugin
 Обработка команды /history для просмотра истории изменений названия чата
+
+История выводится постранично: за раз читается и форматируется только одна
+страница, листание — inline-кнопками «назад»/«дальше», которые редактируют
+то же сообщение. Страница обрезается так, чтобы уложиться в лимит Telegram
+на длину сообщения.
+
+Фильтры: /history @user, /history <подстрока>, /history 2024-03 или
+/history 2024-01..2024-06-15, их можно сочетать. Поиск идёт по индексу в
+хранилище истории. Фильтр для кнопок листания запоминается в памяти по id
+отправленного сообщения.
 """
 
 import logging
+from collections import OrderedDict
 from pyrogram import Client, filters
-from pyrogram.types import Message
+from pyrogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from title_index import HistoryQuery, parse_history_query
 from handlers.title_monitor import get_title_monitor
+from limiter import submit_limited
 
 logger = logging.getLogger(__name__)
 
 # Константы
-DEFAULT_HISTORY_LIMIT = 50
+HISTORY_PAGE_SIZE = 20
 MAX_MESSAGE_LENGTH = 4096
+CALLBACK_PREFIX = "history:"
+MAX_REMEMBERED_QUERIES = 256
+
+# (chat_id, message_id) -> фильтр, с которым отправлена страница
+_queries: "OrderedDict[tuple[int, int], HistoryQuery]" = OrderedDict()
+
+
+def remember_query(chat_id: int, message_id: int, query: HistoryQuery):
+    _queries[(chat_id, message_id)] = query
+    while len(_queries) > MAX_REMEMBERED_QUERIES:
+        _queries.popitem(last=False)
 
 
-def format_history_message(history: list) -> str:
+def format_history_entry(entry: dict) -> str:
     """
-    Форматировать список изменений в текстовое сообщение
-    
+    Форматировать одну запись истории
+
     Args:
-        history: Список записей истории из TitleMonitor.get_history()
-    
+        entry: Запись истории из TitleMonitor.get_history()
+
     Returns:
-        Отформатированная строка для отправки пользователю
-        
-    Raises:
-        ValueError: если сообщение превышает MAX_MESSAGE_LENGTH
+        Строка для вывода пользователю
     """
-    lines = []
+    new_title = entry['new_title']
+    actor = entry.get('changed_by_username') or ""
+    source = entry.get('title_source_username') or ""
+
+    # Убираем случайные @ в начале, если вдруг сохранились
+    actor = actor.lstrip('@')
+    source = source.lstrip('@')
 
+    if actor and source and source != actor:
+        # Переименовал один, название взял из чужого сообщения
+        return f"{new_title} (переименовал {actor}, из сообщения {source})"
+    elif actor:
+        return f"{new_title} (переименовал {actor})"
+    else:
+        return f"{new_title} (переименовал неизвестный)"
+
+
+def format_history_page(history: list, offset: int, total: int, query: HistoryQuery = HistoryQuery()) -> tuple[str, int]:
+    """
+    Форматировать страницу истории в текст не длиннее MAX_MESSAGE_LENGTH
+
+    Args:
+        history: Записи страницы из TitleMonitor.search_history()
+        offset: Номер первой записи страницы (от самых новых)
+        total: Всего подходящих записей
+        query: фильтр, для заголовка
+
+    Returns:
+        (текст, сколько записей в него поместилось); остальные записи
+        переходят на следующую страницу
+    """
+    lines = []
+    length = 0
     for entry in history:
-        new_title = entry['new_title']
-        actor = entry.get('changed_by_username') or ""
-        source = entry.get('title_source_username') or ""
-
-        # Убираем случайные @ в начале, если вдруг сохранились
-        actor = actor.lstrip('@')
-        source = source.lstrip('@')
-
-        if actor and source and source != actor:
-            # Переименовал один, название взял из чужого сообщения
-            line = f"{new_title} (переименовал {actor}, из сообщения {source})"
-        elif actor:
-            line = f"{new_title} (переименовал {actor})"
-        else:
-            line = f"{new_title} (переименовал неизвестный)"
-
-        lines.append(line)
-    
-    message = "\n".join(lines)
-    
-    # Проверка длины
-    if len(message) > MAX_MESSAGE_LENGTH:
-        raise ValueError(
-            f"Message length {len(message)} exceeds Telegram limit {MAX_MESSAGE_LENGTH}"
-        )
-    
-    return message
+        line = format_history_entry(entry)
+        # +1 на перевод строки, запас под заголовок страницы
+        if lines and length + len(line) + 1 > MAX_MESSAGE_LENGTH - 256:
+            break
+        lines.append(line[:MAX_MESSAGE_LENGTH - 256])
+        length += len(line) + 1
+
+    header = f"📋 История названий: {offset + 1}–{offset + len(lines)} из {total}"
+    if query:
+        header += f" (фильтр: {str(query)[:100]})"
+    return header + "\n\n" + "\n".join(lines), len(lines)
+
+
+def page_start_before(history: list, offset: int) -> int:
+    """
+    Начало страницы, на которой стоит запись offset - 1
+
+    Страницы режутся format_history_page() по длине, так что граница
+    предыдущей страницы не offset - HISTORY_PAGE_SIZE: страницы
+    пересчитываются с начала тем же способом, что и при листании вперёд.
+
+    Args:
+        history: первые offset записей выдачи (от новых к старым)
+        offset: начало текущей страницы
+    """
+    start = 0
+    while start < offset:
+        _, shown = format_history_page(history[start:start + HISTORY_PAGE_SIZE], start, len(history))
+        if start + shown >= offset:
+            break
+        start += shown
+    return start
+
+
+def build_history_keyboard(
+    offset: int, shown: int, total: int, filtered: bool = False, previous: int = 0
+) -> InlineKeyboardMarkup | None:
+    """Кнопки листания; None, если вся история поместилась на одну страницу"""
+    # Для отфильтрованного вывода фильтр берётся из _queries
+    suffix = ":q" if filtered else ""
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Новее", callback_data=f"{CALLBACK_PREFIX}{previous}{suffix}"))
+    if offset + shown < total:
+        buttons.append(InlineKeyboardButton("Старее ➡️", callback_data=f"{CALLBACK_PREFIX}{offset + shown}{suffix}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def render_history_page(
+    chat_id: int, offset: int, query: HistoryQuery = HistoryQuery()
+) -> tuple[str, InlineKeyboardMarkup | None] | None:
+    """
+    Прочитать и отформатировать одну страницу истории чата
+
+    Returns:
+        (текст, клавиатура) или None, если подходящих записей нет
+    """
+    title_monitor = get_title_monitor()
+    offset = max(offset, 0)
+    history, total = title_monitor.search_history(chat_id, query, limit=HISTORY_PAGE_SIZE, offset=offset)
+    if total == 0:
+        return None
+
+    previous = 0
+    if offset > 0:
+        newer, _ = title_monitor.search_history(chat_id, query, limit=min(offset, total), offset=0)
+        if not history:
+            # Смещение за концом выдачи (например, старая кнопка) — показать последнюю страницу
+            offset = page_start_before(newer, total)
+            history, total = title_monitor.search_history(chat_id, query, limit=HISTORY_PAGE_SIZE, offset=offset)
+        previous = page_start_before(newer, offset)
+
+    text, shown = format_history_page(history, offset, total, query)
+    return text, build_history_keyboard(offset, shown, total, filtered=bool(query), previous=previous)
+
+
+def is_authorized(user) -> bool:
+    """Команда и кнопки доступны только для @vvzvlad"""
+    return bool(user) and user.username == "vvzvlad"
 
 
 async def handle_history(client: Client, message: Message):
     """
     Обработка команды /history или /история
-    
+
     Процесс:
-    1. Получить TitleMonitor instance
-    2. Получить историю через get_history()
-    3. Форматировать данные
-    4. Отправить ответ пользователю
-    5. Обработать edge cases
+    1. Разобрать фильтры из аргументов
+    2. Получить первую страницу подходящих записей
+    3. Отправить ответ с кнопками листания
+    4. Обработать edge cases
     """
     try:
         # Проверка: команда доступна только для @vvzvlad
-        if not message.from_user or message.from_user.username != "vvzvlad":
+        if not is_authorized(message.from_user):
             logger.info(
                 f"History command ignored: user {message.from_user.username if message.from_user else 'unknown'} "
                 f"is not authorized"
             )
             return
-        
-        # Получить TitleMonitor instance
-        title_monitor = get_title_monitor()
-        
-        if not title_monitor:
-            logger.error("TitleMonitor instance not found")
-            await message.reply_text(
-                "❌ Ошибка: система мониторинга не инициализирована"
-            )
-            return
-        
-        # Получить историю
+
+        query = parse_history_query(message.command[1:] if message.command else [])
+
+        # Получить первую страницу
         try:
-            history = title_monitor.get_history(limit=DEFAULT_HISTORY_LIMIT)
+            page = render_history_page(message.chat.id, 0, query)
         except Exception as e:
             logger.error(f"Failed to get history: {str(e)}", exc_info=True)
             await message.reply_text(
                 "❌ Ошибка при чтении истории изменений"
             )
             return
-        
+
         # Проверка: пустая история
-        if not history:
-            await message.reply_text(
-                "📋 История изменений названия чата пуста"
-            )
+        if page is None:
+            if query:
+                await message.reply_text(f"📋 Ничего не найдено (фильтр: {str(query)[:100]})")
+            else:
+                await message.reply_text(
+                    "📋 История изменений названия чата пуста"
+                )
             return
-        
-        # Форматировать и отправить
-        try:
-            formatted_message = format_history_message(history)
-            await message.reply_text(formatted_message)
-            
-            logger.info(
-                f"History displayed in chat {message.chat.id}, "
-                f"showing {len(history)} entries"
-            )
-            
-        except ValueError as e:
-            # Сообщение слишком длинное
-            logger.warning(f"History message too long: {str(e)}")
-            await message.reply_text(
-                "⚠️ История слишком большая для отображения.\n"
-                "Показаны последние несколько записей..."
-            )
-            # Попытка с меньшим количеством записей
-            reduced_history = history[:5]
-            formatted_message = format_history_message(reduced_history)
-            await message.reply_text(formatted_message)
-            
+
+        text, keyboard = page
+        sent = await message.reply_text(text, reply_markup=keyboard)
+        if query and sent:
+            remember_query(message.chat.id, sent.id, query)
+        logger.info(f"History displayed in chat {message.chat.id}" + (f", filter '{query}'" if query else ""))
+
     except Exception as e:
         logger.error(f"Error in history handler: {str(e)}", exc_info=True)
         await message.reply_text(
@@ -139,15 +221,57 @@ async def handle_history(client: Client, message: Message):
         )
 
 
+async def handle_history_page(client: Client, callback_query: CallbackQuery):
+    """Обработка нажатия кнопки листания истории"""
+    try:
+        if not is_authorized(callback_query.from_user):
+            await callback_query.answer("Листать историю может только администратор")
+            return
+
+        offset, _, marker = callback_query.data[len(CALLBACK_PREFIX):].partition(":")
+        offset = int(offset)
+        chat_id = callback_query.message.chat.id
+        query = HistoryQuery()
+        if marker:
+            query = _queries.get((chat_id, callback_query.message.id))
+            if query is None:
+                # Фильтр забыт после перезапуска или вытеснен
+                await callback_query.answer("Запрос устарел, повторите /history")
+                return
+
+        page = render_history_page(chat_id, offset, query)
+        if page is None:
+            await callback_query.answer("История пуста")
+            return
+
+        text, keyboard = page
+        await callback_query.message.edit_text(text, reply_markup=keyboard)
+        await callback_query.answer()
+        logger.info(f"History page at offset {offset} displayed in chat {chat_id}")
+
+    except Exception as e:
+        logger.error(f"Error in history page handler: {str(e)}", exc_info=True)
+        await callback_query.answer("❌ Ошибка при чтении истории")
+
+
 def register_handler(client: Client, group: int = 0):
     """Регистрация обработчика команды /history"""
-    
+
     @client.on_message(
-        filters.command(["history", "история"]) & filters.group, 
+        filters.command(["history", "история"]) & filters.group,
         group=group
     )
     async def history_wrapper(client: Client, message: Message):
-        await handle_history(client, message)
+        submit_limited("history_viewer", message.chat.id, lambda: handle_history(client, message))
         await message.continue_propagation()
-    
+
+    @client.on_callback_query(filters.regex(rf"^{CALLBACK_PREFIX}\d+(:q)?$"), group=group)
+    async def history_page_wrapper(client: Client, callback_query: CallbackQuery):
+        submit_limited(
+            "history_viewer",
+            callback_query.message.chat.id,
+            lambda: handle_history_page(client, callback_query),
+        )
+        await callback_query.continue_propagation()
+
     logger.info("History viewer handler registered")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Permission Watcher Plugin
+Обновление кэша прав аккаунта (chat_permissions) по ChatMemberUpdated:
+когда аккаунт повышают, понижают или меняют ему права, кэш обновляется
+сразу, не дожидаясь истечения PERMISSION_CACHE_TTL.
+"""
+
+import logging
+from pyrogram import Client, filters
+from pyrogram.enums import ChatMemberStatus
+from pyrogram.types import ChatMemberUpdated
+from chat_permissions import get_permission_cache, member_can_change_info
+
+logger = logging.getLogger(__name__)
+
+
+def _is_self_update(_, __, update: ChatMemberUpdated) -> bool:
+    member = update.new_chat_member or update.old_chat_member
+    return bool(member and member.user and member.user.is_self)
+
+
+self_member_filter = filters.create(_is_self_update)
+
+
+async def handle_member_update(client: Client, update: ChatMemberUpdated):
+    """Записать новые права аккаунта в кэш"""
+    try:
+        chat_id = update.chat.id
+        if update.new_chat_member is None:
+            # Аккаунт покинул чат
+            get_permission_cache().set(chat_id, False)
+            return
+        if update.new_chat_member.status == ChatMemberStatus.MEMBER:
+            # Права обычного участника зависят от настроек чата — перечитать при следующей команде
+            get_permission_cache().invalidate(chat_id)
+            return
+        get_permission_cache().set(chat_id, member_can_change_info(update.new_chat_member))
+    except Exception as e:
+        logger.error(f"Error in permission watcher: {str(e)}", exc_info=True)
+
+
+def register_handler(client: Client, group: int = 0):
+    """Регистрация обработчика изменений прав аккаунта"""
+
+    @client.on_chat_member_updated(self_member_filter, group=group)
+    async def permission_wrapper(client: Client, update: ChatMemberUpdated):
+        await handle_member_update(client, update)
+        await update.continue_propagation()
+
+    logger.info("Permission watcher handler registered")
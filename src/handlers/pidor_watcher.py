@@ -5,30 +5,61 @@
 Pidor Watcher Plugin
 Выбор "пидора дня" по команде /пидор на основе XOR-метрики хешей.
 
-Алгоритм (детерминирован по дате, не рандомный):
-1. day_hash  = sha256(str(unix_timestamp полуночи UTC сегодня))
-2. user_hash = sha256(str(user.id)) для каждого участника
-3. distance  = int(day_hash[:16], 16) XOR int(user_hash[:16], 16)
-4. Победитель = участник с минимальным XOR-расстоянием от хеша дня
+Алгоритм (детерминирован по дате, не рандомный), см. xor_selector:
+1. day_key  = первые 8 байт sha256(str(unix_timestamp полуночи сегодня))
+2. user_key = первые 8 байт sha256(str(user.id)) для каждого участника
+3. distance = day_key XOR user_key
+4. Победитель = участник с минимальным XOR-расстоянием от ключа дня
+
+В больших чатах get_chat_members отдаёт только первые ~10k участников. Если
+их пришло не меньше MEMBER_SCAN_THRESHOLD, в фоне запускается полный обход
+(member_cache), и дальше выбор идёт по его готовому списку.
+
+Незадолго до полуночи фоновая задача заранее выбирает победителей завтрашнего
+дня для всех активных чатов (по спискам из member_cache), так что полуночный
+наплыв /пидор обслуживается без обхода участников.
 """
 
 import asyncio
-import hashlib
 import logging
 import random
-from datetime import date
-from typing import Dict, Tuple
+from datetime import date, time, timedelta
+from typing import AsyncIterator, Dict, Tuple
 
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from config import now_in_app_timezone
+from config import get_settings, now_in_app_timezone
+from limiter import submit_limited
+from xor_selector import digest_key, get_day_key, select_nearest, select_nearest_async
+from pidor_stats import get_pidor_stats, period_keys
+from member_cache import CachedMember, get_member_cache, start_roster_scan
+from scheduler import get_scheduler
 
 logger = logging.getLogger(__name__)
 
 # In-memory кэш: (chat_id, date) -> True означает, что тег уже был отправлен сегодня
 # При первом вызове за день в данном чате — тегать (@username), при повторных — нет
+# Записи прошлых дней удаляет ежедневная задача планировщика после полуночи
 _announced: Dict[Tuple[int, date], bool] = {}
 
+# Победители дня, выбранные заранее или первым вызовом за день:
+# (chat_id, date) -> (участник, размер списка). Повторные вызовы берут их отсюда,
+# даже если за день список участников обновился
+_winners: Dict[Tuple[int, date], Tuple[object, int]] = {}
+
+# Пауза между интро и результатом (результат отправляет планировщик)
+RESULT_DELAY = 2
+EVICTION_TIME = time(0, 0, 5)
+
+# Предвыбор победителей на завтра: когда и для каких чатов (был /пидор за N дней)
+PRECOMPUTE_TIME = time(23, 50)
+ACTIVE_CHAT_DAYS = 7
+
+# /pidorstats: аргументы периода и размер таблицы лидеров
+STATS_PERIODS_YEAR = ("year", "год")
+STATS_PERIODS_ALL = ("all", "все", "всё")
+STATS_LIMIT = 10
+
 # Сообщения-интро (первый вызов за день)
 MESSAGES_INTRO = [
     "Woop-woop! That's the sound of da pidor-police!",
@@ -60,82 +91,65 @@ MESSAGES_RESULT = [
 ]
 
 
-def get_day_hash() -> str:
-    """
-    Вернуть sha256-хеш текущего дня.
-
-    Берём полночь текущего дня в UTC, конвертируем в unix timestamp,
-    превращаем в строку и хешируем.
-
-    Returns:
-        hex-строка sha256 (64 символа)
-    """
-    now_local = now_in_app_timezone()
-    midnight_local = now_local.replace(hour=0, minute=0, second=0, microsecond=0)
-    unix_ts = int(midnight_local.timestamp())
-    return hashlib.sha256(str(unix_ts).encode()).hexdigest()
-
-
-def get_user_hash(user_id: int) -> str:
+def select_pidor(members: list, day_key: int) -> object | None:
     """
-    Вернуть sha256-хеш пользователя по его Telegram user.id.
+    Выбрать "пидора дня" из списка участников.
 
-    Используем user.id (а не username), т.к. он никогда не меняется.
+    Возвращаем участника, чей ключ user.id ближе всего к ключу дня по XOR.
 
     Args:
-        user_id: Telegram user ID (целое число)
+        members: список объектов pyrogram ChatMember
+        day_key: ключ текущего дня из get_day_key()
 
     Returns:
-        hex-строка sha256 (64 символа)
-    """
-    return hashlib.sha256(str(user_id).encode()).hexdigest()
-
-
-def xor_distance(hash_a: str, hash_b: str) -> int:
+        ChatMember с минимальным XOR-расстоянием, или None если список пуст
     """
-    Вычислить XOR-расстояние между двумя sha256 hex-строками.
+    winner, _ = select_nearest(members, day_key, key=lambda member: digest_key(member.user.id))
+    return winner
 
-    Берём первые 16 hex-символов (= 8 байт = uint64) каждого хеша
-    и возвращаем их XOR. Меньше = ближе.
 
-    XOR-метрика (аналог Kademlia DHT) обеспечивает равномерное
-    распределение без систематического смещения в пользу
-    пользователей с определёнными диапазонами ID.
+async def eligible_members(client: Client, chat_id: int, exclude_user_id: int) -> AsyncIterator:
+    """Участники чата без ботов, удалённых аккаунтов и самого аккаунта бота"""
+    async for member in client.get_chat_members(chat_id):
+        user = member.user
+        if user.is_bot or user.is_deleted or user.id == exclude_user_id:
+            continue
+        yield member
 
-    Args:
-        hash_a: hex-строка первого хеша
-        hash_b: hex-строка второго хеша
 
-    Returns:
-        целое число — XOR расстояние (0 = одинаковые, больше = дальше)
+async def select_pidor_streaming(client: Client, chat_id: int, exclude_user_id: int, day_key: int):
     """
-    a = int(hash_a[:16], 16)
-    b = int(hash_b[:16], 16)
-    return a ^ b
+    Выбрать "пидора дня" прямо по ходу get_chat_members.
 
+    В отличие от select_pidor() список участников не собирается: в памяти
+    только текущий лучший кандидат, так что расход памяти не зависит от
+    размера чата.
 
-def select_pidor(members: list, day_hash: str) -> object | None:
+    Returns:
+        (ChatMember с минимальным XOR-расстоянием или None, число участников)
     """
-    Выбрать "пидора дня" из списка участников.
+    return await select_nearest_async(
+        eligible_members(client, chat_id, exclude_user_id),
+        day_key,
+        key=lambda member: digest_key(member.user.id),
+    )
 
-    Итерируем по участникам, вычисляем XOR-расстояние между хешем дня
-    и хешем user.id каждого участника, возвращаем ближайшего.
 
-    Args:
-        members: список объектов pyrogram ChatMember
-        day_hash: хеш текущего дня из get_day_hash()
-
-    Returns:
-        ChatMember с минимальным XOR-расстоянием, или None если список пуст
-    """
-    if not members:
-        return None
+async def recorded_winner(client: Client, chat_id: int, user_id: int, display_name: str):
+    """Победитель из журнала: участник чата, а если его уже нет — имя из журнала"""
+    try:
+        return (await client.get_chat_member(chat_id, user_id)).user
+    except Exception as e:
+        logger.debug(f"Recorded pidor winner {user_id} not found in chat {chat_id}: {str(e)}")
+        return CachedMember(user_id, first_name=display_name)
 
-    def distance_for_member(member):
-        user_hash = get_user_hash(member.user.id)
-        return xor_distance(day_hash, user_hash)
 
-    return min(members, key=distance_for_member)
+def get_plain_name(user) -> str:
+    """Имя пользователя без тега: имя и фамилия, иначе username, иначе id"""
+    first_name = user.first_name or ""
+    last_name = user.last_name or ""
+    name = f"{first_name} {last_name}".strip()
+    return name if name else (user.username or f"id:{user.id}")
 
 
 async def handle_pidor(client: Client, message: Message):
@@ -143,50 +157,76 @@ async def handle_pidor(client: Client, message: Message):
     Обработка команды /пидор или /pidor.
 
     Процесс:
-    1. Получить список участников чата через get_chat_members
-    2. Отфильтровать ботов и удалённые аккаунты
-    3. Вычислить хеш дня
-    4. Найти участника с минимальным XOR-расстоянием
-    5. Отправить сообщение с результатом
+    0. Если результат первого объявления ещё не отправлен — ответить, что выбор
+       уже идёт
+    1. Взять победителя, уже выбранного на сегодня (заранее перед полуночью,
+       первым вызовом за день или записанного в журнал /pidorstats), если он есть
+    2. Иначе вычислить ключ дня; если для чата есть полный список участников
+       из member_cache (чат не меньше MEMBER_SCAN_THRESHOLD) — выбрать по нему;
+       иначе пройти участников через
+       get_chat_members, пропуская ботов и удалённые аккаунты, и запомнить
+       ближайшего по XOR
+    3. Отправить сообщение с результатом
     """
     try:
         chat_id = message.chat.id
+        scheduler = get_scheduler()
+        result_job = f"pidor_result:{chat_id}"
+        if scheduler.is_pending(result_job):
+            # Результат объявления уже вот-вот придёт — не перебиваем его и не выбираем заново
+            logger.info(f"Pidor announcement already in progress in chat {chat_id}")
+            await message.reply_text("⏳ Уже выбираю пидора дня, секунду...")
+            return
 
-        # Получаем ID текущего аккаунта (userbot), чтобы исключить его из выборки
-        me = await client.get_me()
+        today = now_in_app_timezone().date()
+        day_key = get_day_key(today)
+        member_cache = get_member_cache()
+        roster = member_cache.get_roster(chat_id)
+        threshold = get_settings().member_scan_threshold
+
+        recorded = get_pidor_stats().winner(chat_id, today)
+
+        if (chat_id, today) in _winners:
+            # Выбран заранее задачей precompute_winners или первым вызовом за день
+            winner, members_count = _winners[(chat_id, today)]
+        elif recorded is not None:
+            # Победитель уже записан в журнал (например, до перезапуска)
+            # Размер списка тогда неизвестен (None)
+            winner, members_count = await recorded_winner(client, chat_id, *recorded), None
+        elif roster is not None and len(roster) >= threshold:
+            # Полный список из фонового обхода (только для больших чатов), без запросов к API
+            winner = roster.nearest(day_key)
+            members_count = len(roster)
+            if not member_cache.is_fresh(roster):
+                start_roster_scan(client, chat_id)
+        else:
+            # Получаем ID текущего аккаунта (userbot), чтобы исключить его из выборки
+            me = await client.get_me()
+
+            # Выбираем победителя по ходу перебора участников
+            winner_member, members_count = await select_pidor_streaming(client, chat_id, me.id, day_key)
+            winner = winner_member.user if winner_member else None
 
-        # Собираем всех участников чата
-        members = []
-        async for member in client.get_chat_members(chat_id):
-            user = member.user
-            # Пропускаем ботов, удалённые аккаунты и сам аккаунт бота
-            if user.is_bot:
-                continue
-            if user.is_deleted:
-                continue
-            if user.id == me.id:
-                continue
-            members.append(member)
-
-        if not members:
+            if members_count >= threshold:
+                # Похоже, упёрлись в лимит выдачи: собрать полный список в фоне
+                start_roster_scan(client, chat_id)
+
+        if members_count == 0:
             await message.reply_text("😔 Не удалось найти участников чата")
             return
 
-        # Вычисляем хеш дня и выбираем победителя
-        day_hash = get_day_hash()
-        winner_member = select_pidor(members, day_hash)
-
-        if not winner_member:
+        if not winner:
             await message.reply_text("😔 Не удалось определить пидора дня")
             return
-
-        winner = winner_member.user
+        _winners[(chat_id, today)] = (winner, members_count)
 
         # Определяем: первый ли это вызов сегодня в данном чате?
-        today = now_in_app_timezone().date()
         cache_key = (chat_id, today)
         first_announcement = cache_key not in _announced
 
+        # Журнал победителей для /pidorstats (повторные вызовы за день игнорируются)
+        get_pidor_stats().record_winner(chat_id, today, winner.id, get_plain_name(winner))
+
         if first_announcement:
             # Первый вызов за день: интро → пауза → результат с @mention
             if winner.username:
@@ -200,27 +240,18 @@ async def handle_pidor(client: Client, message: Message):
             result = random.choice(MESSAGES_RESULT).format(tag_mention)
 
             await client.send_message(chat_id, intro)
-            await asyncio.sleep(2)
-            await client.send_message(chat_id, result)
+            # Результат — через паузу, без ожидания внутри обработчика
+            scheduler.call_later(RESULT_DELAY, lambda: client.send_message(chat_id, result), name=result_job)
 
             # Записываем в кэш
             _announced[cache_key] = True
-            # Очищаем устаревшие записи (даты до сегодня)
-            stale_keys = [k for k in _announced if k[1] < today]
-            for k in stale_keys:
-                del _announced[k]
         else:
             # Повторный запрос — не тегаем, просто имя
-            first_name = winner.first_name or ""
-            last_name = winner.last_name or ""
-            name = f"{first_name} {last_name}".strip()
-            plain_mention = name if name else (winner.username or f"id:{winner.id}")
-
-            await message.reply_text(f"🌈 Пидор дня — {plain_mention}!")
+            await message.reply_text(f"🌈 Пидор дня — {get_plain_name(winner)}!")
 
         logger.info(
             f"Pidor of the day in chat {chat_id}: user_id={winner.id}, "
-            f"username={winner.username}, from {len(members)} members"
+            f"username={winner.username}, from {members_count} members"
         )
 
     except Exception as e:
@@ -228,15 +259,126 @@ async def handle_pidor(client: Client, message: Message):
         await message.reply_text("❌ Произошла ошибка при определении пидора дня")
 
 
+async def handle_pidor_stats(client: Client, message: Message):
+    """
+    Обработка команды /pidorstats или /пидорстат
+
+    Аргумент задаёт период: месяц (по умолчанию), год или всё время.
+    Ответ строится из счётчиков PidorStats, без повторного выбора по дням.
+    """
+    try:
+        args = message.command[1:] if message.command else []
+        period_arg = args[0].lower() if args else "month"
+        today = now_in_app_timezone().date()
+        all_key, year_key, month_key = period_keys(today)
+
+        if period_arg in STATS_PERIODS_YEAR:
+            period, title = year_key, f"за {year_key} год"
+        elif period_arg in STATS_PERIODS_ALL:
+            period, title = all_key, "за всё время"
+        else:
+            period, title = month_key, f"за {month_key}"
+
+        leaderboard = get_pidor_stats().leaderboard(message.chat.id, period, limit=STATS_LIMIT)
+        if not leaderboard:
+            await message.reply_text(f"📊 Статистики {title} пока нет")
+            return
+
+        lines = [f"📊 Пидоры {title}:"]
+        for place, (name, wins) in enumerate(leaderboard, start=1):
+            lines.append(f"{place}. {name} — {wins}")
+        await message.reply_text("\n".join(lines))
+
+    except Exception as e:
+        logger.error(f"Error in pidor stats handler: {str(e)}", exc_info=True)
+        await message.reply_text("❌ Произошла ошибка при подсчёте статистики")
+
+
+def evict_announced():
+    """Удалить из _announced и _winners записи прошлых дней"""
+    today = now_in_app_timezone().date()
+    evicted = 0
+    for cache in (_announced, _winners):
+        stale_keys = [k for k in cache if k[1] < today]
+        for k in stale_keys:
+            del cache[k]
+        evicted += len(stale_keys)
+    logger.debug(f"Evicted {evicted} stale pidor entries")
+
+
+async def precompute_chat_winner(client: Client, chat_id: int, day: date, day_key: int):
+    """
+    Выбрать победителя чата на день `day`.
+
+    Небольшие чаты выбираются по свежему get_chat_members прямо сейчас, перед
+    полуночью, так что вчерашний состав не используется. Список из member_cache
+    берётся только для чатов не меньше MEMBER_SCAN_THRESHOLD, где обычная
+    выдача обрезана; устаревший список сначала обновляется.
+    """
+    member_cache = get_member_cache()
+    threshold = get_settings().member_scan_threshold
+    roster = member_cache.get_roster(chat_id)
+
+    if roster is None or len(roster) < threshold:
+        me = await client.get_me()
+        winner_member, members_count = await select_pidor_streaming(client, chat_id, me.id, day_key)
+        if members_count < threshold:
+            if winner_member:
+                _winners[(chat_id, day)] = (winner_member.user, members_count)
+            return
+        # Выдача упёрлась в лимит: нужен полный обход
+        roster = None
+
+    if roster is None or not member_cache.is_fresh(roster):
+        scan = start_roster_scan(client, chat_id)
+        await asyncio.shield(scan.task)
+        roster = member_cache.get_roster(chat_id)
+    if roster is None or not len(roster):
+        return
+    _winners[(chat_id, day)] = (roster.nearest(day_key), len(roster))
+
+
+async def precompute_winners(client: Client):
+    """Заранее выбрать победителей завтрашнего дня во всех активных чатах"""
+    today = now_in_app_timezone().date()
+    tomorrow = today + timedelta(days=1)
+    day_key = get_day_key(tomorrow)
+    chats = get_pidor_stats().active_chats(since=today - timedelta(days=ACTIVE_CHAT_DAYS))
+    # Не больше MEMBER_SCAN_CONCURRENCY чатов одновременно, чтобы не забить лимитер обходами
+    semaphore = asyncio.Semaphore(max(1, get_settings().member_scan_concurrency))
+
+    async def precompute(chat_id: int):
+        async with semaphore:
+            await precompute_chat_winner(client, chat_id, tomorrow, day_key)
+
+    results = await asyncio.gather(*(precompute(chat_id) for chat_id in chats), return_exceptions=True)
+    for chat_id, result in zip(chats, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to precompute pidor winner in chat {chat_id}: {str(result)}")
+    ready = sum(1 for chat_id in chats if (chat_id, tomorrow) in _winners)
+    logger.info(f"Pidor winners for {tomorrow} precomputed in {ready} of {len(chats)} active chats")
+
+
 def register_handler(client: Client, group: int = 0):
     """Регистрация обработчика команды /пидор и /pidor"""
+    scheduler = get_scheduler()
+    scheduler.run_daily(EVICTION_TIME, evict_announced, name="pidor_evict_announced")
+    scheduler.run_daily(PRECOMPUTE_TIME, lambda: precompute_winners(client), name="pidor_precompute")
 
     @client.on_message(
         filters.command(["пидор", "pidor"]) & filters.group,
         group=group
     )
     async def pidor_wrapper(client: Client, message: Message):
-        await handle_pidor(client, message)
+        submit_limited("pidor_watcher", message.chat.id, lambda: handle_pidor(client, message))
+        await message.continue_propagation()
+
+    @client.on_message(
+        filters.command(["пидорстат", "pidorstats"]) & filters.group,
+        group=group
+    )
+    async def pidor_stats_wrapper(client: Client, message: Message):
+        submit_limited("pidor_stats", message.chat.id, lambda: handle_pidor_stats(client, message))
         await message.continue_propagation()
 
     logger.info("Pidor watcher handler registered")
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Handler registry.
+
+Knows every handler module, its dispatcher group and a cheap pre-filter, and
+registers the enabled ones (ENABLED_HANDLERS) either eagerly (import module,
+collect handlers from register_handler) or lazily. In lazy mode only a stub
+handler with the pre-filter is installed; the real module (and its heavy
+imports like Pillow or the UK article list) is imported on the first update
+that passes the pre-filter, its handlers are collected and the update is
+dispatched to them.
+
+Handlers with a per-chat allowlist (HANDLER_CHATS) get a chat filter in front
+of their own filters, so other chats are rejected by a set lookup before any
+other filter work.
+
+A module may also handle callback queries from its own inline buttons
+(callback_prefilter); in lazy mode it then gets a second stub for them.
+Modules of kind "chat_member_updated" watch membership and rights changes.
+"""
+
+import importlib
+import logging
+from typing import Mapping
+
+from pyrogram import Client, ContinuePropagation, filters
+from pyrogram.filters import Filter
+from pyrogram.handlers import CallbackQueryHandler, ChatMemberUpdatedHandler, InlineQueryHandler, MessageHandler
+from pyrogram.handlers.handler import Handler
+
+logger = logging.getLogger(__name__)
+
+# HandlerSpec.kind -> handler class of the module's main updates
+HANDLER_TYPES: dict[str, type[Handler]] = {
+    "message": MessageHandler,
+    "inline_query": InlineQueryHandler,
+    "chat_member_updated": ChatMemberUpdatedHandler,
+}
+
+
+class HandlerSpec:
+    """Static description of a handler module"""
+
+    def __init__(
+        self,
+        name: str,
+        group: int = 0,
+        kind: str = "message",
+        prefilter: Filter | None = None,
+        requires: tuple[str, ...] = (),
+        enabled_by_default: bool = True,
+        callback_prefilter: Filter | None = None,
+    ):
+        self.name = name
+        self.group = group
+        self.kind = kind
+        self.prefilter = prefilter
+        self.callback_prefilter = callback_prefilter
+        self.requires = requires
+        self.enabled_by_default = enabled_by_default
+
+
+# Registration order matters: handlers in the same group are checked in this order
+HANDLERS = [
+    HandlerSpec("title_monitor", prefilter=filters.service & filters.group),
+    HandlerSpec("permission_watcher", kind="chat_member_updated"),
+    HandlerSpec("rename_watcher", prefilter=filters.command(["rename", "ренейм", "ренаме"]) & filters.group),
+    HandlerSpec("repic_watcher", prefilter=filters.command(["repic", "репик", "unrepic"]) & filters.group),
+    HandlerSpec("short_reply_watcher", prefilter=filters.text & filters.group),
+    HandlerSpec(
+        "history_viewer",
+        prefilter=filters.command(["history", "история"]) & filters.group,
+        requires=("title_monitor",),
+        callback_prefilter=filters.regex(r"^history:"),
+    ),
+    HandlerSpec("title_backfill", prefilter=filters.command("backfill") & filters.group),
+    HandlerSpec(
+        "pidor_watcher",
+        prefilter=filters.command(["пидор", "pidor", "пидорстат", "pidorstats"]) & filters.group,
+    ),
+    HandlerSpec("uk_inline_watcher", kind="inline_query"),
+    HandlerSpec("service_cleaner", group=1, prefilter=filters.service & filters.group, enabled_by_default=False),
+]
+
+SPECS = {spec.name: spec for spec in HANDLERS}
+
+# Registered handler name -> chat allowlist (None = every chat)
+_registered: dict[str, frozenset[int] | None] = {}
+
+
+def is_handler_active(name: str, chat_id: int) -> bool:
+    """Whether a handler module is registered and receives updates from the chat"""
+    if name not in _registered:
+        return False
+    chats = _registered[name]
+    return chats is None or chat_id in chats
+
+
+def get_enabled_specs(enabled: tuple[str, ...] | None) -> list[HandlerSpec]:
+    """
+    Resolve the list of handlers to register.
+
+    Args:
+        enabled: handler names from settings, or None for the defaults
+
+    Returns:
+        Specs in registration order
+    """
+    if enabled is None:
+        return [spec for spec in HANDLERS if spec.enabled_by_default]
+
+    for name in enabled:
+        if name not in SPECS:
+            logger.warning(f"Unknown handler '{name}' in ENABLED_HANDLERS, ignoring")
+    return [spec for spec in HANDLERS if spec.name in enabled]
+
+
+def _with_chat_allowlist(flt: Filter | None, chats: frozenset[int] | None) -> Filter | None:
+    """Prepend a chat filter so disallowed chats fail on the first, cheapest check"""
+    if not chats:
+        return flt
+    chat_filter = filters.chat(list(chats))
+    return chat_filter if flt is None else chat_filter & flt
+
+
+class _HandlerCollector:
+    """
+    Client stand-in passed to register_handler().
+
+    Records decorated callbacks as pyrogram Handler objects instead of adding
+    them to the dispatcher; everything else is forwarded to the real client.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+        self.handlers: list[Handler] = []
+
+    def on_message(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.handlers.append(MessageHandler(func, filters))
+            return func
+        return decorator
+
+    def on_inline_query(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.handlers.append(InlineQueryHandler(func, filters))
+            return func
+        return decorator
+
+    def on_callback_query(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.handlers.append(CallbackQueryHandler(func, filters))
+            return func
+        return decorator
+
+    def on_chat_member_updated(self, filters=None, group: int = 0):
+        def decorator(func):
+            self.handlers.append(ChatMemberUpdatedHandler(func, filters))
+            return func
+        return decorator
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class LazyHandler:
+    """Stub that imports a handler module on the first matching update"""
+
+    def __init__(self, spec: HandlerSpec, loaders: dict[str, "LazyHandler"], chats: frozenset[int] | None = None):
+        self.spec = spec
+        self._loaders = loaders
+        self._chats = chats
+        self._handlers: list[Handler] | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._handlers is not None
+
+    def load(self, client: Client) -> list[Handler]:
+        """Import the module and collect its handlers (once)"""
+        if self._handlers is None:
+            for dependency in self.spec.requires:
+                if dependency in self._loaders:
+                    self._loaders[dependency].load(client)
+
+            # The stub already applied the chat allowlist
+            self._handlers = _collect_handlers(client, self.spec)
+            logger.info(f"Lazy handler '{self.spec.name}' loaded on first update")
+        return self._handlers
+
+    async def _dispatch(self, client: Client, update, handler_type: type[Handler]):
+        """
+        Pass the update to the module's real handlers of its type like pyrogram
+        does within a group: the first one whose filters match runs, and if it
+        raises ContinuePropagation the next matching one is tried.
+        """
+        for handler in self.load(client):
+            if isinstance(handler, handler_type) and await handler.check(client, update):
+                try:
+                    await handler.callback(client, update)
+                except ContinuePropagation:
+                    continue
+                return
+        # No real handler matched (or all passed it on): let the rest of the group see the update
+        update.continue_propagation()
+
+    async def dispatch(self, client: Client, update):
+        await self._dispatch(client, update, HANDLER_TYPES[self.spec.kind])
+
+    async def dispatch_callback_query(self, client: Client, update):
+        await self._dispatch(client, update, CallbackQueryHandler)
+
+    def stubs(self) -> list[Handler]:
+        if self.spec.kind == "inline_query":
+            stubs = [InlineQueryHandler(self.dispatch, self.spec.prefilter)]
+        else:
+            handler_type = HANDLER_TYPES[self.spec.kind]
+            stubs = [handler_type(self.dispatch, _with_chat_allowlist(self.spec.prefilter, self._chats))]
+        if self.spec.callback_prefilter is not None:
+            # Buttons only exist under messages the module sent, i.e. in allowed chats
+            stubs.append(CallbackQueryHandler(self.dispatch_callback_query, self.spec.callback_prefilter))
+        return stubs
+
+
+def _collect_handlers(client: Client, spec: HandlerSpec) -> list[Handler]:
+    """Import a handler module and collect the handlers its register_handler() creates"""
+    module = importlib.import_module(f"handlers.{spec.name}")
+    collector = _HandlerCollector(client)
+    module.register_handler(collector, group=spec.group)
+    return collector.handlers
+
+
+def register_handlers(
+    client: Client,
+    lazy: bool = False,
+    enabled: tuple[str, ...] | None = None,
+    chat_allowlists: Mapping[str, frozenset[int]] | None = None,
+) -> dict[str, LazyHandler]:
+    """
+    Register enabled handlers from HANDLERS.
+
+    Args:
+        client: Pyrogram client instance
+        lazy: install stubs and import modules on first matching update
+        enabled: handler names to register (None = enabled_by_default ones)
+        chat_allowlists: handler name -> chat ids the handler is limited to
+
+    Returns:
+        Lazy loaders by handler name (empty in eager mode)
+    """
+    chat_allowlists = chat_allowlists or {}
+    loaders: dict[str, LazyHandler] = {}
+
+    for spec in get_enabled_specs(enabled):
+        chats = chat_allowlists.get(spec.name)
+        if chats and spec.kind == "inline_query":
+            logger.warning(f"Chat allowlist is not applicable to inline handler '{spec.name}', ignoring")
+            chats = None
+
+        if lazy:
+            loader = LazyHandler(spec, loaders, chats)
+            loaders[spec.name] = loader
+            for stub in loader.stubs():
+                client.add_handler(stub, spec.group)
+            logger.info(f"Lazy handler stub registered: {spec.name}")
+        else:
+            for handler in _collect_handlers(client, spec):
+                if not isinstance(handler, CallbackQueryHandler):
+                    handler.filters = _with_chat_allowlist(handler.filters, chats)
+                client.add_handler(handler, spec.group)
+
+        _registered[spec.name] = frozenset(chats) if chats else None
+        if chats:
+            logger.info(f"Handler '{spec.name}' limited to chats: {sorted(chats)}")
+
+    return loaders
@@ -6,57 +6,39 @@ Rename Watcher Plugin
 Обработка команды /rename для переименования чата
 """
 
-import csv
 import logging
-import os
 import random
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.enums import MessageServiceType
 from pyrogram.errors import ChatAdminRequired, ChatNotModified
-from config import get_settings, now_in_app_timezone
+from chat_permissions import get_permission_cache
+from chat_state import get_chat_state_cache
+from handlers.title_monitor import get_title_monitor
+from limiter import submit_limited
 
 logger = logging.getLogger(__name__)
 
 
-def _write_rename_to_csv(new_title: str, actor_username: str, source_username: str):
-    """Записать факт переименования в CSV-файл статистики"""
-    try:
-        settings = get_settings()
-        data_dir = settings.get("session_path", "data")
-        os.makedirs(data_dir, exist_ok=True)
-        csv_file = os.path.join(data_dir, "chat_title_changes.csv")
-
-        write_header = not os.path.exists(csv_file)
-        timestamp = now_in_app_timezone().isoformat()
-
-        with open(csv_file, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if write_header:
-                writer.writerow(["timestamp", "new_title", "changed_by_username", "title_source_username"])
-            writer.writerow([timestamp, new_title, actor_username, source_username])
-
-        logger.info(
-            f"Rename logged: new_title='{new_title}', "
-            f"actor=@{actor_username}, source=@{source_username}"
-        )
-    except Exception as e:
-        logger.error(f"Failed to write rename to CSV: {str(e)}", exc_info=True)
-
-
 async def handle_rename(client: Client, message: Message):
     """
     Обработка команды /rename
 
     Объединяет логику:
+    - Проверка прав аккаунта по кэшу (без прав — ни одного запроса к API)
     - Извлечение нового названия из сообщения/ответа
     - Валидация и обрезка до 255 символов
+    - Пропуск без запросов к API, если чат уже называется так (кэш chat_state)
     - Удаление командного сообщения
     - Вызов client.set_chat_title()
-    - Запись статистики в CSV (кто переименовал + чьё сообщение стало названием)
+    - Запись в историю названий (кто переименовал + чьё сообщение стало названием)
     - Обработка ошибок
     """
     try:
+        if not await get_permission_cache().can_change_info(client, message.chat.id):
+            logger.info(f"Ignoring /rename in chat {message.chat.id}: no right to change chat info")
+            return
+
         new_title = None
         source_username = None
 
@@ -88,9 +70,16 @@ async def handle_rename(client: Client, message: Message):
         if len(new_title) > 255:
             new_title = new_title[:255]
 
+        chat_id = message.chat.id
+        chat_state = get_chat_state_cache()
+        chat_state.observe_title(chat_id, message.chat.title)
+        if chat_state.is_current_title(chat_id, new_title):
+            logger.info(f"Chat {chat_id} title is already '{new_title.strip()}', skipping rename")
+            await message.delete()
+            return
+
         await message.delete()
 
-        chat_id = message.chat.id
         logger.info(
             f"Bot about to rename chat {chat_id} to: '{new_title}' - "
             f"This will generate a service message"
@@ -99,6 +88,7 @@ async def handle_rename(client: Client, message: Message):
         # set_chat_title generates a service message, but Pyrogram doesn't deliver
         # it back to the bot's handlers, so we need to find and delete it manually
         await client.set_chat_title(chat_id, new_title.strip())
+        chat_state.set_title(chat_id, new_title)
 
         logger.info(
             f"Chat {chat_id} renamed to: {new_title} - "
@@ -107,10 +97,12 @@ async def handle_rename(client: Client, message: Message):
 
         # The service message is created after set_chat_title, we need to fetch
         # recent messages and delete the service message
+        service_message_id = None
         try:
             # Get the most recent message (should be the service message)
             async for msg in client.get_chat_history(chat_id, limit=1):
                 if msg.service and msg.service == MessageServiceType.NEW_CHAT_TITLE:
+                    service_message_id = msg.id
                     await msg.delete()
                     logger.info(
                         f"Successfully deleted service message (id: {msg.id}) "
@@ -131,14 +123,23 @@ async def handle_rename(client: Client, message: Message):
         else:
             actor_username = "user"
 
-        _write_rename_to_csv(new_title, actor_username, source_username or actor_username)
+        await get_title_monitor().log_title_change(
+            chat_id,
+            new_title,
+            actor_username,
+            title_source_username=source_username or actor_username,
+            message_id=service_message_id,
+        )
 
     except ChatAdminRequired:
         logger.error(f"Bot lacks admin rights in chat {message.chat.id}")
+        get_permission_cache().mark_denied(message.chat.id)
     except ChatNotModified:
         logger.info(
             f"Chat {message.chat.id} title not modified (already set to same value)"
         )
+        if new_title:
+            get_chat_state_cache().set_title(message.chat.id, new_title)
         await message.delete()
     except Exception as e:
         logger.error(f"Error in rename handler: {str(e)}", exc_info=True)
@@ -149,7 +150,7 @@ def register_handler(client: Client, group: int = 0):
 
     @client.on_message(filters.command("rename") & filters.group, group=group)
     async def rename_wrapper(client: Client, message: Message):
-        await handle_rename(client, message)
+        submit_limited("rename_watcher", message.chat.id, lambda: handle_rename(client, message))
         await message.continue_propagation()
 
     @client.on_message(filters.command(["ренейм", "ренаме"]) & filters.group, group=group)
@@ -157,7 +158,7 @@ def register_handler(client: Client, group: int = 0):
         if random.random() > 0.1:
             await message.continue_propagation()
             return
-        await handle_rename(client, message)
+        submit_limited("rename_watcher", message.chat.id, lambda: handle_rename(client, message))
         await message.continue_propagation()
 
     logger.info("Rename watcher handler registered")
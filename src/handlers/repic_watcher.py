@@ -14,31 +14,108 @@ from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.enums import MessageServiceType, ChatMemberStatus
 from pyrogram.errors import ChatAdminRequired, PhotoInvalidDimensions, PhotoExtInvalid, FloodWait
-from PIL import Image
+from chat_permissions import get_permission_cache
+from chat_state import get_chat_state_cache
+from config import get_settings
+from handlers.registry import is_handler_active
+from handlers.title_monitor import get_actor_username
+from image_worker import extract_sticker_frame, flatten_to_jpeg, run_image_job
+from photo_store import get_photo_store
+from limiter import submit_limited
 
 logger = logging.getLogger(__name__)
 
+# Telegram shows chat photos at most 640x640, larger uploads are downscaled anyway
+CHAT_PHOTO_TARGET_SIZE = 640
 
-def _validate_sticker(sticker) -> bool:
+
+# Расширение скачиваемого файла по типу стикера
+STICKER_EXTENSIONS = {"static": "webp", "animated": "tgs", "video": "webm"}
+
+
+def _sticker_kind(sticker) -> str:
     """
-    Проверяет, что стикер статический (не анимированный, не видео)
+    Тип стикера: static (WebP), animated (TGS) или video (WEBM)
 
     Args:
         sticker: Pyrogram Sticker object
+    """
+    if sticker.is_animated:
+        kind = "animated"
+    elif sticker.is_video:
+        kind = "video"
+    else:
+        kind = "static"
+    logger.info(f"Accepted {kind} sticker: {sticker.file_id}, size: {sticker.width}x{sticker.height}")
+    return kind
+
+
+def _select_download_variant(media, target: int = CHAT_PHOTO_TARGET_SIZE):
+    """
+    Выбирает самый маленький вариант (сам файл или его превью), у которого
+    меньшая сторона не меньше target — фото чата всё равно обрезается и
+    уменьшается до этого размера.
+
+    Args:
+        media: Pyrogram Photo или Document
+        target: минимальная сторона в пикселях
 
     Returns:
-        bool: True если стикер статический, False иначе
+        Объект с file_id для скачивания (media, если подходящего превью нет)
     """
-    if sticker.is_animated:
-        logger.info(f"Rejected animated sticker (file_id: {sticker.file_id})")
-        return False
+    candidates = [
+        thumb for thumb in (media.thumbs or [])
+        if thumb.width and thumb.height and min(thumb.width, thumb.height) >= target
+    ]
+    # У Document нет размеров: он остаётся запасным вариантом
+    width, height = getattr(media, "width", None), getattr(media, "height", None)
+    if width and height and min(width, height) >= target:
+        candidates.append(media)
+    if not candidates:
+        return media
+    return min(candidates, key=lambda variant: (min(variant.width, variant.height), variant.file_size or 0))
+
+
+async def _delete_photo_service_message(client: Client, chat_id: int) -> str | None:
+    """
+    Удаляет служебное сообщение о смене фото, созданное нашим set_chat_photo
+
+    Returns:
+        file_unique_id нового фото чата из служебного сообщения, если оно найдено
+    """
+    try:
+        # Get the most recent message (should be the service message)
+        async for msg in client.get_chat_history(chat_id, limit=1):
+            if msg.service and msg.service == MessageServiceType.NEW_CHAT_PHOTO:
+                await msg.delete()
+                logger.info(
+                    f"Successfully deleted service message (id: {msg.id}) "
+                    f"generated by bot's chat photo change action"
+                )
+                return msg.new_chat_photo.file_unique_id if msg.new_chat_photo else None
+            break
+    except Exception as e:
+        logger.error(
+            f"Failed to delete service message after bot photo change: {str(e)}",
+            exc_info=True
+        )
+    return None
+
+
+def _record_photo(chat_id: int, path: str, message: Message, photo_ids: list):
+    """Сохраняет установленное фото в историю чата (ошибки истории не ломают /repic)"""
+    try:
+        get_photo_store().add(chat_id, path, get_actor_username(message), photo_ids)
+    except Exception as e:
+        logger.error(f"Failed to record photo in history of chat {chat_id}: {str(e)}", exc_info=True)
 
-    if sticker.is_video:
-        logger.info(f"Rejected video sticker (file_id: {sticker.file_id})")
-        return False
 
-    logger.info(f"Accepted static sticker: {sticker.file_id}, size: {sticker.width}x{sticker.height}")
-    return True
+def _photo_tracked(chat_id: int) -> bool:
+    """
+    Можно ли верить кэшу фото чата: его обновляет только title_monitor по
+    служебным сообщениям, так что без него смена фото мимо бота не видна
+    """
+    return is_handler_active("title_monitor", chat_id)
 
 
 async def handle_repic(client: Client, message: Message):
@@ -46,13 +123,16 @@ async def handle_repic(client: Client, message: Message):
     Обработка команды /repic
 
     Объединяет логику:
+    - Проверка прав аккаунта по кэшу (без прав — ни скачивания, ни конвертации, ни запросов к API)
     - Извлечение фото из сообщения/ответа
+    - Пропуск без скачивания, если это фото уже стоит на чате (кэш chat_state)
     - Создание временной директории
-    - Скачивание фото
+    - Скачивание фото (наименьший вариант не меньше CHAT_PHOTO_TARGET_SIZE)
     - Удаление командного сообщения
     - Проверка существования файла
     - Вызов client.set_chat_photo()
     - Удаление служебного сообщения о смене фото
+    - Сохранение фото в историю для /unrepic
     - Логирование
     - Очистка временных файлов в finally
     - Обработка ошибок
@@ -62,6 +142,9 @@ async def handle_repic(client: Client, message: Message):
     media_type = None
     has_sticker = False
     sticker_to_convert = None
+    sticker_kind = None
+    temp_frame_path = None
+    source_unique_id = None
 
     # DEBUG: Log incoming message details
     logger.info(f"[REPIC DEBUG] Command received in chat {message.chat.id}")
@@ -75,6 +158,10 @@ async def handle_repic(client: Client, message: Message):
             logger.info(f"[REPIC DEBUG] Reply document mime_type: {message.reply_to_message.document.mime_type}")
 
     try:
+        if not await get_permission_cache().can_change_info(client, message.chat.id):
+            logger.info(f"Ignoring /repic in chat {message.chat.id}: no right to change chat info")
+            return
+
         # Get photo from message or reply
         photo = None
         media_to_download = None
@@ -88,14 +175,7 @@ async def handle_repic(client: Client, message: Message):
                 logger.info(f"[REPIC DEBUG] Using photo from reply message")
             elif message.reply_to_message.sticker:
                 sticker = message.reply_to_message.sticker
-                if not _validate_sticker(sticker):
-                    #if sticker.is_animated:
-                    #    await message.reply("⚠️ Анимированные стикеры не поддерживаются. Используйте статичные стикеры.")
-                    #elif sticker.is_video:
-                    #    await message.reply("⚠️ Видео-стикеры не поддерживаются. Используйте статичные стикеры.")
-                    logger.warning(f"[REPIC DEBUG] Cannot use animated/video sticker")
-                    await message.delete()
-                    return
+                sticker_kind = _sticker_kind(sticker)
                 media_to_download = sticker
                 media_type = 'sticker'
                 has_sticker = True
@@ -118,14 +198,7 @@ async def handle_repic(client: Client, message: Message):
             logger.info(f"[REPIC DEBUG] Using photo from current message")
         elif message.sticker:
             sticker = message.sticker
-            if not _validate_sticker(sticker):
-                #if sticker.is_animated:
-                #    await message.reply("⚠️ Анимированные стикеры не поддерживаются. Используйте статичные стикеры.")
-                #elif sticker.is_video:
-                #    await message.reply("⚠️ Видео-стикеры не поддерживаются. Используйте статичные стикеры.")
-                logger.warning(f"[REPIC DEBUG] Cannot use animated/video sticker")
-                await message.delete()
-                return
+            sticker_kind = _sticker_kind(sticker)
             media_to_download = sticker
             media_type = 'sticker'
             has_sticker = True
@@ -146,6 +219,15 @@ async def handle_repic(client: Client, message: Message):
             await message.delete()
             return
 
+        # The same source image is already the chat photo: nothing to upload
+        source_unique_id = media_to_download.file_unique_id
+        if _photo_tracked(message.chat.id) and get_chat_state_cache().is_current_photo(
+            message.chat.id, source_unique_id
+        ):
+            logger.info(f"Chat {message.chat.id} photo is already {source_unique_id}, skipping repic")
+            await message.delete()
+            return
+
         # Download the command message
         await message.delete()
 
@@ -167,7 +249,8 @@ async def handle_repic(client: Client, message: Message):
 
         # Generate unique filename
         if has_sticker:
-            temp_sticker_path = os.path.join(temp_dir, f"sticker_{message.chat.id}_{message.id}.webp")
+            extension = STICKER_EXTENSIONS[sticker_kind]
+            temp_sticker_path = os.path.join(temp_dir, f"sticker_{message.chat.id}_{message.id}.{extension}")
             temp_photo_path = os.path.join(temp_dir, f"chat_photo_{message.chat.id}_{message.id}.jpg")
 
             logger.info(f"[REPIC DEBUG] Downloading sticker to: {temp_sticker_path}")
@@ -179,20 +262,29 @@ async def handle_repic(client: Client, message: Message):
                 logger.error(f"Sticker file not found after download: {temp_sticker_path}")
                 return
 
+            image_path = temp_sticker_path
+            if sticker_kind != "static":
+                # Animated and video stickers: a single frame, decoded with a time budget
+                temp_frame_path = os.path.join(temp_dir, f"frame_{message.chat.id}_{message.id}.png")
+                logger.info(f"[REPIC DEBUG] Extracting first frame of {sticker_kind} sticker")
+                if await extract_sticker_frame(
+                    temp_sticker_path, temp_frame_path, sticker_kind, get_settings().sticker_frame_timeout
+                ):
+                    image_path = temp_frame_path
+                elif sticker_to_convert.thumbs:
+                    # Static preview of the sticker
+                    thumb = max(sticker_to_convert.thumbs, key=lambda t: t.width * t.height)
+                    logger.info(f"Using {thumb.width}x{thumb.height} thumbnail of {sticker_kind} sticker instead")
+                    await client.download_media(thumb.file_id, file_name=temp_frame_path)
+                    image_path = temp_frame_path
+                else:
+                    logger.warning(f"Cannot get a frame of {sticker_kind} sticker and it has no thumbnail")
+                    return
+
             try:
-                logger.info(f"[REPIC DEBUG] Converting sticker WebP to JPG")
-                with Image.open(temp_sticker_path) as img:
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                        img = background
-                    elif img.mode != 'RGB':
-                        img = img.convert('RGB')
-
-                    img.save(temp_photo_path, 'JPEG', quality=95)
-                    logger.info(f"[REPIC DEBUG] Sticker converted to JPG: {temp_photo_path}")
+                logger.info(f"[REPIC DEBUG] Converting sticker to JPG")
+                await run_image_job(flatten_to_jpeg, image_path, temp_photo_path)
+                logger.info(f"[REPIC DEBUG] Sticker converted to JPG: {temp_photo_path}")
             except Exception as e:
                 logger.error("Failed to convert sticker to JPG", exc_info=True)
                 #await message.reply("❌ Ошибка конвертации стикера. Попробуйте другой стикер.")
@@ -203,8 +295,15 @@ async def handle_repic(client: Client, message: Message):
             logger.info(f"[REPIC DEBUG] Downloading media to: {temp_photo_path}")
             logger.info(f"[REPIC DEBUG] Download path (absolute): {os.path.abspath(temp_photo_path)}")
 
-            # Download the photo
-            download_result = await client.download_media(media_to_download.file_id, file_name=temp_photo_path)
+            # Download the smallest size that is still enough for a chat photo
+            variant = _select_download_variant(media_to_download)
+            if variant is not media_to_download:
+                saved = (media_to_download.file_size or 0) - (variant.file_size or 0)
+                logger.info(
+                    f"Downloading {variant.width}x{variant.height} variant instead of the original "
+                    f"for chat {message.chat.id}, {saved} bytes saved"
+                )
+            download_result = await client.download_media(variant.file_id, file_name=temp_photo_path)
 
             # DEBUG: Log download result
             logger.info(f"[REPIC DEBUG] Media downloaded successfully")
@@ -233,24 +332,13 @@ async def handle_repic(client: Client, message: Message):
         # it back to the bot's handlers, so we need to find and delete it manually
         await client.set_chat_photo(chat_id, photo=temp_photo_path)
         logger.info(f"Chat {chat_id} photo updated with: {temp_photo_path}")
-        
+
         # The service message is created after set_chat_photo, we need to fetch
         # recent messages and delete the service message
-        try:
-            # Get the most recent message (should be the service message)
-            async for msg in client.get_chat_history(chat_id, limit=1):
-                if msg.service and msg.service == MessageServiceType.NEW_CHAT_PHOTO:
-                    await msg.delete()
-                    logger.info(
-                        f"Successfully deleted service message (id: {msg.id}) "
-                        f"generated by bot's chat photo change action"
-                    )
-                break
-        except Exception as e:
-            logger.error(
-                f"Failed to delete service message after bot photo change: {str(e)}", 
-                exc_info=True
-            )
+        new_photo_id = await _delete_photo_service_message(client, chat_id)
+        # The chat photo is stored as a new file: remember its id too
+        get_chat_state_cache().set_photo(chat_id, [source_unique_id, new_photo_id])
+        _record_photo(chat_id, temp_photo_path, message, [source_unique_id, new_photo_id])
 
     except FloodWait as e:
         logger.warning(f"FloodWait error: need to wait {e.value} seconds before retrying")
@@ -259,6 +347,8 @@ async def handle_repic(client: Client, message: Message):
         try:
             await client.set_chat_photo(message.chat.id, photo=temp_photo_path)
             logger.info(f"Chat {message.chat.id} photo updated with: {temp_photo_path} (after FloodWait retry)")
+            get_chat_state_cache().set_photo(message.chat.id, [source_unique_id])
+            _record_photo(message.chat.id, temp_photo_path, message, [source_unique_id])
             
             # Delete service message after retry
             try:
@@ -279,6 +369,7 @@ async def handle_repic(client: Client, message: Message):
             logger.error(f"Failed to set chat photo after FloodWait retry: {str(e)}", exc_info=True)
     except ChatAdminRequired:
         logger.error(f"Bot lacks admin rights in chat {message.chat.id}")
+        get_permission_cache().mark_denied(message.chat.id)
     except PhotoInvalidDimensions:
         logger.error(f"Invalid photo dimensions for chat {message.chat.id}")
     except PhotoExtInvalid:
@@ -302,12 +393,62 @@ async def handle_repic(client: Client, message: Message):
             except Exception as e:
                 logger.warning(f"Failed to remove temp sticker file {temp_sticker_path}: {str(e)}")
 
+        if temp_frame_path and os.path.exists(temp_frame_path):
+            try:
+                os.remove(temp_frame_path)
+                logger.debug(f"Temp frame file removed: {temp_frame_path}")
+            except Exception as e:
+                logger.warning(f"Failed to remove temp frame file {temp_frame_path}: {str(e)}")
+
+
+async def handle_unrepic(client: Client, message: Message):
+    """
+    Обработка команды /unrepic — вернуть предыдущее фото чата
+
+    Фото берётся из локальной истории (photo_store), без скачивания. Повторный
+    /unrepic откатывает ещё на шаг назад. Если фото после нашего последнего
+    /repic сменили вручную, возвращается фото из последнего /repic.
+    """
+    chat_id = message.chat.id
+    try:
+        if not await get_permission_cache().can_change_info(client, chat_id):
+            logger.info(f"Ignoring /unrepic in chat {chat_id}: no right to change chat info")
+            return
+
+        store = get_photo_store()
+        chat_state = get_chat_state_cache()
+        current_ids = chat_state.get(chat_id).photo_ids if _photo_tracked(chat_id) else None
+        target = store.restore_target(chat_id, current_ids)
+        if target is None:
+            logger.info(f"No previous photo to restore in chat {chat_id}")
+            await message.delete()
+            return
+
+        blob = store.blob_path(target["sha256"])
+        if not os.path.exists(blob):
+            logger.error(f"Photo {target['sha256']} of chat {chat_id} is missing from the blob store")
+            await message.delete()
+            return
+
+        await message.delete()
+        await client.set_chat_photo(chat_id, photo=blob)
+        new_photo_id = await _delete_photo_service_message(client, chat_id)
+        store.rollback(chat_id, target, [new_photo_id])
+        chat_state.set_photo(chat_id, target["photo_ids"])
+        logger.info(f"Chat {chat_id} photo restored to {target['sha256'][:12]} from {target['timestamp']}")
+
+    except ChatAdminRequired:
+        logger.error(f"Bot lacks admin rights in chat {chat_id}")
+        get_permission_cache().mark_denied(chat_id)
+    except Exception as e:
+        logger.error(f"Error in unrepic handler: {str(e)}", exc_info=True)
+
 
 def register_handler(client: Client, group: int = 0):
     """Регистрация обработчика команды /repic"""
     @client.on_message(filters.command("repic") & filters.group, group=group)
     async def repic_wrapper(client: Client, message: Message):
-        await handle_repic(client, message)
+        submit_limited("repic_watcher", message.chat.id, lambda: handle_repic(client, message))
         await message.continue_propagation()
 
     @client.on_message(filters.command("репик") & filters.group, group=group)
@@ -315,7 +456,12 @@ def register_handler(client: Client, group: int = 0):
         if random.random() > 0.1:
             await message.continue_propagation()
             return
-        await handle_repic(client, message)
+        submit_limited("repic_watcher", message.chat.id, lambda: handle_repic(client, message))
+        await message.continue_propagation()
+
+    @client.on_message(filters.command("unrepic") & filters.group, group=group)
+    async def unrepic_wrapper(client: Client, message: Message):
+        submit_limited("repic_watcher", message.chat.id, lambda: handle_unrepic(client, message))
         await message.continue_propagation()
 
     logger.info("Repic watcher handler registered")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Title Backfill Plugin
+Команда /backfill: заполнение истории названий по старым сообщениям чата.
+
+Задача идёт в фоне: страницами проходит get_chat_history от новых сообщений
+к старым, выбирает служебные NEW_CHAT_TITLE и пачкой пишет их в историю
+названий (дубликаты отсекаются по message_id). После каждой страницы
+сохраняется контрольная точка, так что после рестарта /backfill продолжит
+с того же места. Между страницами выдерживается пауза, FloodWait ждём.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Dict
+
+from pyrogram import Client, filters
+from pyrogram.types import Message
+from pyrogram.enums import MessageServiceType
+from pyrogram.errors import FloodWait
+from config import get_settings
+from handlers.title_monitor import TitleMonitor, get_title_monitor
+
+logger = logging.getLogger(__name__)
+
+# chat_id -> running backfill job
+_jobs: Dict[int, "TitleBackfill"] = {}
+
+
+class TitleBackfill:
+    """Resumable scan of one chat's history for NEW_CHAT_TITLE service messages"""
+
+    def __init__(self, client: Client, chat_id: int, monitor: TitleMonitor,
+                 page_size: int = 100, page_delay: float = 1.0):
+        self.client = client
+        self.chat_id = chat_id
+        self.monitor = monitor
+        self.page_size = page_size
+        self.page_delay = page_delay
+        self.checkpoint_file = os.path.join(monitor.data_dir, "title_backfill", f"{chat_id}.json")
+        self.state = self._load_checkpoint()
+        self.task: asyncio.Task | None = None
+
+    def _load_checkpoint(self) -> dict:
+        state = {"offset_id": 0, "scanned": 0, "found": 0, "done": False}
+        try:
+            if os.path.exists(self.checkpoint_file):
+                with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                    state.update(json.load(f))
+        except Exception as e:
+            logger.warning(f"Failed to read backfill checkpoint {self.checkpoint_file}: {str(e)}")
+        return state
+
+    def _save_checkpoint(self):
+        try:
+            os.makedirs(os.path.dirname(self.checkpoint_file), exist_ok=True)
+            temp_file = self.checkpoint_file + ".tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(temp_file, self.checkpoint_file)
+        except Exception as e:
+            logger.error(f"Failed to save backfill checkpoint: {str(e)}", exc_info=True)
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self) -> asyncio.Task:
+        """Start the scan as a background task (live handlers are not blocked)"""
+        if not self.running:
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def _fetch_page(self) -> list[Message]:
+        """Next page of history older than the checkpoint, waiting out FloodWait"""
+        while True:
+            try:
+                return [
+                    msg async for msg in self.client.get_chat_history(
+                        self.chat_id, limit=self.page_size, offset_id=self.state["offset_id"]
+                    )
+                ]
+            except FloodWait as e:
+                logger.warning(f"Backfill in chat {self.chat_id}: FloodWait {e.value}s")
+                await asyncio.sleep(e.value)
+
+    async def run(self):
+        """Scan pages until the beginning of the chat"""
+        logger.info(f"Title backfill started in chat {self.chat_id} from offset_id={self.state['offset_id']}")
+        try:
+            while not self.state["done"]:
+                page = await self._fetch_page()
+                if not page:
+                    self.state["done"] = True
+                    self._save_checkpoint()
+                    break
+
+                records = [
+                    TitleMonitor.record_from_message(msg)
+                    for msg in page
+                    if msg.service == MessageServiceType.NEW_CHAT_TITLE and msg.new_chat_title
+                ]
+                written = self.monitor.write_many(self.chat_id, records) if records else 0
+
+                self.state["offset_id"] = page[-1].id
+                self.state["scanned"] += len(page)
+                self.state["found"] += written
+                self._save_checkpoint()
+
+                await asyncio.sleep(self.page_delay)
+
+            logger.info(
+                f"Title backfill finished in chat {self.chat_id}: "
+                f"scanned={self.state['scanned']}, found={self.state['found']}"
+            )
+        except asyncio.CancelledError:
+            logger.info(f"Title backfill in chat {self.chat_id} interrupted at offset_id={self.state['offset_id']}")
+            raise
+        except Exception as e:
+            logger.error(f"Title backfill failed in chat {self.chat_id}: {str(e)}", exc_info=True)
+
+
+async def handle_backfill(client: Client, message: Message):
+    """
+    Обработка команды /backfill
+
+    Запускает (или продолжает с контрольной точки) фоновый проход по истории
+    чата; повторный вызов во время работы показывает прогресс.
+    """
+    try:
+        # Проверка: команда доступна только для @vvzvlad
+        if not message.from_user or message.from_user.username != "vvzvlad":
+            logger.info(
+                f"Backfill command ignored: user {message.from_user.username if message.from_user else 'unknown'} "
+                f"is not authorized"
+            )
+            return
+
+        chat_id = message.chat.id
+        job = _jobs.get(chat_id)
+        if job and job.running:
+            await message.reply_text(
+                f"⏳ Загрузка истории идёт: просмотрено {job.state['scanned']} сообщений, "
+                f"найдено {job.state['found']} переименований"
+            )
+            return
+
+        settings = get_settings()
+        job = TitleBackfill(
+            client,
+            chat_id,
+            get_title_monitor(),
+            page_size=settings.title_backfill_page_size,
+            page_delay=settings.title_backfill_page_delay,
+        )
+        if job.state["done"]:
+            await message.reply_text(
+                f"✅ История уже загружена: найдено {job.state['found']} переименований"
+            )
+            return
+
+        _jobs[chat_id] = job
+        job.start()
+        await message.reply_text("⏳ Загрузка истории переименований запущена")
+
+    except Exception as e:
+        logger.error(f"Error in backfill handler: {str(e)}", exc_info=True)
+
+
+def register_handler(client: Client, group: int = 0):
+    """Регистрация обработчика команды /backfill"""
+
+    @client.on_message(filters.command("backfill") & filters.group, group=group)
+    async def backfill_wrapper(client: Client, message: Message):
+        await handle_backfill(client, message)
+        await message.continue_propagation()
+
+    logger.info("Title backfill handler registered")
@@ -2,21 +2,40 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import bisect
 import csv
+import heapq
 import os
 from datetime import datetime
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.enums import MessageServiceType
-from config import get_settings, now_in_app_timezone
+from chat_state import get_chat_state_cache
+from config import get_app_timezone, get_settings, now_in_app_timezone
+from title_index import HistoryQuery, TitleIndex
 
 logger = logging.getLogger(__name__)
 
+CSV_HEADER = ['timestamp', 'new_title', 'changed_by_username', 'title_source_username', 'message_id']
+
+# Rows logged live carry the time the bot handled the change, not the service
+# message date, so a backfilled copy of a row without message_id is matched
+# by title and author within this many seconds
+DEDUPE_WINDOW_SECONDS = 10
+
 # Global instance
 _instance = None
 
 def get_title_monitor():
-    """Get the global TitleMonitor instance"""
+    """Get the global TitleMonitor instance (created on first use)"""
+    global _instance
+    if _instance is None:
+        settings = get_settings()
+        _instance = TitleMonitor(
+            data_dir=settings.session_path,
+            legacy_chat_id=settings.title_history_legacy_chat_id,
+        )
+        logger.info("Title monitor initialized")
     return _instance
 
 def set_title_monitor(monitor):
@@ -25,40 +44,148 @@ def set_title_monitor(monitor):
     _instance = monitor
 
 
+def get_actor_username(message: Message) -> str:
+    """Username of whoever sent the message (bots without username: first_name or "bot")"""
+    changed_by_username = ""
+    if message.from_user:
+        changed_by_username = message.from_user.username or ""
+        if not changed_by_username and message.from_user.is_bot:
+            # For bots without username, use first_name or "bot"
+            changed_by_username = message.from_user.first_name or "bot"
+    return changed_by_username
+
+
 class TitleMonitor:
-    """Monitor for tracking chat title changes and saving them to CSV"""
-    
-    def __init__(self, data_dir: str = "data"):
+    """
+    Monitor for tracking chat title changes and saving them to CSV
+
+    Every chat has its own partition (title_history/<chat_id>.csv), loaded
+    into memory on first access and kept sorted by timestamp, so /history in
+    one chat never reads other chats' records.
+
+    The pre-partition chat_title_changes.csv has no chat id. If
+    TITLE_HISTORY_LEGACY_CHAT_ID is set its rows are moved into that chat's
+    partition; otherwise they stay in the legacy file and are shown in every
+    chat, as before partitioning.
+
+    /history filters are served by a per-chat TitleIndex, built on the first
+    search in that chat and updated on every append.
+    """
+
+    def __init__(self, data_dir: str = "data", legacy_chat_id: int | None = None):
         self.data_dir = data_dir
+        self.partition_dir = os.path.join(data_dir, "title_history")
         self.csv_file = os.path.join(data_dir, "chat_title_changes.csv")
+        # chat_id -> records sorted by timestamp (oldest first); None is the legacy file
+        self._partitions: dict[int | None, list[dict]] = {}
+        # chat_id -> message ids already stored
+        self._known_message_ids: dict[int | None, set[int]] = {}
+        # chat_id -> search index (only for chats that were searched)
+        self._indexes: dict[int, TitleIndex] = {}
         self._ensure_data_directory()
-        self._initialize_csv()
-    
+        self._initialize_legacy_csv(legacy_chat_id)
+
     def _ensure_data_directory(self):
         """Ensure the data directory exists"""
         try:
-            os.makedirs(self.data_dir, exist_ok=True)
-            logger.debug(f'Data directory created/verified: {self.data_dir}')
+            os.makedirs(self.partition_dir, exist_ok=True)
+            logger.debug(f'Data directory created/verified: {self.partition_dir}')
         except Exception as e:
-            logger.error(f'Failed to create data directory {self.data_dir}: {str(e)}')
+            logger.error(f'Failed to create data directory {self.partition_dir}: {str(e)}')
             raise
-    
-    def _initialize_csv(self):
-        """Initialize CSV file with headers if it doesn't exist"""
+
+    def _initialize_legacy_csv(self, legacy_chat_id: int | None):
+        """Upgrade the legacy CSV header and move its rows to a partition if configured"""
         try:
             if not os.path.exists(self.csv_file):
-                with open(self.csv_file, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['timestamp', 'new_title', 'changed_by_username'])
-                logger.info(f'Created new CSV file: {self.csv_file}')
+                return
+
+            with open(self.csv_file, 'r', newline='', encoding='utf-8') as f:
+                header = next(csv.reader(f), [])
+            if header != CSV_HEADER:
+                self._migrate_csv()
+
+            if legacy_chat_id is None:
+                logger.warning(
+                    f'Legacy title history {self.csv_file} has no chat ids and is shown in every chat; '
+                    f'set TITLE_HISTORY_LEGACY_CHAT_ID to move it to its chat'
+                )
+                return
+
+            with open(self.csv_file, 'r', newline='', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+            self.write_many(legacy_chat_id, rows, dedupe=False)
+            os.replace(self.csv_file, self.csv_file + '.migrated')
+            logger.info(f'Moved {len(rows)} legacy title changes to chat {legacy_chat_id}')
         except Exception as e:
-            logger.error(f'Failed to initialize CSV file: {str(e)}')
+            logger.error(f'Failed to initialize legacy CSV file: {str(e)}')
             raise
-    
+
+    def _migrate_csv(self):
+        """
+        Rewrite the legacy CSV with the current header.
+
+        Older files have 3 columns (written by the monitor) or 4 columns
+        (written by /rename), sometimes mixed in one file; rows are padded
+        positionally to CSV_HEADER.
+        """
+        with open(self.csv_file, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))[1:]
+
+        temp_file = self.csv_file + '.tmp'
+        with open(temp_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for row in rows:
+                writer.writerow((row + [''] * len(CSV_HEADER))[:len(CSV_HEADER)])
+        os.replace(temp_file, self.csv_file)
+        logger.info(f'Migrated CSV file to current header: {self.csv_file} ({len(rows)} rows)')
+
+    def _partition_file(self, chat_id: int | None) -> str:
+        if chat_id is None:
+            return self.csv_file
+        return os.path.join(self.partition_dir, f"{chat_id}.csv")
+
+    def _load_partition(self, chat_id: int | None) -> list[dict]:
+        """Records of one chat sorted by timestamp, read from disk once"""
+        if chat_id not in self._partitions:
+            records = []
+            path = self._partition_file(chat_id)
+            if os.path.exists(path):
+                with open(path, 'r', newline='', encoding='utf-8') as f:
+                    for row in csv.DictReader(f):
+                        records.append({key: row.get(key) or '' for key in CSV_HEADER})
+            records.sort(key=lambda x: x['timestamp'])
+            self._partitions[chat_id] = records
+            self._known_message_ids[chat_id] = {
+                int(record['message_id']) for record in records if record['message_id']
+            }
+        return self._partitions[chat_id]
+
+    def _append(self, chat_id: int, records: list[dict]):
+        """Append records to the chat's partition file and in-memory list"""
+        partition = self._load_partition(chat_id)
+        path = self._partition_file(chat_id)
+        write_header = not os.path.exists(path)
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_HEADER)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(records)
+
+        known = self._known_message_ids[chat_id]
+        index = self._indexes.get(chat_id)
+        for record in records:
+            bisect.insort(partition, record, key=lambda x: x['timestamp'])
+            if record.get('message_id'):
+                known.add(int(record['message_id']))
+            if index is not None:
+                index.add(record)
+
     async def handle_title_change(self, message: Message):
         """
         Handle chat title change events
-        
+
         Args:
             client: Pyrogram client instance
             message: Message object containing service message about title change
@@ -67,97 +194,241 @@ class TitleMonitor:
             # Check if this is a service message about new chat title
             if not message.service:
                 return
-            
+
             if message.service != MessageServiceType.NEW_CHAT_TITLE:
                 return
-            
+
             # Extract information
             new_title = message.new_chat_title
-            
+
             # Get username - handle both user and bot changes
-            changed_by_username = ""
-            if message.from_user:
-                changed_by_username = message.from_user.username or ""
-                if not changed_by_username and message.from_user.is_bot:
-                    # For bots without username, use first_name or "bot"
-                    changed_by_username = message.from_user.first_name or "bot"
-            
+            changed_by_username = get_actor_username(message)
+
             # Get current timestamp in app timezone (TZ env)
             timestamp = now_in_app_timezone().isoformat()
-            
+
             # Write to CSV
-            self._write_to_csv(timestamp, new_title, changed_by_username)
-            
+            self._write_to_csv(message.chat.id, timestamp, new_title, changed_by_username, message_id=message.id)
+
             logger.info(
-                f"Title change monitored: new_title='{new_title}', "
+                f"Title change monitored in chat {message.chat.id}: new_title='{new_title}', "
                 f"changed_by=@{changed_by_username if changed_by_username else 'unknown'}"
             )
-            
+
         except Exception as e:
             logger.error(f"Error handling title change: {str(e)}", exc_info=True)
-    
-    async def log_title_change(self, new_title: str, changed_by_username: str):
+
+    async def log_title_change(
+        self,
+        chat_id: int,
+        new_title: str,
+        changed_by_username: str,
+        title_source_username: str = "",
+        message_id: int | None = None,
+    ):
         """
-        Directly log a title change (used by chat_manager when service message is deleted)
-        
+        Directly log a title change (used by rename_watcher when service message is deleted)
+
         Args:
+            chat_id: Chat the title was changed in
             new_title: New chat title
             changed_by_username: Username of who changed the title
+            title_source_username: Username whose message became the title
+            message_id: ID of the service message, if known
         """
         try:
             timestamp = now_in_app_timezone().isoformat()
-            self._write_to_csv(timestamp, new_title, changed_by_username)
+            self._write_to_csv(chat_id, timestamp, new_title, changed_by_username, title_source_username, message_id)
             logger.info(
-                f"Title change logged directly: new_title='{new_title}', "
+                f"Title change logged directly in chat {chat_id}: new_title='{new_title}', "
                 f"changed_by=@{changed_by_username if changed_by_username else 'unknown'}"
             )
         except Exception as e:
             logger.error(f"Error logging title change: {str(e)}", exc_info=True)
-    
-    def _write_to_csv(self, timestamp: str, new_title: str, changed_by_username: str):
-        """Write a title change record to the CSV file"""
+
+    def _write_to_csv(
+        self,
+        chat_id: int,
+        timestamp: str,
+        new_title: str,
+        changed_by_username: str,
+        title_source_username: str = "",
+        message_id: int | None = None,
+    ):
+        """Write a title change record to the chat's CSV partition"""
         try:
-            with open(self.csv_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([timestamp, new_title, changed_by_username])
+            self._append(chat_id, [{
+                'timestamp': timestamp,
+                'new_title': new_title,
+                'changed_by_username': changed_by_username,
+                'title_source_username': title_source_username,
+                'message_id': str(message_id) if message_id else '',
+            }])
         except Exception as e:
             logger.error(f"Failed to write to CSV: {str(e)}", exc_info=True)
-    
-    def get_history(self, limit: int = 10):
+
+    def write_many(self, chat_id: int, records: list[dict], dedupe: bool = True) -> int:
+        """
+        Bulk-append title changes of one chat, skipping changes already stored
+
+        A change counts as stored if its message_id is already in the partition,
+        or, when either side has no message_id (legacy rows, rows logged before
+        ids were kept), if a row with the same title and author is within
+        DEDUPE_WINDOW_SECONDS of it.
+
+        Args:
+            chat_id: Chat the records belong to
+            records: dicts with CSV_HEADER keys
+            dedupe: skip records that are already stored
+
+        Returns:
+            Number of records actually written
+        """
+        self._load_partition(chat_id)
+        known = self._known_message_ids[chat_id]
+        existing = self._dedupe_keys(self._history_records(chat_id)) if dedupe else {}
+        fresh = []
+        seen = set()
+        for record in records:
+            record = {key: str(record.get(key) or '') for key in CSV_HEADER}
+            message_id = int(record['message_id']) if record['message_id'] else None
+            if dedupe and message_id is not None and (message_id in known or message_id in seen):
+                continue
+            if dedupe and self._is_stored(existing, record):
+                continue
+            if message_id is not None:
+                seen.add(message_id)
+            fresh.append(record)
+            if dedupe:
+                self._dedupe_keys([record], existing)
+
+        if fresh:
+            self._append(chat_id, fresh)
+        return len(fresh)
+
+    @staticmethod
+    def _parse_timestamp(value: str) -> datetime | None:
+        """Parse a stored timestamp; naive ones (old rows) are taken as app timezone"""
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=get_app_timezone())
+        return parsed
+
+    def _dedupe_keys(self, records: list[dict], keys: dict | None = None) -> dict:
+        """(new_title, changed_by_username) -> [(timestamp, has message_id)] of the records"""
+        keys = {} if keys is None else keys
+        for record in records:
+            timestamp = self._parse_timestamp(record['timestamp'])
+            if timestamp is not None:
+                keys.setdefault((record['new_title'], record['changed_by_username']), []).append(
+                    (timestamp, bool(record['message_id']))
+                )
+        return keys
+
+    def _is_stored(self, keys: dict, record: dict) -> bool:
+        """Whether a row without message_id on either side matches the record by title, author and time"""
+        timestamp = self._parse_timestamp(record['timestamp'])
+        if timestamp is None:
+            return False
+        has_id = bool(record['message_id'])
+        return any(
+            not (has_id and other_has_id)
+            and abs((timestamp - other).total_seconds()) <= DEDUPE_WINDOW_SECONDS
+            for other, other_has_id in keys.get((record['new_title'], record['changed_by_username']), ())
+        )
+
+    @staticmethod
+    def record_from_message(message: Message) -> dict:
+        """Build a CSV record from a NEW_CHAT_TITLE service message found in chat history"""
+        return {
+            'timestamp': message.date.astimezone(get_app_timezone()).isoformat(),
+            'new_title': message.new_chat_title,
+            'changed_by_username': get_actor_username(message),
+            'title_source_username': '',
+            'message_id': message.id,
+        }
+
+    def _history_records(self, chat_id: int) -> list[dict]:
+        """All records visible in a chat, oldest first"""
+        partition = self._load_partition(chat_id)
+        if os.path.exists(self.csv_file):
+            # Legacy records without chat id are shown in every chat
+            return list(heapq.merge(partition, self._load_partition(None), key=lambda x: x['timestamp']))
+        return partition
+
+    def _get_index(self, chat_id: int) -> TitleIndex:
+        if chat_id not in self._indexes:
+            self._indexes[chat_id] = TitleIndex(self._history_records(chat_id))
+            logger.debug(f'Title index built for chat {chat_id}: {len(self._indexes[chat_id])} records')
+        return self._indexes[chat_id]
+
+    def count_history(self, chat_id: int) -> int:
+        """Количество записей в истории чата"""
+        return len(self._history_records(chat_id))
+
+    def get_history(self, chat_id: int, limit: int = 10, offset: int = 0):
         """
         Получить историю изменений названия чата
-        
+
         Args:
+            chat_id: ID чата, историю которого нужно вернуть
             limit: Максимальное количество записей для возврата (по умолчанию 10)
-        
+            offset: Сколько самых новых записей пропустить (для постраничного вывода)
+
         Returns:
-            Список словарей с ключами: timestamp, new_title, changed_by_username
+            Список словарей с ключами: timestamp, new_title, changed_by_username, title_source_username
             Сортировка: от новых к старым
         """
+        return self.search_history(chat_id, HistoryQuery(), limit=limit, offset=offset)[0]
+
+    def search_history(self, chat_id: int, query: HistoryQuery, limit: int = 10, offset: int = 0):
+        """
+        Найти записи истории чата по фильтрам
+
+        Args:
+            chat_id: ID чата
+            query: фильтры (пользователь, подстрока, период)
+            limit: Максимальное количество записей для возврата (0 — все)
+            offset: Сколько самых новых подходящих записей пропустить
+
+        Returns:
+            (записи в формате get_history(), всего подходящих записей)
+        """
         try:
-            if not os.path.exists(self.csv_file):
-                logger.warning(f"CSV file not found: {self.csv_file}")
-                return []
-            
-            history = []
-            with open(self.csv_file, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    history.append({
-                        'timestamp': row['timestamp'],
-                        'new_title': row['new_title'],
-                        'changed_by_username': row['changed_by_username']
-                    })
-            
-            # Сортировка от новых к старым
-            history.sort(key=lambda x: x['timestamp'], reverse=True)
-            
-            # Применить лимит
-            if limit > 0:
-                history = history[:limit]
-            
-            return history
-            
+            offset = max(offset, 0)
+            if query.text or query.username:
+                found = self._get_index(chat_id).search(query)
+                total = len(found)
+                history = found[offset:offset + limit] if limit > 0 else found[offset:]
+            else:
+                records = self._history_records(chat_id)
+                if query.since:
+                    # Records are sorted by timestamp: the period is a contiguous slice
+                    key = lambda x: x['timestamp']
+                    records = records[
+                        bisect.bisect_left(records, query.since, key=key):
+                        bisect.bisect_right(records, query.until + '\uffff', key=key)
+                    ]
+                total = len(records)
+
+                # Срез [offset, offset + limit) от новых к старым без копирования всей истории
+                end = max(total - offset, 0)
+                start = max(end - limit, 0) if limit > 0 else 0
+                history = records[start:end][::-1]
+
+            return [
+                {
+                    'timestamp': record['timestamp'],
+                    'new_title': record['new_title'],
+                    'changed_by_username': record['changed_by_username'],
+                    'title_source_username': record['title_source_username'],
+                }
+                for record in history
+            ], total
+
         except Exception as e:
             logger.error(f"Failed to read history from CSV: {str(e)}", exc_info=True)
             raise
@@ -165,18 +436,20 @@ class TitleMonitor:
 
 def register_handler(client: Client, group: int = 0):
     """Регистрация обработчика мониторинга изменений названия чата"""
-    if get_title_monitor() is None:
-        settings = get_settings()
-        monitor = TitleMonitor(data_dir=settings.get("session_path", "data"))
-        set_title_monitor(monitor)
-        logger.info("Title monitor initialized")
+    get_title_monitor()
 
     @client.on_message(filters.service & filters.group, group=group)
     async def title_monitor_wrapper(client: Client, message: Message):
         if message.service == MessageServiceType.NEW_CHAT_TITLE:
+            get_chat_state_cache().set_title(message.chat.id, message.new_chat_title)
             title_monitor = get_title_monitor()
             if title_monitor:
                 await title_monitor.handle_title_change(message)
+        elif message.service == MessageServiceType.NEW_CHAT_PHOTO:
+            photo = message.new_chat_photo
+            get_chat_state_cache().set_photo(message.chat.id, [photo.file_unique_id if photo else None])
+        elif message.service == MessageServiceType.DELETE_CHAT_PHOTO:
+            get_chat_state_cache().set_photo(message.chat.id, [])
 
         await message.continue_propagation()
 
@@ -5,25 +5,33 @@
 UK Inline Watcher
 Выбирает для пользователя "статью дня" по inline-запросу.
 
-Алгоритм детерминирован по дате и user_id (без рандома):
-1. day_hash   = sha256(utc_midnight_unix_ts)
-2. user_hash  = sha256(user.id)
-3. seed       = xor_distance(day_hash, user_hash)
-4. Для каждой статьи считаем article_hash = sha256(название_статьи)
-5. Выбираем статью с минимальным XOR(seed, article_hash[:16])
+Алгоритм детерминирован по дате и user_id (без рандома), см. xor_selector:
+1. day_key     = первые 8 байт sha256(midnight_unix_ts)
+2. user_key    = первые 8 байт sha256(user.id)
+3. seed        = day_key XOR user_key
+4. article_key = первые 8 байт sha256(название_статьи)
+5. Выбираем статью с минимальным XOR(seed, article_key) через XorIndex
+
+Ответ не меняется до полуночи (TZ), поэтому cache_time — время до полуночи
+(не больше MAX_CACHE_TIME), и повторные запросы отвечает кэш Telegram.
 """
 
 from __future__ import annotations
 
-import hashlib
 import logging
+from datetime import time
 
 from pyrogram import Client
 from pyrogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 from config import now_in_app_timezone
+from scheduler import seconds_until
+from xor_selector import XorIndex, digest_key, get_day_key
 
 logger = logging.getLogger(__name__)
 
+# Upper bound for Telegram's cache of the answer, so a changed article list reaches users the same day
+MAX_CACHE_TIME = 3600
+
 
 ARTICLES_RAW = """
 Статья 105. Убийство
@@ -569,53 +577,38 @@ ARTICLES_RAW = """
 ARTICLES = [line.strip() for line in ARTICLES_RAW.splitlines() if line.strip().startswith("Статья")]
 
 
-def get_day_hash() -> str:
-    now_local = now_in_app_timezone()
-    midnight_local = now_local.replace(hour=0, minute=0, second=0, microsecond=0)
-    unix_ts = int(midnight_local.timestamp())
-    return hashlib.sha256(str(unix_ts).encode()).hexdigest()
-
-
-def get_user_hash(user_id: int) -> str:
-    return hashlib.sha256(str(user_id).encode()).hexdigest()
-
-
-def xor_distance(hash_a: str, hash_b: str) -> int:
-    a = int(hash_a[:16], 16)
-    b = int(hash_b[:16], 16)
-    return a ^ b
-
+_article_index: XorIndex[str] | None = None
 
-def select_article_for_user(user_id: int) -> str:
-    day_hash = get_day_hash()
-    user_hash = get_user_hash(user_id)
-    seed = xor_distance(day_hash, user_hash)
 
-    best_article = ARTICLES[0]
-    best_distance = 2**64 - 1
+def get_article_index() -> XorIndex[str]:
+    """XOR-индекс статей, строится один раз при первом запросе"""
+    global _article_index
+    if _article_index is None:
+        _article_index = XorIndex((digest_key(article), article) for article in ARTICLES)
+    return _article_index
 
-    for article in ARTICLES:
-        article_hash = hashlib.sha256(article.encode()).hexdigest()
-        article_bucket = int(article_hash[:16], 16)
-        dist = seed ^ article_bucket
-        if dist < best_distance:
-            best_distance = dist
-            best_article = article
 
-    return best_article
+def select_article_for_user(user_id: int, day_key: int | None = None) -> str:
+    if day_key is None:
+        day_key = get_day_key()
+    seed = day_key ^ digest_key(user_id)
+    return get_article_index().nearest(seed)
 
 
 async def handle_inline(client: Client, inline_query: InlineQuery):
     try:
         user_id = inline_query.from_user.id
-        article = select_article_for_user(user_id)
+        now = now_in_app_timezone()
+        article = select_article_for_user(user_id, get_day_key(now.date()))
+        # Rounded down: the cached answer must expire before midnight
+        cache_time = max(1, min(MAX_CACHE_TIME, int(seconds_until(time(0), now))))
 
         title = "Статья УК дня"
         description = article
         message_text = f"⚖️ Моя статья УК: {article}"
 
         result = InlineQueryResultArticle(
-            id=f"uk-{user_id}",
+            id=f"uk-{user_id}-{now.date().isoformat()}",
             title=title,
             description=description,
             input_message_content=InputTextMessageContent(message_text),
@@ -623,7 +616,7 @@ async def handle_inline(client: Client, inline_query: InlineQuery):
 
         await inline_query.answer(
             results=[result],
-            cache_time=60,
+            cache_time=cache_time,
             is_personal=True,
         )
 
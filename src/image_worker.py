@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Image work off the event loop.
+
+Pillow conversions run in a small thread pool (IMAGE_WORKERS threads) so a big
+image does not stall update dispatch. Animated stickers are reduced to a
+single frame with bounded cost:
+
+- video stickers (WEBM): ffmpeg decodes only the first frame (-frames:v 1) in
+  a subprocess that is killed after STICKER_FRAME_TIMEOUT seconds;
+- animated stickers (TGS, gzipped Lottie JSON): frame 0 is rendered with
+  rlottie-python (in requirements.txt; without it the caller falls back to the
+  sticker thumbnail), in the pool with the same timeout.
+
+Inputs larger than Telegram's own sticker limits are refused before decoding,
+which together with the fixed 512px render size bounds memory use. When a
+frame cannot be extracted the caller falls back to the sticker's thumbnail.
+"""
+
+import asyncio
+import functools
+import gzip
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from PIL import Image
+
+from config import get_settings
+
+try:
+    from rlottie_python import LottieAnimation
+except ImportError:
+    LottieAnimation = None
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows 64 KB TGS and 256 KB WEBM stickers; anything far bigger is not a sticker
+MAX_STICKER_BYTES = 1024 * 1024
+# Decompressed Lottie JSON limit (gzip bomb guard)
+MAX_LOTTIE_JSON_BYTES = 8 * 1024 * 1024
+STICKER_RENDER_SIZE = 512
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_image_executor() -> ThreadPoolExecutor:
+    """Get the image worker pool (created on first use)"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, get_settings().image_workers),
+            thread_name_prefix="image",
+        )
+    return _executor
+
+
+async def run_image_job(func: Callable[..., Any], *args, timeout: float | None = None) -> Any:
+    """
+    Run func(*args) in the image worker pool.
+
+    Raises:
+        asyncio.TimeoutError: the job did not finish in `timeout` seconds
+            (the thread finishes it in the background, the result is dropped)
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_image_executor(), functools.partial(func, *args))
+    if timeout is None:
+        return await future
+    return await asyncio.wait_for(future, timeout)
+
+
+def flatten_to_jpeg(source_path: str, target_path: str, quality: int = 95):
+    """Convert an image to RGB JPEG, putting transparent areas on white"""
+    with Image.open(source_path) as img:
+        if img.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        img.save(target_path, 'JPEG', quality=quality)
+
+
+def _check_input_size(path: str) -> bool:
+    size = os.path.getsize(path)
+    if size > MAX_STICKER_BYTES:
+        logger.warning(f"Refusing to decode {path}: {size} bytes is over the {MAX_STICKER_BYTES} byte limit")
+        return False
+    return True
+
+
+async def extract_video_frame(source_path: str, target_path: str, timeout: float) -> bool:
+    """
+    Decode the first frame of a WEBM sticker to PNG with ffmpeg.
+
+    libvpx-vp9 is tried first because only it keeps the alpha channel; the
+    native decoder is the fallback for ffmpeg builds without libvpx.
+
+    Returns:
+        True if target_path was written
+    """
+    if shutil.which("ffmpeg") is None:
+        logger.warning("ffmpeg is not installed, cannot extract a video sticker frame")
+        return False
+    if not _check_input_size(source_path):
+        return False
+
+    for decoder in (["-c:v", "libvpx-vp9"], []):
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-v", "error", "-y", *decoder, "-i", source_path,
+            "-frames:v", "1", "-vf", f"scale={STICKER_RENDER_SIZE}:-2", target_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logger.warning(f"ffmpeg did not extract a frame from {source_path} in {timeout}s")
+            return False
+        if process.returncode == 0 and os.path.exists(target_path):
+            return True
+        logger.debug(f"ffmpeg {' '.join(decoder) or 'native decoder'} failed: {stderr.decode(errors='replace').strip()}")
+
+    logger.warning(f"ffmpeg could not decode {source_path}")
+    return False
+
+
+def render_lottie_frame(source_path: str, target_path: str, frame: int = 0) -> bool:
+    """
+    Render one frame of a TGS sticker to PNG with rlottie.
+
+    Returns:
+        True if target_path was written, False if rlottie is not installed
+        or the file is not a sane Lottie animation
+    """
+    if LottieAnimation is None:
+        logger.warning("rlottie-python is not installed, cannot render an animated sticker frame")
+        return False
+    if not _check_input_size(source_path):
+        return False
+
+    with gzip.open(source_path, "rb") as f:
+        data = f.read(MAX_LOTTIE_JSON_BYTES + 1)
+    if len(data) > MAX_LOTTIE_JSON_BYTES:
+        logger.warning(f"Refusing to render {source_path}: Lottie JSON is over {MAX_LOTTIE_JSON_BYTES} bytes")
+        return False
+
+    with LottieAnimation.from_data(data.decode("utf-8")) as animation:
+        image = animation.render_pillow_frame(
+            frame_num=frame,
+            width=STICKER_RENDER_SIZE,
+            height=STICKER_RENDER_SIZE,
+        )
+    image.save(target_path, "PNG")
+    return True
+
+
+async def extract_sticker_frame(source_path: str, target_path: str, kind: str, timeout: float) -> bool:
+    """
+    First frame of an animated ("animated" = TGS) or video ("video" = WEBM) sticker as PNG.
+
+    Returns:
+        True if target_path was written
+    """
+    try:
+        if kind == "video":
+            return await extract_video_frame(source_path, target_path, timeout)
+        if kind == "animated":
+            return await run_image_job(render_lottie_frame, source_path, target_path, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Rendering a frame of {source_path} took longer than {timeout}s")
+    except Exception as e:
+        logger.error(f"Failed to extract a frame from {source_path}: {str(e)}", exc_info=True)
+    return False
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Handler concurrency limiter.
+
+Pyrogram runs every matching handler as soon as a worker picks the update up,
+so a burst of identical commands (e.g. many /пидор in one chat) turns into
+many parallel member scans. The limiter caps concurrent invocations per
+handler and per (handler, chat) pair and applies an overflow policy:
+
+- drop  — reject the invocation if no slot is free right now
+- queue — wait for a slot, rejecting once queue_limit callers are waiting
+- merge — attach to an invocation already running for the same chat,
+          otherwise behave like queue; the merged call gets no result, so
+          this is only for idempotent handlers (pidor_watcher by default)
+
+Handler callbacks use submit(): the wait for a slot happens in a task of its
+own. Pyrogram awaits handler callbacks inside its small pool of dispatcher
+workers, so callers queued for one busy chat would otherwise park every
+worker and stop update processing in all chats.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Mapping, Set, Tuple
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("drop", "queue", "merge")
+
+# Global instance
+_instance = None
+
+
+def get_limiter() -> "HandlerLimiter":
+    """Get the global HandlerLimiter instance (created from settings on first use)"""
+    global _instance
+    if _instance is None:
+        settings = get_settings()
+        _instance = HandlerLimiter(
+            max_concurrency=settings.handler_max_concurrency,
+            max_per_chat=settings.handler_max_per_chat,
+            policy=settings.handler_overflow_policy,
+            queue_limit=settings.handler_queue_limit,
+            overrides=settings.handler_limits,
+        )
+    return _instance
+
+
+async def run_limited(name: str, chat_id: int, factory: Callable[[], Awaitable[Any]], **kwargs):
+    """Shortcut for get_limiter().run(...)"""
+    return await get_limiter().run(name, chat_id, factory, **kwargs)
+
+
+def submit_limited(name: str, chat_id: int, factory: Callable[[], Awaitable[Any]], **kwargs) -> asyncio.Task:
+    """Shortcut for get_limiter().submit(...)"""
+    return get_limiter().submit(name, chat_id, factory, **kwargs)
+
+
+class HandlerLimiter:
+    """Per-handler and per-chat concurrency limiter with overflow policies"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_per_chat: int = 1,
+        policy: str = "queue",
+        queue_limit: int = 32,
+        overrides: Mapping[str, Tuple[int | None, str]] | None = None,
+    ):
+        if policy not in POLICIES:
+            logger.warning(f"Unknown overflow policy '{policy}', falling back to 'queue'")
+            policy = "queue"
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_per_chat = max(1, max_per_chat)
+        self.policy = policy
+        self.queue_limit = max(0, queue_limit)
+        self.overrides = overrides or {}
+
+        self._handler_sems: Dict[str, asyncio.Semaphore] = {}
+        self._chat_sems: Dict[Tuple[str, int], asyncio.Semaphore] = {}
+        self._chat_refs: Dict[Tuple[str, int], int] = {}
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        # submit() tasks, including ones still waiting for a slot
+        self._submitted: Set[asyncio.Task] = set()
+        self._closing = False
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def closing(self) -> bool:
+        """True once drain() started: every further invocation is rejected"""
+        return self._closing
+
+    def _limit_for(self, name: str) -> Tuple[int, str]:
+        limit, policy = self.overrides.get(name, (self.max_concurrency, self.policy))
+        if policy not in POLICIES:
+            policy = self.policy
+        return max(1, limit or self.max_concurrency), policy
+
+    def _stats_for(self, name: str) -> Dict[str, int]:
+        if name not in self.stats:
+            self.stats[name] = {
+                "running": 0,
+                "queued": 0,
+                "max_queued": 0,
+                "completed": 0,
+                "rejected": 0,
+                "merged": 0,
+            }
+        return self.stats[name]
+
+    def _handler_sem(self, name: str) -> asyncio.Semaphore:
+        if name not in self._handler_sems:
+            limit, _ = self._limit_for(name)
+            self._handler_sems[name] = asyncio.Semaphore(limit)
+        return self._handler_sems[name]
+
+    def _acquire_chat_ref(self, key: Tuple[str, int], max_per_chat: int | None = None) -> asyncio.Semaphore:
+        if key not in self._chat_sems:
+            self._chat_sems[key] = asyncio.Semaphore(max(1, max_per_chat or self.max_per_chat))
+        self._chat_refs[key] = self._chat_refs.get(key, 0) + 1
+        return self._chat_sems[key]
+
+    def _release_chat_ref(self, key: Tuple[str, int]):
+        self._chat_refs[key] -= 1
+        if self._chat_refs[key] <= 0:
+            # Drop idle per-chat state so the dicts don't grow with every chat ever seen
+            del self._chat_refs[key]
+            del self._chat_sems[key]
+
+    def _reject(self, name: str, chat_id: int, reason: str):
+        stats = self._stats_for(name)
+        stats["rejected"] += 1
+        logger.warning(
+            f"Handler '{name}' invocation in chat {chat_id} rejected ({reason}), "
+            f"queued={stats['queued']}, running={stats['running']}, rejected={stats['rejected']}"
+        )
+
+    async def run(
+        self,
+        name: str,
+        chat_id: int,
+        factory: Callable[[], Awaitable[Any]],
+        policy: str | None = None,
+        max_per_chat: int | None = None,
+    ):
+        """
+        Run factory() under the limits configured for handler `name`.
+
+        Args:
+            name: handler name (module name, e.g. "pidor_watcher")
+            chat_id: chat the update belongs to
+            factory: zero-argument callable returning the handler coroutine;
+                     it is only called when the invocation is actually admitted
+            policy: overflow policy for this call instead of the configured one
+                    (background jobs fanning out distinct calls use "queue")
+            max_per_chat: per-chat limit for `name` if no call holds it yet
+
+        Returns:
+            Result of the coroutine, or None if the invocation was rejected or merged
+            (check `closing` to tell a shutdown from a full queue)
+        """
+        key = (name, chat_id)
+        stats = self._stats_for(name)
+        _, configured_policy = self._limit_for(name)
+        policy = policy if policy in POLICIES else configured_policy
+
+        if self._closing:
+            self._reject(name, chat_id, "shutting down")
+            return None
+
+        if policy == "merge" and key in self._inflight:
+            stats["merged"] += 1
+            logger.debug(f"Handler '{name}' invocation in chat {chat_id} merged into running one")
+            try:
+                await asyncio.shield(self._inflight[key])
+            except Exception:
+                # The leader already logged its own failure
+                pass
+            return None
+
+        handler_sem = self._handler_sem(name)
+        chat_sem = self._acquire_chat_ref(key, max_per_chat)
+        try:
+            if policy == "drop":
+                if handler_sem.locked():
+                    self._reject(name, chat_id, "handler limit reached")
+                    return None
+                if chat_sem.locked():
+                    self._reject(name, chat_id, "chat limit reached")
+                    return None
+            elif stats["queued"] >= self.queue_limit and (handler_sem.locked() or chat_sem.locked()):
+                self._reject(name, chat_id, "queue is full")
+                return None
+
+            stats["queued"] += 1
+            stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+            try:
+                # Chat slot first: a caller stuck behind its own chat must not
+                # hold a handler-wide slot that other chats could use
+                await chat_sem.acquire()
+                try:
+                    await handler_sem.acquire()
+                except BaseException:
+                    chat_sem.release()
+                    raise
+            finally:
+                stats["queued"] -= 1
+
+            if self._closing:
+                # drain() started while we waited: it is not waiting for new work
+                handler_sem.release()
+                chat_sem.release()
+                self._reject(name, chat_id, "shutting down")
+                return None
+
+            try:
+                stats["running"] += 1
+                task = asyncio.ensure_future(factory())
+                self._tasks.add(task)
+                self._inflight[key] = task
+                try:
+                    return await task
+                finally:
+                    self._tasks.discard(task)
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+                    stats["running"] -= 1
+                    stats["completed"] += 1
+            finally:
+                handler_sem.release()
+                chat_sem.release()
+        finally:
+            self._release_chat_ref(key)
+
+    def submit(self, name: str, chat_id: int, factory: Callable[[], Awaitable[Any]], **kwargs) -> asyncio.Task:
+        """
+        Start run(...) in a background task and return it without waiting.
+
+        For handler callbacks: the dispatcher worker that delivered the update
+        is free again at once, whatever the queue of this handler and chat.
+        """
+        task = asyncio.create_task(self.run(name, chat_id, factory, **kwargs))
+        self._submitted.add(task)
+
+        def _done(task: asyncio.Task):
+            self._submitted.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(
+                    f"Handler '{name}' invocation in chat {chat_id} failed: {str(task.exception())}",
+                    exc_info=task.exception(),
+                )
+
+        task.add_done_callback(_done)
+        return task
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stop admitting new invocations and wait for running ones.
+
+        Args:
+            timeout: seconds to wait before cancelling what is still running
+
+        Returns:
+            True if everything finished in time, False if something was cancelled
+        """
+        self._closing = True
+        tasks = self._tasks | self._submitted
+        if not tasks:
+            return True
+
+        logger.info(f"Waiting for {len(tasks)} handler invocations (up to {timeout}s)")
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} handler invocations that missed the shutdown deadline")
+            await asyncio.gather(*pending, return_exceptions=True)
+        return not pending
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Return a snapshot of per-handler counters (queue depth, rejections, merges)"""
+        return {name: dict(values) for name, values in self.stats.items()}
@@ -15,14 +15,9 @@ asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 from telegram_client import TelegramClient
 from config import get_settings, setup_logging
-from handlers import rename_watcher
-from handlers import repic_watcher
-from handlers import title_monitor
-from handlers import service_cleaner
-from handlers import short_reply_watcher
-from handlers import history_viewer
-from handlers import pidor_watcher
-from handlers import uk_inline_watcher
+from limiter import get_limiter
+from scheduler import get_scheduler
+from handlers import registry
 
 logger = logging.getLogger(__name__)
 
@@ -30,10 +25,39 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+def _request_shutdown(shutdown_event: asyncio.Event, sig: signal.Signals):
+    """Signal handler: wake up main() so it can stop cleanly"""
+    logger.info(f"Received {sig.name}, shutting down")
+    shutdown_event.set()
+
+
+async def shutdown(tg_client: TelegramClient):
+    """Drain in-flight handlers and scheduled jobs, then close the client within SHUTDOWN_TIMEOUT"""
+    timeout = settings.shutdown_timeout
+    limiter = get_limiter()
+    await limiter.drain(timeout)
+    logger.info(f"Handler stats: {limiter.get_stats()}")
+    # After the limiter: handlers may still have scheduled delayed messages
+    await get_scheduler().drain(timeout)
+    try:
+        await asyncio.wait_for(tg_client.stop(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Telegram client did not stop within {timeout}s")
+
+
+def flush_logs():
+    """Flush log handlers so nothing is lost when the container stops"""
+    for handler in logging.getLogger().handlers:
+        try:
+            handler.flush()
+        except Exception:
+            pass
+
+
 async def main():
     """Main bot function"""
     
-    setup_logging(settings["log_level"])
+    setup_logging(settings.log_level)
     
     logger.info("Starting Telegram Chat Manager Bot")
     logger.info(f"Using uvloop for async operations")
@@ -41,23 +65,27 @@ async def main():
     # Create shutdown event and client AFTER event loop is running
     shutdown_event = asyncio.Event()
     tg_client = TelegramClient()
+
+    # SIGTERM comes from docker/watchtower and from the reconnect logic's last resort
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, _request_shutdown, shutdown_event, sig)
     
     try:
         # Start Telegram client
         await tg_client.start()
         
-        # Register command handlers
-        title_monitor.register_handler(tg_client.client, group=0)
-
-        rename_watcher.register_handler(tg_client.client, group=0)
-        repic_watcher.register_handler(tg_client.client, group=0)
-        short_reply_watcher.register_handler(tg_client.client, group=0)
-        history_viewer.register_handler(tg_client.client, group=0)
-        pidor_watcher.register_handler(tg_client.client, group=0)
-        uk_inline_watcher.register_handler(tg_client.client, group=0)
-        
-        #service_cleaner.register_handler(tg_client.client, group=1)
-        
+        # Register command handlers (see handlers/registry.py for order and groups)
+        registry.register_handlers(
+            tg_client.client,
+            lazy=settings.lazy_handlers,
+            enabled=settings.enabled_handlers,
+            chat_allowlists=settings.handler_chats,
+        )
+        if settings.lazy_handlers:
+            logger.info("Lazy handler loading enabled")
+        get_scheduler().start()
+
         # Wait for shutdown signal
         await shutdown_event.wait()
         
@@ -68,8 +96,9 @@ async def main():
         sys.exit(1)
     finally:
         logger.info("Shutting down...")
-        await tg_client.stop()
+        await shutdown(tg_client)
         logger.info("Bot stopped")
+        flush_logs()
 
 if __name__ == "__main__":
     # Run the bot
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Member cache and full-roster enumeration for large supergroups.
+
+get_chat_members without a query stops at Telegram's server-side cap (about
+10k members), so in bigger chats a plain listing silently misses everyone
+else. RosterScan first does the plain listing; if it returned at least
+MEMBER_SCAN_THRESHOLD members it is assumed truncated and the scan fans out
+search queries by name prefix ("a", "b", ..., "а", "б", ...), splitting every
+prefix that is itself truncated into longer ones. Queries run concurrently
+through the handler limiter ("member_scan"), results are de-duplicated by user
+id and streamed to an append-only file, and the list of unfinished prefixes is
+checkpointed after every query, so an interrupted scan resumes where it
+stopped. A query the limiter rejects because its queue is full is retried
+with backoff; only a shutdown pauses the scan.
+
+A finished scan replaces the chat's roster in MemberCache (data/member_cache/),
+which answers XOR-nearest queries from an XorIndex without any API calls.
+Bots, deleted accounts and the account itself are never cached. Members whose
+names contain none of the prefix characters are only found by the plain
+listing.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+
+from config import get_settings
+from limiter import get_limiter, run_limited
+from xor_selector import XorIndex, digest_key
+
+logger = logging.getLogger(__name__)
+
+PREFIX_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzабвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+MAX_PREFIX_LENGTH = 4
+
+# Backoff when the limiter's member_scan queue is full (many chats scanning at once)
+REJECT_RETRY_BASE_DELAY = 1.0
+REJECT_RETRY_MAX_DELAY = 60.0
+
+# Global instance
+_instance = None
+
+# chat_id -> running or last scan
+_scans: Dict[int, "RosterScan"] = {}
+
+
+def get_member_cache() -> "MemberCache":
+    """Get the global MemberCache instance (created on first use)"""
+    global _instance
+    if _instance is None:
+        settings = get_settings()
+        _instance = MemberCache(data_dir=settings.session_path, ttl=settings.member_cache_ttl)
+    return _instance
+
+
+@dataclass(frozen=True, slots=True)
+class CachedMember:
+    """The fields of a pyrogram User the handlers need, plus its XOR key"""
+    id: int
+    username: str | None = None
+    first_name: str | None = None
+    last_name: str | None = None
+    key: int = field(default=0, compare=False)
+
+    @classmethod
+    def from_user(cls, user) -> "CachedMember":
+        return cls(user.id, user.username, user.first_name, user.last_name, digest_key(user.id))
+
+    @classmethod
+    def from_json(cls, data: dict) -> "CachedMember":
+        return cls(data["id"], data.get("username"), data.get("first_name"), data.get("last_name"),
+                   digest_key(data["id"]))
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "id": self.id,
+            "username": self.username,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+        }, ensure_ascii=False)
+
+
+def read_members(path: str) -> Dict[int, CachedMember]:
+    """Load an append-only member file, skipping a torn last line"""
+    members: Dict[int, CachedMember] = {}
+    if not os.path.exists(path):
+        return members
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                member = CachedMember.from_json(json.loads(line))
+            except (ValueError, KeyError):
+                continue
+            members.setdefault(member.id, member)
+    return members
+
+
+class ChatRoster:
+    """Complete member list of one chat from the last finished scan"""
+
+    def __init__(self, chat_id: int, members: Dict[int, CachedMember], scanned_at: float):
+        self.chat_id = chat_id
+        self.members = members
+        self.scanned_at = scanned_at
+        self._index: XorIndex[CachedMember] | None = None
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def nearest(self, query: int) -> CachedMember | None:
+        """Member whose key is XOR-nearest to query (index built on first use)"""
+        if self._index is None:
+            # Insert in id order so ties (equal keys) do not depend on scan order
+            self._index = XorIndex((member.key, member) for _, member in sorted(self.members.items()))
+        return self._index.nearest(query)
+
+
+class MemberCache:
+    """Per-chat rosters of finished scans, persisted under data/member_cache"""
+
+    def __init__(self, data_dir: str = "data", ttl: float = 86400.0):
+        self.cache_dir = os.path.join(data_dir, "member_cache")
+        self.ttl = ttl
+        self._rosters: Dict[int, ChatRoster | None] = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, chat_id: int, suffix: str) -> str:
+        return os.path.join(self.cache_dir, f"{chat_id}{suffix}")
+
+    def get_roster(self, chat_id: int) -> ChatRoster | None:
+        """Roster of the last finished scan, or None if the chat was never scanned"""
+        if chat_id not in self._rosters:
+            roster = None
+            try:
+                meta_file = self.path(chat_id, ".json")
+                if os.path.exists(meta_file):
+                    with open(meta_file, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    roster = ChatRoster(chat_id, read_members(self.path(chat_id, ".jsonl")), meta["scanned_at"])
+                    logger.info(f"Member cache for chat {chat_id} loaded: {len(roster)} members")
+            except Exception as e:
+                logger.error(f"Failed to load member cache for chat {chat_id}: {str(e)}", exc_info=True)
+            self._rosters[chat_id] = roster
+        return self._rosters[chat_id]
+
+    def is_fresh(self, roster: ChatRoster) -> bool:
+        return time.time() - roster.scanned_at < self.ttl
+
+    def commit(self, chat_id: int, members_file: str, members: Dict[int, CachedMember]):
+        """Make a finished scan the chat's roster"""
+        scanned_at = time.time()
+        os.replace(members_file, self.path(chat_id, ".jsonl"))
+        meta_file = self.path(chat_id, ".json")
+        with open(meta_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"scanned_at": scanned_at, "members": len(members)}, f)
+        os.replace(meta_file + ".tmp", meta_file)
+        self._rosters[chat_id] = ChatRoster(chat_id, members, scanned_at)
+
+
+class RosterScan:
+    """Resumable concurrent enumeration of one chat's members"""
+
+    def __init__(self, client: Client, chat_id: int, cache: MemberCache,
+                 threshold: int = 9000, concurrency: int = 4):
+        self.client = client
+        self.chat_id = chat_id
+        self.cache = cache
+        self.threshold = threshold
+        self.concurrency = max(1, concurrency)
+        self.members_file = cache.path(chat_id, ".scan.jsonl")
+        self.checkpoint_file = cache.path(chat_id, ".scan.json")
+        self.state = self._load_checkpoint()
+        self.members = read_members(self.members_file) if self.state["base_done"] else {}
+        self.task: asyncio.Task | None = None
+        self._exclude_user_id: int | None = None
+
+    def _load_checkpoint(self) -> dict:
+        state = {"base_done": False, "pending": [], "queries": 0}
+        try:
+            if os.path.exists(self.checkpoint_file):
+                with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                    state.update(json.load(f))
+        except Exception as e:
+            logger.warning(f"Failed to read member scan checkpoint {self.checkpoint_file}: {str(e)}")
+        return state
+
+    def _save_checkpoint(self):
+        try:
+            temp_file = self.checkpoint_file + ".tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False)
+            os.replace(temp_file, self.checkpoint_file)
+        except Exception as e:
+            logger.error(f"Failed to save member scan checkpoint: {str(e)}", exc_info=True)
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self) -> asyncio.Task:
+        """Start the scan as a background task"""
+        if not self.running:
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def _store(self, users: Iterable) -> int:
+        """Append users not seen yet to the scan file"""
+        fresh: List[CachedMember] = []
+        for user in users:
+            if user.is_bot or user.is_deleted or user.id == self._exclude_user_id or user.id in self.members:
+                continue
+            member = CachedMember.from_user(user)
+            self.members[member.id] = member
+            fresh.append(member)
+        if fresh:
+            with open(self.members_file, "a", encoding="utf-8") as f:
+                f.writelines(member.to_json() + "\n" for member in fresh)
+        return len(fresh)
+
+    async def _query(self, prefix: str) -> int:
+        """Run one search query to the end, storing members as pages arrive"""
+        while True:
+            count = 0
+            page = []
+            try:
+                async for member in self.client.get_chat_members(self.chat_id, query=prefix):
+                    count += 1
+                    page.append(member.user)
+                    if len(page) >= 200:
+                        self._store(page)
+                        page = []
+                self._store(page)
+                return count
+            except FloodWait as e:
+                logger.warning(f"Member scan in chat {self.chat_id}: FloodWait {e.value}s on '{prefix}'")
+                self._store(page)
+                await asyncio.sleep(e.value)
+
+    async def _run_query(self, prefix: str) -> int | None:
+        """
+        Run one query through the limiter, retrying while its queue is full.
+
+        Returns:
+            Member count of the query, or None if the limiter is shutting down
+        """
+        attempt = 0
+        while True:
+            count = await run_limited(
+                "member_scan",
+                self.chat_id,
+                lambda: self._query(prefix),
+                policy="queue",
+                max_per_chat=self.concurrency,
+            )
+            if count is not None or get_limiter().closing:
+                return count
+            # Exponential backoff with equal jitter, so rejected scans do not retry in lockstep
+            delay = min(REJECT_RETRY_MAX_DELAY, REJECT_RETRY_BASE_DELAY * (2 ** attempt))
+            attempt += 1
+            logger.debug(f"Member scan in chat {self.chat_id}: '{prefix}' rejected, retrying in {delay:.0f}s")
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+
+    async def run(self):
+        """Plain listing, then prefix queries until no truncated prefix is left"""
+        started = time.monotonic()
+        try:
+            self._exclude_user_id = (await self.client.get_me()).id
+
+            if not self.state["base_done"]:
+                # Start from an empty file: the previous scan might have died before its checkpoint
+                open(self.members_file, "w").close()
+                self.members = {}
+                count = await self._run_query("")
+                if count is None:
+                    # Shutting down: the scan restarts from the plain listing next time
+                    self._save_checkpoint()
+                    logger.info(f"Member scan in chat {self.chat_id} paused before the plain listing")
+                    return
+                self.state["base_done"] = True
+                self.state["queries"] += 1
+                self.state["pending"] = list(PREFIX_ALPHABET) if count >= self.threshold else []
+                self._save_checkpoint()
+                logger.info(
+                    f"Member scan in chat {self.chat_id}: plain listing returned {count}"
+                    + (", fanning out prefix queries" if self.state["pending"] else "")
+                )
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for prefix in self.state["pending"]:
+                queue.put_nowait(prefix)
+            # Pending = queued + in flight, so an interruption loses no prefix
+            pending = list(self.state["pending"])
+            stopped = False
+
+            async def worker():
+                nonlocal stopped
+                while not stopped:
+                    try:
+                        prefix = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    count = await self._run_query(prefix)
+                    if count is None:
+                        # Limiter is shutting down: keep the checkpoint for later
+                        stopped = True
+                        return
+                    if count >= self.threshold and len(prefix) < MAX_PREFIX_LENGTH:
+                        children = [prefix + char for char in PREFIX_ALPHABET]
+                        pending.extend(children)
+                        for child in children:
+                            queue.put_nowait(child)
+                    pending.remove(prefix)
+                    self.state["pending"] = pending
+                    self.state["queries"] += 1
+                    self._save_checkpoint()
+
+            # Workers that found the queue empty may exit while others still add children
+            while not queue.empty() and not stopped:
+                await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            if stopped:
+                logger.info(f"Member scan in chat {self.chat_id} paused with {len(pending)} prefixes left")
+                return
+
+            self.cache.commit(self.chat_id, self.members_file, self.members)
+            os.remove(self.checkpoint_file)
+            logger.info(
+                f"Member scan in chat {self.chat_id} finished: {len(self.members)} members, "
+                f"{self.state['queries']} queries, {time.monotonic() - started:.1f}s"
+            )
+        except asyncio.CancelledError:
+            logger.info(f"Member scan in chat {self.chat_id} interrupted, {len(self.state['pending'])} prefixes left")
+            raise
+        except Exception as e:
+            logger.error(f"Member scan failed in chat {self.chat_id}: {str(e)}", exc_info=True)
+
+
+def start_roster_scan(client: Client, chat_id: int) -> RosterScan:
+    """Start (or resume from its checkpoint) a background scan of the chat, unless one is running"""
+    scan = _scans.get(chat_id)
+    if scan is None or not scan.running:
+        settings = get_settings()
+        scan = RosterScan(
+            client,
+            chat_id,
+            get_member_cache(),
+            threshold=settings.member_scan_threshold,
+            concurrency=settings.member_scan_concurrency,
+        )
+        _scans[chat_id] = scan
+        scan.start()
+        logger.info(f"Member scan started in chat {chat_id}")
+    return scan
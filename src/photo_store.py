@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+History of chat photos applied by /repic, for /unrepic.
+
+The uploaded JPEG bytes are kept in a content-addressed blob store
+(data/chat_photos/blobs/<ab>/<sha256>.jpg), so the same picture set in several
+chats or several times is stored once. Each chat has an append-only history
+file data/chat_photos/<chat_id>.jsonl, one entry per applied photo:
+
+    {"sha256": ..., "timestamp": ..., "changed_by": ..., "photo_ids": [...]}
+
+photo_ids are the file_unique_ids known to show that photo (see chat_state).
+
+Retention: a chat keeps its last PHOTO_HISTORY_DEPTH entries, and while the
+blobs take more than PHOTO_HISTORY_MAX_MB the oldest entries across all chats
+are dropped (a chat's latest entry, its current photo, is never dropped).
+Blobs no entry refers to any more are deleted.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from config import get_settings, now_in_app_timezone
+
+logger = logging.getLogger(__name__)
+
+# Global instance
+_instance = None
+
+
+def get_photo_store() -> "PhotoStore":
+    """Get the global PhotoStore instance (created on first use)"""
+    global _instance
+    if _instance is None:
+        settings = get_settings()
+        _instance = PhotoStore(
+            data_dir=settings.session_path,
+            max_bytes=settings.photo_history_max_mb * 1024 * 1024,
+            depth=settings.photo_history_depth,
+        )
+    return _instance
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PhotoStore:
+    """Per-chat photo histories over a deduplicated blob store"""
+
+    def __init__(self, data_dir: str = "data", max_bytes: int = 100 * 1024 * 1024, depth: int = 20):
+        self.root = os.path.join(data_dir, "chat_photos")
+        self.blob_dir = os.path.join(self.root, "blobs")
+        self.max_bytes = max_bytes
+        self.depth = max(1, depth)
+        self._histories: Dict[int, List[dict]] = {}
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._load()
+
+    def _history_file(self, chat_id: int) -> str:
+        return os.path.join(self.root, f"{chat_id}.jsonl")
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}.jpg")
+
+    def _load(self):
+        """Load every chat's history (retention needs all of them)"""
+        for name in os.listdir(self.root):
+            stem, ext = os.path.splitext(name)
+            if ext != ".jsonl" or not stem.lstrip("-").isdigit():
+                continue
+            entries = []
+            with open(os.path.join(self.root, name), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # Torn last line of an interrupted append
+                        continue
+            self._histories[int(stem)] = entries
+        if self._histories:
+            logger.info(f"Photo history loaded for {len(self._histories)} chats")
+
+    def _rewrite(self, chat_id: int):
+        path = self._history_file(chat_id)
+        temp_file = path + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            for entry in self._histories.get(chat_id, []):
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_file, path)
+
+    def history(self, chat_id: int) -> List[dict]:
+        """Entries of a chat, oldest first; the last one is the current photo"""
+        return list(self._histories.get(chat_id, []))
+
+    def add(self, chat_id: int, path: str, changed_by: str, photo_ids: Iterable[str | None] = ()) -> str:
+        """
+        Record a photo that was just applied to the chat.
+
+        Returns:
+            sha256 of the photo
+        """
+        digest = file_digest(path)
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            shutil.copyfile(path, blob + ".tmp")
+            os.replace(blob + ".tmp", blob)
+
+        entry = {
+            "sha256": digest,
+            "timestamp": now_in_app_timezone().isoformat(),
+            "changed_by": changed_by,
+            "photo_ids": sorted({photo_id for photo_id in photo_ids if photo_id}),
+        }
+        entries = self._histories.setdefault(chat_id, [])
+        entries.append(entry)
+        if len(entries) > self.depth:
+            dropped = entries[:-self.depth]
+            del entries[:-self.depth]
+            self._rewrite(chat_id)
+            self._collect_garbage(item["sha256"] for item in dropped)
+        else:
+            with open(self._history_file(chat_id), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        self._enforce_size_limit()
+        logger.info(f"Photo {digest[:12]} recorded in history of chat {chat_id} ({len(entries)} entries)")
+        return digest
+
+    def restore_target(self, chat_id: int, current_ids: frozenset[str] | None = None) -> dict | None:
+        """
+        Entry /unrepic should restore.
+
+        Normally the one before the current photo. If the chat photo is known
+        to have been changed outside the bot since our last /repic, our last
+        photo itself.
+
+        Args:
+            current_ids: file_unique_ids of the current chat photo, None if unknown
+        """
+        entries = self._histories.get(chat_id, [])
+        if not entries:
+            return None
+        if current_ids is not None and not current_ids.intersection(entries[-1]["photo_ids"]):
+            return entries[-1]
+        return entries[-2] if len(entries) > 1 else None
+
+    def rollback(self, chat_id: int, entry: dict, photo_ids: Iterable[str | None] = ()):
+        """Make a restored entry the current photo again, dropping the entries after it"""
+        entries = self._histories.get(chat_id, [])
+        index = next(i for i, item in enumerate(entries) if item is entry)
+        dropped = entries[index + 1:]
+        del entries[index + 1:]
+        entry["photo_ids"] = sorted(set(entry["photo_ids"]) | {photo_id for photo_id in photo_ids if photo_id})
+        self._rewrite(chat_id)
+        self._collect_garbage(item["sha256"] for item in dropped)
+
+    def _referenced(self) -> set[str]:
+        return {entry["sha256"] for entries in self._histories.values() for entry in entries}
+
+    def _collect_garbage(self, digests: Iterable[str]):
+        """Delete blobs of the given digests that no entry refers to any more"""
+        referenced = self._referenced()
+        for digest in set(digests) - referenced:
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _blob_sizes(self) -> Dict[str, int]:
+        sizes = {}
+        for directory, _, files in os.walk(self.blob_dir):
+            for name in files:
+                if name.endswith(".jpg"):
+                    sizes[name[:-4]] = os.path.getsize(os.path.join(directory, name))
+        return sizes
+
+    def _enforce_size_limit(self):
+        sizes = self._blob_sizes()
+        total = sum(sizes.values())
+        dropped = 0
+        while total > self.max_bytes:
+            # Oldest entry that is not a chat's current photo
+            candidates = [
+                (datetime.fromisoformat(entries[0]["timestamp"]), chat_id)
+                for chat_id, entries in self._histories.items()
+                if len(entries) > 1
+            ]
+            if not candidates:
+                break
+            _, chat_id = min(candidates)
+            entry = self._histories[chat_id].pop(0)
+            self._rewrite(chat_id)
+            dropped += 1
+            if entry["sha256"] not in self._referenced():
+                total -= sizes.pop(entry["sha256"], 0)
+                self._collect_garbage([entry["sha256"]])
+        if dropped:
+            logger.info(f"Photo history over {self.max_bytes} bytes: dropped {dropped} oldest entries")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pidor Stats
+Журнал победителей "пидора дня" по чатам и счётчики для /pidorstats.
+
+Каждый день в каждом чате записывается один победитель (pidor_winners.csv
+в каталоге данных). При старте журнал читается один раз, дальше счётчики
+по периодам ("all", "2026", "2026-10") обновляются инкрементально, так что
+таблица лидеров берётся из готового индекса, а не пересчитывается по дням.
+"""
+
+import csv
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, List, Tuple
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CSV_HEADER = ["date", "chat_id", "user_id", "display_name"]
+
+# Global instance
+_instance = None
+
+
+def get_pidor_stats() -> "PidorStats":
+    """Get the global PidorStats instance (created on first use)"""
+    global _instance
+    if _instance is None:
+        _instance = PidorStats(data_dir=get_settings().session_path)
+    return _instance
+
+
+def period_keys(day: date) -> Tuple[str, str, str]:
+    """Ключи периодов, в которые попадает день: всё время, год, месяц"""
+    return "all", f"{day.year:04d}", f"{day.year:04d}-{day.month:02d}"
+
+
+class PidorStats:
+    """Persisted per-chat daily winner log with pre-aggregated counters"""
+
+    def __init__(self, data_dir: str = "data"):
+        self.data_dir = data_dir
+        self.csv_file = os.path.join(data_dir, "pidor_winners.csv")
+        # chat_id -> period key -> user_id -> wins
+        self._counts: Dict[int, Dict[str, Counter]] = defaultdict(lambda: defaultdict(Counter))
+        # chat_id -> day -> user_id of that day's winner
+        self._days: Dict[int, Dict[date, int]] = defaultdict(dict)
+        # (chat_id, user_id) -> last known display name
+        self._names: Dict[Tuple[int, int], str] = {}
+        self._load()
+
+    def _load(self):
+        """Build counters from the winner log (once, at startup)"""
+        try:
+            os.makedirs(self.data_dir, exist_ok=True)
+            if not os.path.exists(self.csv_file):
+                with open(self.csv_file, "w", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerow(CSV_HEADER)
+                logger.info(f"Created new CSV file: {self.csv_file}")
+                return
+
+            rows = 0
+            with open(self.csv_file, "r", newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    self._apply(
+                        date.fromisoformat(row["date"]),
+                        int(row["chat_id"]),
+                        int(row["user_id"]),
+                        row["display_name"],
+                    )
+                    rows += 1
+            logger.info(f"Pidor stats loaded: {rows} daily winners")
+        except Exception as e:
+            logger.error(f"Failed to load pidor stats: {str(e)}", exc_info=True)
+
+    def _apply(self, day: date, chat_id: int, user_id: int, display_name: str) -> bool:
+        if day in self._days[chat_id]:
+            return False
+        self._days[chat_id][day] = user_id
+        for key in period_keys(day):
+            self._counts[chat_id][key][user_id] += 1
+        self._names[(chat_id, user_id)] = display_name
+        return True
+
+    def record_winner(self, chat_id: int, day: date, user_id: int, display_name: str):
+        """
+        Записать победителя дня, если для этого чата и дня его ещё нет
+
+        Args:
+            chat_id: ID чата
+            day: дата в часовом поясе приложения
+            user_id: Telegram user ID победителя
+            display_name: имя для таблицы лидеров
+        """
+        if not self._apply(day, chat_id, user_id, display_name):
+            return
+        try:
+            with open(self.csv_file, "a", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow([day.isoformat(), chat_id, user_id, display_name])
+        except Exception as e:
+            logger.error(f"Failed to write pidor winner to CSV: {str(e)}", exc_info=True)
+
+    def winner(self, chat_id: int, day: date) -> Tuple[int, str] | None:
+        """(user_id, имя) победителя чата за день, если он уже записан"""
+        user_id = self._days.get(chat_id, {}).get(day)
+        if user_id is None:
+            return None
+        return user_id, self._names.get((chat_id, user_id), f"id:{user_id}")
+
+    def active_chats(self, since: date) -> List[int]:
+        """Чаты, где победитель выбирался начиная с `since`"""
+        return [chat_id for chat_id, days in self._days.items() if days and max(days) >= since]
+
+    def leaderboard(self, chat_id: int, period: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """
+        Таблица лидеров чата за период
+
+        Args:
+            chat_id: ID чата
+            period: ключ периода из period_keys() ("all", "2026" или "2026-10")
+            limit: сколько мест вернуть
+
+        Returns:
+            Список (имя, количество побед), от большего к меньшему
+        """
+        counts = self._counts.get(chat_id, {}).get(period)
+        if not counts:
+            return []
+        return [
+            (self._names.get((chat_id, user_id), f"id:{user_id}"), wins)
+            for user_id, wins in counts.most_common(limit)
+        ]
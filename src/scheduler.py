@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Central timer service for delayed and daily jobs.
+
+Handlers hand work that has to happen later (a delayed follow-up message, a
+nightly cleanup) to the scheduler instead of sleeping inside the handler, so
+the handler returns at once and does not hold a limiter slot while waiting.
+
+- call_later(delay, factory, name) — run once after `delay` seconds
+- run_daily(at, factory, name)     — run every day at `at` in the app timezone
+
+Jobs are identified by name; scheduling a name that is already pending
+replaces it. factory() may return an awaitable, which runs as a task; errors
+are logged, never raised. On shutdown drain() runs pending one-shot jobs
+right away (so a delayed message is not lost) and cancels daily ones.
+"""
+
+import asyncio
+import inspect
+import itertools
+import logging
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import Any, Callable, Dict, Set
+
+from config import now_in_app_timezone
+
+logger = logging.getLogger(__name__)
+
+# Global instance
+_instance = None
+
+_job_ids = itertools.count(1)
+
+
+def get_scheduler() -> "Scheduler":
+    """Get the global Scheduler instance (created on first use)"""
+    global _instance
+    if _instance is None:
+        _instance = Scheduler()
+    return _instance
+
+
+def seconds_until(at: dt_time, now: datetime | None = None) -> float:
+    """Seconds until the next `at` wall-clock time in the app timezone"""
+    now = now or now_in_app_timezone()
+    target = datetime.combine(now.date(), at, tzinfo=now.tzinfo)
+    if target <= now:
+        target = datetime.combine(now.date() + timedelta(days=1), at, tzinfo=now.tzinfo)
+    # Via timestamps: subtracting aware datetimes with the same tzinfo ignores DST shifts
+    return max(0.0, target.timestamp() - now.timestamp())
+
+
+def next_daily_run(at: dt_time, now: datetime, after: datetime | None = None) -> datetime:
+    """
+    Next `at` wall-clock time after `now`, and on a later day than `after`.
+
+    `after` is the run that just fired: the loop's timers may fire slightly
+    early, and measuring from "now" alone would then schedule the same day's
+    run again a few milliseconds later.
+    """
+    today_run = datetime.combine(now.date(), at, tzinfo=now.tzinfo)
+    day = now.date() if today_run > now else now.date() + timedelta(days=1)
+    if after is not None and day <= after.date():
+        day = after.date() + timedelta(days=1)
+    return datetime.combine(day, at, tzinfo=now.tzinfo)
+
+
+class Scheduler:
+    """One-shot and daily jobs on top of the event loop's timer heap"""
+
+    def __init__(self, clock: Callable[[], datetime] = now_in_app_timezone):
+        self.clock = clock
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._oneshots: Dict[str, Callable[[], Any]] = {}
+        self._daily: Dict[str, tuple[dt_time, Callable[[], Any]]] = {}
+        # Daily job name -> wall-clock time its timer is armed for
+        self._targets: Dict[str, datetime] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+
+    def call_later(self, delay: float, factory: Callable[[], Any], name: str | None = None) -> str:
+        """
+        Run factory() once after `delay` seconds.
+
+        Returns:
+            Job name (generated if not given)
+        """
+        name = name or f"job-{next(_job_ids)}"
+        self.cancel(name)
+        if self._closing:
+            # Nobody will wait for a timer any more: run it now
+            self._spawn(name, factory)
+            return name
+        self._oneshots[name] = factory
+        self._timers[name] = asyncio.get_running_loop().call_later(max(0.0, delay), self._fire_oneshot, name)
+        return name
+
+    def run_daily(self, at: dt_time, factory: Callable[[], Any], name: str) -> str:
+        """Run factory() every day at `at` (app timezone)"""
+        self.cancel(name)
+        self._daily[name] = (at, factory)
+        self._arm_daily(name)
+        logger.info(f"Daily job '{name}' scheduled at {at.isoformat()}")
+        return name
+
+    def cancel(self, name: str) -> bool:
+        """Cancel a pending job; True if there was one"""
+        handle = self._timers.pop(name, None)
+        self._oneshots.pop(name, None)
+        self._daily.pop(name, None)
+        self._targets.pop(name, None)
+        if handle is not None:
+            handle.cancel()
+        return handle is not None
+
+    def is_pending(self, name: str) -> bool:
+        return name in self._timers
+
+    def next_run(self, name: str) -> datetime | None:
+        """Wall-clock time a daily job is armed for, None if it is not armed"""
+        return self._targets.get(name)
+
+    def _arm_daily(self, name: str, after: datetime | None = None):
+        at, _ = self._daily[name]
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Registered outside the event loop (tooling): start() arms it later
+            return
+        now = self.clock()
+        target = next_daily_run(at, now, after)
+        self._targets[name] = target
+        self._timers[name] = loop.call_later(
+            max(0.0, target.timestamp() - now.timestamp()), self._fire_daily, name
+        )
+
+    def start(self):
+        """Arm daily jobs that were registered before the event loop was running"""
+        for name in self._daily:
+            if name not in self._timers:
+                self._arm_daily(name)
+
+    def _fire_oneshot(self, name: str):
+        self._timers.pop(name, None)
+        factory = self._oneshots.pop(name, None)
+        if factory is not None:
+            self._spawn(name, factory)
+
+    def _fire_daily(self, name: str):
+        self._timers.pop(name, None)
+        if name not in self._daily:
+            return
+        _, factory = self._daily[name]
+        # Re-arm first: the next run does not depend on this one finishing.
+        # Counted from the target, not from now: a timer that fired a little
+        # early must not run the same day's job twice
+        self._arm_daily(name, after=self._targets.get(name))
+        self._spawn(name, factory)
+
+    def _spawn(self, name: str, factory: Callable[[], Any]):
+        started = time.monotonic()
+        try:
+            result = factory()
+        except Exception as e:
+            logger.error(f"Scheduled job '{name}' failed: {str(e)}", exc_info=True)
+            return
+        if not inspect.isawaitable(result):
+            logger.debug(f"Scheduled job '{name}' done in {(time.monotonic() - started) * 1000:.1f} ms")
+            return
+
+        task = asyncio.ensure_future(result)
+        self._tasks.add(task)
+
+        def _done(task: asyncio.Task):
+            self._tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Scheduled job '{name}' failed: {str(task.exception())}", exc_info=task.exception())
+
+        task.add_done_callback(_done)
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Run pending one-shot jobs now, cancel daily ones and wait for running jobs.
+
+        Returns:
+            True if everything finished in time, False if something was cancelled
+        """
+        self._closing = True
+        oneshots = list(self._oneshots.items())
+        for name in list(self._timers):
+            self.cancel(name)
+        for name, factory in oneshots:
+            self._spawn(name, factory)
+
+        if not self._tasks:
+            return True
+        logger.info(f"Waiting for {len(self._tasks)} scheduled jobs (up to {timeout}s)")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} scheduled jobs that missed the shutdown deadline")
+            await asyncio.gather(*pending, return_exceptions=True)
+        return not pending
@@ -4,7 +4,9 @@
 import logging
 import os
 import asyncio
+import random
 import signal
+import time
 
 from pyrogram import Client
 from pyrogram.handlers import DisconnectHandler
@@ -18,20 +20,27 @@ class TelegramClient:
         self._ensure_session_directory()
         self.client = Client(
             name="chat_manager_bot",
-            api_id=settings["tg_api_id"],
-            api_hash=settings["tg_api_hash"],
-            workdir=settings["session_path"],
+            api_id=settings.tg_api_id,
+            api_hash=settings.tg_api_hash,
+            workdir=settings.session_path,
         )
         self.disconnect_count = 0
-        self.max_disconnects = 3
+        self.max_reconnect_attempts = settings.reconnect_max_attempts
+        self.reconnect_base_delay = settings.reconnect_base_delay
+        self.reconnect_max_delay = settings.reconnect_max_delay
+        self.stable_period = settings.reconnect_stable_period
+        self._last_disconnect_at = 0.0
+        self._reconnect_task = None
+        self._reconnecting = False
+        self._stopping = False
         self._setup_connection_handlers()
 
     def _ensure_session_directory(self):
         try:
-            os.makedirs(settings["session_path"], exist_ok=True)
-            logger.debug(f'Session directory created/verified: {settings["session_path"]}')
+            os.makedirs(settings.session_path, exist_ok=True)
+            logger.debug(f'Session directory created/verified: {settings.session_path}')
         except Exception as e:
-            logger.error(f'Failed to create session directory {settings["session_path"]}: {str(e)}')
+            logger.error(f'Failed to create session directory {settings.session_path}: {str(e)}')
             raise
 
     def _setup_connection_handlers(self):
@@ -39,14 +48,95 @@ class TelegramClient:
         self.client.add_handler(DisconnectHandler(self._on_disconnect))
         logger.info("connection_handlers: connection handlers set up")
 
-    async def _on_disconnect(self, _client, _session):
+    async def _on_disconnect(self, _client, _session=None):
         """Handles disconnection from Telegram servers"""
+        if self._stopping or self._reconnecting:
+            # Our own stop()/restart() also fires the disconnect handler
+            return
+
+        now = time.monotonic()
+        if self._last_disconnect_at and now - self._last_disconnect_at > self.stable_period:
+            # Connection was stable long enough, previous blips don't count anymore
+            self.disconnect_count = 0
+        self._last_disconnect_at = now
         self.disconnect_count += 1
         logger.warning(f"connection_handler: connection lost (#{self.disconnect_count})")
-        
-        if self.disconnect_count >= self.max_disconnects:
-            logger.critical(f"connection_handler: reached disconnect limit ({self.max_disconnects})")
-            self._restart_app()
+
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with equal jitter (random in [delay/2, delay]), capped at reconnect_max_delay"""
+        delay = min(self.reconnect_max_delay, self.reconnect_base_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    async def _is_alive(self) -> bool:
+        """Check the connection with a cheap API call"""
+        try:
+            await asyncio.wait_for(self.client.get_me(), timeout=self.reconnect_max_delay)
+            return True
+        except Exception as e:
+            logger.debug(f"connection_handler: liveness check failed: {str(e)}")
+            return False
+
+    async def _reconnect_loop(self):
+        """
+        Wait for the connection to come back, reconnecting in-process if needed.
+
+        Pyrogram restarts its session on its own after most network errors, so
+        first we just give it time and probe with get_me(). Only if the probe
+        keeps failing the client is restarted in-process; module-level caches
+        (member lists, announce state, title monitor) survive because the
+        process keeps running. Full process restart stays as a last resort.
+        """
+        for attempt in range(self.max_reconnect_attempts):
+            if self._stopping:
+                return
+            delay = self._backoff_delay(attempt)
+            logger.info(
+                f"connection_handler: reconnect attempt {attempt + 1}/{self.max_reconnect_attempts} "
+                f"in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+            if self._stopping:
+                return
+
+            if await self._is_alive():
+                logger.info("connection_handler: connection restored")
+                return
+
+            try:
+                await self._restart_client()
+            except Exception as e:
+                logger.warning(f"connection_handler: in-process restart failed: {str(e)}")
+                continue
+
+            if await self._is_alive():
+                logger.info("connection_handler: connection restored after client restart")
+                return
+
+        logger.critical(
+            f"connection_handler: could not reconnect after {self.max_reconnect_attempts} attempts"
+        )
+        self._restart_app()
+
+    async def _restart_client(self):
+        """Restart the pyrogram client in-process keeping registered handlers"""
+        # Dispatcher.stop() clears registered handlers, remember them to restore after start
+        groups = {group: list(handlers) for group, handlers in self.client.dispatcher.groups.items()}
+        self._reconnecting = True
+        try:
+            if self.client.is_connected:
+                await self.client.stop()
+            await self.client.start()
+        finally:
+            self._reconnecting = False
+
+        if not self.client.dispatcher.groups:
+            for group, handlers in groups.items():
+                for handler in handlers:
+                    self.client.add_handler(handler, group)
+        logger.info("connection_handler: client restarted in-process")
 
     async def start(self):
         try:
@@ -73,6 +163,9 @@ class TelegramClient:
             os._exit(1)
 
     async def stop(self):
+        self._stopping = True
+        if self._reconnect_task and not self._reconnect_task.done():
+            self._reconnect_task.cancel()
         if self.client.is_connected:
             await self.client.stop()
             logger.info("Telegram client disconnected")
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental export of the title history for offline analytics.
+
+Every run writes one segment with the records appended to the per-chat
+partitions (title_history/<chat_id>.csv) and the legacy chat_title_changes.csv
+since the previous run, and advances the watermark: the byte offset and row
+count reached in each file, plus the file's inode to notice a rewrite.
+Partitions are append-only, so records added by /backfill are exported too
+even though their timestamps are old.
+
+Segments are Parquet (zstd) when pyarrow is installed, otherwise gzip JSON
+Lines, with the columns chat_id, timestamp, new_title, changed_by_username,
+title_source_username, message_id. A legacy record has an empty chat_id.
+
+Usage:
+    python src/title_export.py [--out DIR] [--format auto|parquet|jsonl] [--data-dir DIR]
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import get_settings, setup_logging
+from handlers.title_monitor import CSV_HEADER
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["chat_id"] + CSV_HEADER
+WATERMARK_FILE = "watermark.json"
+
+
+def load_watermark(out_dir: str) -> dict:
+    """
+    Export state: {"segment": last segment number, "files": {name: position}}.
+
+    A position is {"offset": bytes exported, "rows": data rows exported,
+    "inode": inode of the file}; names are relative to the data dir. Files of
+    the older flat {name: offset} format get rows and inode filled in on the
+    next read.
+    """
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {"segment": 0, "files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "files" not in data:
+        data = {
+            "segment": 0,
+            "files": {name: {"offset": offset, "rows": None, "inode": None} for name, offset in data.items()},
+        }
+    return data
+
+
+def save_watermark(out_dir: str, watermark: dict):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    temp_file = path + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(watermark, f, indent=2, sort_keys=True)
+    os.replace(temp_file, path)
+
+
+def history_files(data_dir: str) -> list[tuple[str, int | None]]:
+    """(path relative to data_dir, chat id) of every title history file"""
+    files = []
+    if os.path.exists(os.path.join(data_dir, "chat_title_changes.csv")):
+        files.append(("chat_title_changes.csv", None))
+    partition_dir = os.path.join(data_dir, "title_history")
+    if os.path.isdir(partition_dir):
+        for name in sorted(os.listdir(partition_dir)):
+            stem, ext = os.path.splitext(name)
+            if ext == ".csv" and stem.lstrip("-").isdigit():
+                files.append((os.path.join("title_history", name), int(stem)))
+    return files
+
+
+def _parse_rows(data: bytes, skip_header: bool) -> list[dict]:
+    reader = csv.reader(io.StringIO(data.decode("utf-8"), newline=""))
+    if skip_header:
+        next(reader, None)
+    return [dict(zip(CSV_HEADER, row + [""] * (len(CSV_HEADER) - len(row)))) for row in reader if row]
+
+
+def read_new_rows(path: str, position: dict | None) -> tuple[list[dict], dict]:
+    """
+    Read complete CSV rows appended after the exported position.
+
+    If the file was replaced since the last run (the legacy header migration
+    rewrites it through a temp file, so the inode changes while the file
+    grows), the new file is read from the start and the rows already exported
+    are skipped by count: the migration keeps rows and their order.
+
+    Returns:
+        (rows, new position); a trailing partial line is left for the next run
+    """
+    position = dict(position or {"offset": 0, "rows": 0, "inode": None})
+    inode = os.stat(path).st_ino
+    size = os.path.getsize(path)
+
+    if position["rows"] is None:
+        # Watermark of the older format: count the rows behind the offset once
+        with open(path, "rb") as f:
+            position["rows"] = len(_parse_rows(f.read(position["offset"]), skip_header=True))
+    if position["inode"] is None:
+        position["inode"] = inode
+
+    skip = 0
+    if position["inode"] != inode:
+        logger.warning(f"{path} was rewritten since the last export, skipping {position['rows']} exported rows")
+        skip = position["rows"]
+        position.update(offset=0, rows=0, inode=inode)
+    elif size < position["offset"]:
+        logger.warning(f"{path} shrank below the watermark, exporting it from the start")
+        position.update(offset=0, rows=0)
+    if size == position["offset"]:
+        return [], position
+
+    offset = position["offset"]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    if end == 0:
+        return [], position
+
+    rows = _parse_rows(data[:end], skip_header=offset == 0)
+    position["offset"] = offset + end
+    position["rows"] += len(rows)
+    return rows[skip:], position
+
+
+def write_segment(records: list[dict], out_dir: str, fmt: str, number: int) -> tuple[str, int]:
+    """
+    Write one segment and return (its path, its number).
+
+    Names carry a sequence number after the time, and the finished file is
+    linked into place, which fails instead of overwriting: two exports in the
+    same second, or a lost watermark, never replace an existing segment.
+    """
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    extension = "parquet" if fmt == "parquet" else "jsonl.gz"
+    temp_file = os.path.join(out_dir, f"title_changes-{stamp}.{os.getpid()}.tmp")
+    if fmt == "parquet":
+        table = pa.table({column: [record[column] for record in records] for column in COLUMNS})
+        pq.write_table(table, temp_file, compression="zstd")
+    else:
+        with gzip.open(temp_file, "xt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    try:
+        while True:
+            path = os.path.join(out_dir, f"title_changes-{stamp}-{number:06d}.{extension}")
+            try:
+                os.link(temp_file, path)
+                return path, number
+            except FileExistsError:
+                number += 1
+    finally:
+        os.remove(temp_file)
+
+
+def export(data_dir: str, out_dir: str, fmt: str = "auto") -> tuple[str | None, int]:
+    """
+    Export title history records added since the last run.
+
+    Returns:
+        (segment path or None if there was nothing new, number of records)
+    """
+    if fmt == "auto":
+        fmt = "parquet" if pa is not None else "jsonl"
+    elif fmt == "parquet" and pa is None:
+        raise RuntimeError("pyarrow is not installed, use --format jsonl")
+
+    os.makedirs(out_dir, exist_ok=True)
+    watermark = load_watermark(out_dir)
+    files = watermark["files"]
+    records = []
+    for name, chat_id in history_files(data_dir):
+        rows, position = read_new_rows(os.path.join(data_dir, name), files.get(name))
+        for row in rows:
+            records.append({
+                "chat_id": chat_id,
+                "timestamp": row["timestamp"],
+                "new_title": row["new_title"],
+                "changed_by_username": row["changed_by_username"],
+                "title_source_username": row["title_source_username"],
+                "message_id": int(row["message_id"]) if row["message_id"] else None,
+            })
+        files[name] = position
+
+    if not records:
+        logger.info("Title export: nothing new since the last export")
+        return None, 0
+
+    # The segment is written before the watermark moves: a crash in between
+    # exports the same records again rather than losing them
+    path, watermark["segment"] = write_segment(records, out_dir, fmt, watermark["segment"] + 1)
+    save_watermark(out_dir, watermark)
+    logger.info(f"Title export: {len(records)} records written to {path}")
+    return path, len(records)
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=settings.session_path,
+                        help=f"bot data directory (default: {settings.session_path})")
+    parser.add_argument("--out", default=None, help="export directory (default: <data-dir>/export)")
+    parser.add_argument("--format", choices=["auto", "parquet", "jsonl"], default="auto",
+                        help="segment format; auto = parquet if pyarrow is installed (default: auto)")
+    args = parser.parse_args()
+
+    setup_logging(settings.log_level)
+    out_dir = args.out or os.path.join(args.data_dir, "export")
+    try:
+        path, count = export(args.data_dir, out_dir, args.format)
+    except Exception as e:
+        logger.error(f"Title export failed: {str(e)}", exc_info=True)
+        sys.exit(1)
+    print(path or "nothing to export")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Title Index
+In-memory search index over one chat's title history for /history filters.
+
+Records get a document id in insertion order. Titles are indexed by
+casefolded character trigrams, so a substring query only verifies the
+documents that contain all of its trigrams; usernames (who renamed and whose
+message became the title) map straight to their documents. Date ranges are
+answered by the caller with bisect over the timestamp-sorted history.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set
+
+DATE_RANGE_RE = re.compile(r"^(\d{4}-\d{2}(?:-\d{2})?)(?:\.\.(\d{4}-\d{2}(?:-\d{2})?))?$")
+
+
+@dataclass(frozen=True)
+class HistoryQuery:
+    """Фильтры /history; пустой запрос — вся история"""
+    text: str = ""
+    username: str = ""
+    since: str = ""
+    until: str = ""
+
+    def __bool__(self) -> bool:
+        return bool(self.text or self.username or self.since or self.until)
+
+    def __str__(self) -> str:
+        parts = []
+        if self.username:
+            parts.append(f"@{self.username}")
+        if self.since:
+            parts.append(self.since if self.since == self.until else f"{self.since}..{self.until}")
+        if self.text:
+            parts.append(self.text)
+        return " ".join(parts)
+
+    def matches_date(self, timestamp: str) -> bool:
+        return timestamp[:len(self.since)] >= self.since and timestamp[:len(self.until)] <= self.until
+
+
+def parse_history_query(args: Iterable[str]) -> HistoryQuery:
+    """
+    Разобрать аргументы /history
+
+    @user — переименования пользователя (или из его сообщений),
+    2024-03 / 2024-03-08 / 2024-01..2024-06-15 — период в часовом поясе приложения,
+    остальные слова — подстрока названия.
+    """
+    username = ""
+    since = until = ""
+    words = []
+    for arg in args:
+        date_range = DATE_RANGE_RE.match(arg)
+        if arg.startswith("@") and len(arg) > 1 and not username:
+            username = arg[1:].casefold()
+        elif date_range and not since:
+            since = date_range.group(1)
+            until = date_range.group(2) or since
+        else:
+            words.append(arg)
+    return HistoryQuery(text=" ".join(words).casefold(), username=username, since=since, until=until)
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TitleIndex:
+    """Trigram and username index over title history records of one chat"""
+
+    def __init__(self, records: Iterable[dict] = ()):
+        self.records: List[dict] = []
+        self._titles: List[str] = []
+        self._trigrams: Dict[str, Set[int]] = {}
+        self._users: Dict[str, Set[int]] = {}
+        for record in records:
+            self.add(record)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, record: dict):
+        doc_id = len(self.records)
+        title = (record.get('new_title') or '').casefold()
+        self.records.append(record)
+        self._titles.append(title)
+        for gram in trigrams(title):
+            self._trigrams.setdefault(gram, set()).add(doc_id)
+        for key in ('changed_by_username', 'title_source_username'):
+            username = (record.get(key) or '').lstrip('@').casefold()
+            if username:
+                self._users.setdefault(username, set()).add(doc_id)
+
+    def search(self, query: HistoryQuery) -> List[dict]:
+        """
+        Записи, подходящие под запрос, от новых к старым
+
+        Args:
+            query: фильтры; дата проверяется по префиксу timestamp
+        """
+        candidates: Set[int] | None = None
+
+        if query.username:
+            candidates = set(self._users.get(query.username, ()))
+
+        grams = trigrams(query.text)
+        if grams:
+            # Start from the rarest trigram so intersections stay small
+            for gram in sorted(grams, key=lambda g: len(self._trigrams.get(g, ()))):
+                postings = self._trigrams.get(gram, set())
+                candidates = set(postings) if candidates is None else candidates & postings
+                if not candidates:
+                    return []
+
+        doc_ids = range(len(self.records)) if candidates is None else candidates
+        found = [
+            self.records[doc_id]
+            for doc_id in doc_ids
+            if (not query.text or query.text in self._titles[doc_id])
+            and (not query.since or query.matches_date(self.records[doc_id]['timestamp']))
+        ]
+        found.sort(key=lambda x: x['timestamp'], reverse=True)
+        return found
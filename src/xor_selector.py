@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Deterministic XOR-nearest selection shared by pidor_watcher and uk_inline_watcher.
+
+Every value (day, user id, article) is mapped to a 64-bit key: the first
+8 bytes of sha256(str(value)) as a big-endian integer. This is exactly
+int(hexdigest[:16], 16), so winners are the same as with hex slicing, without
+building and parsing hex strings. The winner is the candidate whose key has
+the smallest XOR distance to the query key (Kademlia-style metric).
+"""
+
+import hashlib
+from datetime import date, datetime, time
+from typing import AsyncIterable, Callable, Generic, Iterable, TypeVar
+
+from config import get_app_timezone, now_in_app_timezone
+
+T = TypeVar("T")
+
+KEY_BITS = 64
+
+
+def digest_key(value) -> int:
+    """64-bit key of a value: first 8 bytes of sha256(str(value))"""
+    return int.from_bytes(hashlib.sha256(str(value).encode()).digest()[:8], "big")
+
+
+def get_day_key(day: date | None = None) -> int:
+    """Key of a day (default: today): digest_key of its app-timezone midnight unix timestamp"""
+    day = day or now_in_app_timezone().date()
+    midnight_local = datetime.combine(day, time(0), tzinfo=get_app_timezone())
+    return digest_key(int(midnight_local.timestamp()))
+
+
+def select_nearest(candidates: Iterable[T], query: int, key: Callable[[T], int]) -> tuple[T | None, int]:
+    """
+    Streaming XOR-nearest selection over any iterable.
+
+    Keeps only the current best candidate, so memory does not depend on the
+    number of candidates. On equal distances the first candidate wins.
+
+    Returns:
+        (best candidate or None if empty, number of candidates seen)
+    """
+    best = None
+    best_distance = None
+    count = 0
+    for candidate in candidates:
+        count += 1
+        distance = query ^ key(candidate)
+        if best_distance is None or distance < best_distance:
+            best = candidate
+            best_distance = distance
+    return best, count
+
+
+async def select_nearest_async(
+    candidates: AsyncIterable[T], query: int, key: Callable[[T], int]
+) -> tuple[T | None, int]:
+    """select_nearest() over an async iterable (e.g. client.get_chat_members)"""
+    best = None
+    best_distance = None
+    count = 0
+    async for candidate in candidates:
+        count += 1
+        distance = query ^ key(candidate)
+        if best_distance is None or distance < best_distance:
+            best = candidate
+            best_distance = distance
+    return best, count
+
+
+class XorIndex(Generic[T]):
+    """
+    Binary trie over 64-bit keys answering XOR-nearest queries in O(KEY_BITS).
+
+    Built once for a fixed candidate set (articles, cached member rosters);
+    for one-off sets use select_nearest() instead.
+    """
+
+    def __init__(self, items: Iterable[tuple[int, T]] = ()):
+        self._root: list = [None, None]
+        self._size = 0
+        for key, item in items:
+            self.add(key, item)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key: int, item: T):
+        """Insert a candidate; the first item inserted for a key wins ties"""
+        node = self._root
+        for shift in range(KEY_BITS - 1, 0, -1):
+            bit = (key >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None]
+            node = node[bit]
+        bit = key & 1
+        if node[bit] is None:
+            node[bit] = (key, item)
+            self._size += 1
+
+    def nearest(self, query: int) -> T | None:
+        """Candidate with the minimal query XOR key, or None if the index is empty"""
+        if not self._size:
+            return None
+        node = self._root
+        for shift in range(KEY_BITS - 1, -1, -1):
+            bit = (query >> shift) & 1
+            # Same bit gives 0 in this position of the XOR, so prefer it
+            node = node[bit] if node[bit] is not None else node[bit ^ 1]
+        return node[1]
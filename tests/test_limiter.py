@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Handler limiter: a busy chat must not stall the dispatcher for other chats.
+
+Run with: python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from limiter import HandlerLimiter  # noqa: E402
+
+DISPATCHER_WORKERS = 4
+BUSY_CHAT = -100
+OTHER_CHAT = -200
+
+
+def test_saturated_chat_does_not_block_other_chats():
+    async def scenario():
+        limiter = HandlerLimiter(max_concurrency=8, max_per_chat=1, policy="queue", queue_limit=32)
+        release = asyncio.Event()
+        other_done = asyncio.Event()
+
+        async def stuck():
+            # e.g. /repic sleeping on a FloodWait
+            await release.wait()
+
+        async def other():
+            other_done.set()
+
+        # Like pyrogram's Dispatcher: a few workers, each awaiting the callback inline
+        updates: asyncio.Queue = asyncio.Queue()
+        for _ in range(DISPATCHER_WORKERS * 3):
+            updates.put_nowait((BUSY_CHAT, stuck))
+        updates.put_nowait((OTHER_CHAT, other))
+
+        async def callback(chat_id, factory):
+            limiter.submit("repic_watcher", chat_id, factory)
+
+        async def worker():
+            while not updates.empty():
+                chat_id, factory = updates.get_nowait()
+                await callback(chat_id, factory)
+
+        workers = [asyncio.create_task(worker()) for _ in range(DISPATCHER_WORKERS)]
+        await asyncio.wait_for(other_done.wait(), timeout=2)
+
+        assert limiter.get_stats()["repic_watcher"]["running"] == 1
+        release.set()
+        await asyncio.gather(*workers)
+        assert await limiter.drain(timeout=2)
+
+    asyncio.run(scenario())
+
+
+def test_queued_invocation_is_rejected_after_drain():
+    async def scenario():
+        limiter = HandlerLimiter(max_concurrency=1, max_per_chat=1, policy="queue")
+        release = asyncio.Event()
+        started = []
+
+        async def job(label):
+            started.append(label)
+            await release.wait()
+
+        running = asyncio.create_task(limiter.run("rename_watcher", BUSY_CHAT, lambda: job("running")))
+        queued = asyncio.create_task(limiter.run("rename_watcher", BUSY_CHAT, lambda: job("queued")))
+        await asyncio.sleep(0.01)
+        assert started == ["running"]
+
+        drain = asyncio.create_task(limiter.drain(timeout=2))
+        await asyncio.sleep(0.01)
+        release.set()
+
+        assert await drain
+        await asyncio.gather(running, queued)
+        assert started == ["running"]
+        assert limiter.get_stats()["rename_watcher"]["rejected"] == 1
+
+    asyncio.run(scenario())
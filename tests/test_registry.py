@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Lazy handler stubs dispatch like eager registration.
+
+Run with: python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from pyrogram import ContinuePropagation
+from pyrogram.handlers import MessageHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from handlers.registry import HandlerSpec, LazyHandler  # noqa: E402
+
+
+class Update:
+    def continue_propagation(self):
+        raise ContinuePropagation
+
+
+def lazy_with(*callbacks) -> LazyHandler:
+    loader = LazyHandler(HandlerSpec("fake"), {})
+    # Already "imported": the module's collected handlers, in registration order
+    loader._handlers = [MessageHandler(callback) for callback in callbacks]
+    return loader
+
+
+def test_continue_propagation_reaches_sibling_handler():
+    calls = []
+
+    async def first(client, update):
+        calls.append("first")
+        raise ContinuePropagation
+
+    async def second(client, update):
+        calls.append("second")
+
+    async def third(client, update):
+        calls.append("third")
+
+    asyncio.run(lazy_with(first, second, third).dispatch(None, Update()))
+    # Like pyrogram within a group: stop at the first handler that does not pass the update on
+    assert calls == ["first", "second"]
+
+
+def test_update_passed_on_when_every_handler_passes_it_on():
+    async def passes(client, update):
+        raise ContinuePropagation
+
+    with pytest.raises(ContinuePropagation):
+        asyncio.run(lazy_with(passes, passes).dispatch(None, Update()))
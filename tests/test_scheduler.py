@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Daily jobs of the scheduler when the loop's timer fires slightly early.
+
+Run with: python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, time, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from scheduler import Scheduler, next_daily_run  # noqa: E402
+
+RUN_AT = time(23, 50)
+TODAY = datetime(2026, 10, 19, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    """Wall clock the test moves by hand"""
+
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+def test_next_daily_run_skips_day_that_already_ran():
+    target = datetime.combine(TODAY.date(), RUN_AT, tzinfo=timezone.utc)
+    early = target - timedelta(milliseconds=3)
+
+    assert next_daily_run(RUN_AT, early) == target
+    assert next_daily_run(RUN_AT, early, after=target) == target + timedelta(days=1)
+    # A late fire does not skip the next day either
+    assert next_daily_run(RUN_AT, target + timedelta(minutes=5), after=target) == target + timedelta(days=1)
+
+
+def test_daily_job_fired_early_runs_once():
+    async def scenario():
+        target = datetime.combine(TODAY.date(), RUN_AT, tzinfo=timezone.utc)
+        clock = FakeClock(target - timedelta(hours=1))
+        scheduler = Scheduler(clock=clock)
+        runs = []
+        scheduler.run_daily(RUN_AT, lambda: runs.append(clock.now), name="job")
+        assert scheduler.next_run("job") == target
+
+        # The timer fires 3 ms before the target, as uvloop timers sometimes do
+        clock.now = target - timedelta(milliseconds=3)
+        scheduler._fire_daily("job")
+
+        assert len(runs) == 1
+        assert scheduler.next_run("job") == target + timedelta(days=1)
+        loop = asyncio.get_running_loop()
+        assert scheduler._timers["job"].when() - loop.time() > 86000
+        await scheduler.drain(timeout=1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Backfill of title history over legacy rows that have no message_id.
+
+Run with: python -m pytest tests
+"""
+
+import csv
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from handlers.title_monitor import TitleMonitor  # noqa: E402
+
+CHAT_ID = -1001234567890
+CHANGED_AT = datetime(2025, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def write_legacy_csv(data_dir, rows):
+    """Pre-partition chat_title_changes.csv in the old 3-column format"""
+    with open(os.path.join(data_dir, "chat_title_changes.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "new_title", "changed_by_username"])
+        writer.writerows(rows)
+
+
+def title_message(message_id, title, username, date):
+    """NEW_CHAT_TITLE service message as seen by the backfill"""
+    return SimpleNamespace(
+        id=message_id,
+        date=date,
+        new_chat_title=title,
+        from_user=SimpleNamespace(username=username, is_bot=False, first_name=""),
+    )
+
+
+def backfill(monitor, messages):
+    return monitor.write_many(CHAT_ID, [TitleMonitor.record_from_message(msg) for msg in messages])
+
+
+def test_backfill_skips_legacy_row_moved_to_partition(tmp_path):
+    # Logged live a couple of seconds after the service message date
+    write_legacy_csv(tmp_path, [[(CHANGED_AT + timedelta(seconds=2)).isoformat(), "Old title", "alice"]])
+    monitor = TitleMonitor(data_dir=str(tmp_path), legacy_chat_id=CHAT_ID)
+
+    written = backfill(monitor, [
+        title_message(100, "Old title", "alice", CHANGED_AT),
+        title_message(101, "Newer title", "bob", CHANGED_AT + timedelta(hours=1)),
+    ])
+
+    assert written == 1
+    assert [record["new_title"] for record in monitor.get_history(CHAT_ID)] == ["Newer title", "Old title"]
+    # Running the backfill again writes nothing
+    assert backfill(monitor, [title_message(101, "Newer title", "bob", CHANGED_AT + timedelta(hours=1))]) == 0
+
+
+def test_backfill_skips_legacy_row_shown_in_every_chat(tmp_path):
+    write_legacy_csv(tmp_path, [[(CHANGED_AT + timedelta(seconds=2)).isoformat(), "Old title", "alice"]])
+    monitor = TitleMonitor(data_dir=str(tmp_path))
+
+    assert backfill(monitor, [title_message(100, "Old title", "alice", CHANGED_AT)]) == 0
+    assert monitor.count_history(CHAT_ID) == 1
+
+
+def test_backfill_keeps_same_title_outside_window(tmp_path):
+    write_legacy_csv(tmp_path, [[CHANGED_AT.isoformat(), "Old title", "alice"]])
+    monitor = TitleMonitor(data_dir=str(tmp_path), legacy_chat_id=CHAT_ID)
+
+    # The same title set again a day later is a separate change
+    assert backfill(monitor, [title_message(100, "Old title", "alice", CHANGED_AT + timedelta(days=1))]) == 1
+    assert monitor.count_history(CHAT_ID) == 2
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+XOR selectors against the original string-based selection.
+
+select_nearest, select_nearest_async and XorIndex.nearest (through
+pidor_watcher and uk_inline_watcher) must pick exactly what the original
+select_pidor / select_article_for_user picked: sha256 hex digests sliced to
+16 characters.
+
+Run with: python -m pytest tests
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("TG_API_ID", "1")
+os.environ.setdefault("TG_API_HASH", "test")
+
+from config import get_app_timezone  # noqa: E402
+from handlers import pidor_watcher, uk_inline_watcher  # noqa: E402
+from xor_selector import XorIndex, digest_key, get_day_key, select_nearest, select_nearest_async  # noqa: E402
+
+SIZES = (1, 2, 100, 1_000, 5_000)
+DAYS = [date(2025, 1, 1) + timedelta(days=i) for i in range(0, 70, 7)]
+
+
+# --- Original implementation --------------------------------------------------
+
+def ref_hash(value) -> str:
+    return hashlib.sha256(str(value).encode()).hexdigest()
+
+
+def ref_xor(hash_a: str, hash_b: str) -> int:
+    return int(hash_a[:16], 16) ^ int(hash_b[:16], 16)
+
+
+def ref_day_hash(day: date) -> str:
+    midnight_local = datetime.combine(day, time(0), tzinfo=get_app_timezone())
+    return ref_hash(int(midnight_local.timestamp()))
+
+
+def ref_select_pidor(members: list, day_hash: str):
+    if not members:
+        return None
+    return min(members, key=lambda member: ref_xor(day_hash, ref_hash(member.user.id)))
+
+
+def ref_select_article(user_id: int, day_hash: str) -> str:
+    seed = ref_xor(day_hash, ref_hash(user_id))
+    best_article = uk_inline_watcher.ARTICLES[0]
+    best_distance = 2**64 - 1
+    for article in uk_inline_watcher.ARTICLES:
+        dist = seed ^ int(hashlib.sha256(article.encode()).hexdigest()[:16], 16)
+        if dist < best_distance:
+            best_distance = dist
+            best_article = article
+    return best_article
+
+
+# --- Fixtures -------------------------------------------------------------------
+
+def make_member(user_id: int, is_bot: bool = False, is_deleted: bool = False):
+    return SimpleNamespace(user=SimpleNamespace(id=user_id, is_bot=is_bot, is_deleted=is_deleted))
+
+
+def make_members(count: int) -> list:
+    return [make_member(100_000_000 + i * 7919) for i in range(count)]
+
+
+class FakeClient:
+    """get_chat_members over a fixed member list"""
+
+    def __init__(self, members: list):
+        self.members = members
+
+    async def get_chat_members(self, chat_id: int):
+        for member in self.members:
+            yield member
+
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+
+def member_key(member) -> int:
+    return digest_key(member.user.id)
+
+
+# --- Tests ----------------------------------------------------------------------
+
+def test_day_key_matches_hex_digest():
+    for day in DAYS:
+        assert get_day_key(day) == int(ref_day_hash(day)[:16], 16)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_pidor_selectors_match_reference(size):
+    members = make_members(size)
+    index = XorIndex((member_key(member), member) for member in members)
+    for day in DAYS:
+        expected = ref_select_pidor(members, ref_day_hash(day)).user.id
+        day_key = get_day_key(day)
+
+        assert pidor_watcher.select_pidor(members, day_key).user.id == expected
+        assert select_nearest(members, day_key, key=member_key)[0].user.id == expected
+        winner, count = asyncio.run(select_nearest_async(aiter(members), day_key, key=member_key))
+        assert (winner.user.id, count) == (expected, size)
+        assert index.nearest(day_key).user.id == expected
+
+
+def test_empty_input():
+    day_key = get_day_key(DAYS[0])
+    assert pidor_watcher.select_pidor([], day_key) is None
+    assert select_nearest([], day_key, key=member_key) == (None, 0)
+    assert asyncio.run(select_nearest_async(aiter([]), day_key, key=member_key)) == (None, 0)
+    assert XorIndex().nearest(day_key) is None
+
+
+def test_streaming_excludes_bot_itself_and_other_bots():
+    members = make_members(50)
+    day = DAYS[0]
+    # The account itself is the member the selection would otherwise pick
+    own_id = ref_select_pidor(members, ref_day_hash(day)).user.id
+    others = [member for member in members if member.user.id != own_id]
+    client = FakeClient(members + [make_member(1, is_bot=True), make_member(2, is_deleted=True)])
+
+    winner, count = asyncio.run(pidor_watcher.select_pidor_streaming(client, -1, own_id, get_day_key(day)))
+
+    assert count == len(others)
+    assert winner.user.id == ref_select_pidor(others, ref_day_hash(day)).user.id
+    assert winner.user.id != own_id
+
+
+def test_single_member():
+    member = make_member(123)
+    for day in DAYS:
+        assert pidor_watcher.select_pidor([member], get_day_key(day)) is member
+
+
+def test_articles_match_reference():
+    for day in DAYS[:3]:
+        day_hash = ref_day_hash(day)
+        for user_id in range(300):
+            expected = ref_select_article(user_id, day_hash)
+            assert uk_inline_watcher.select_article_for_user(user_id, get_day_key(day)) == expected